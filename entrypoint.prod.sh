@@ -13,6 +13,8 @@ echo "✓ MySQL conectado"
 # Aplicar migraciones
 echo "Aplicando migraciones..."
 python manage.py migrate --noinput
+# Tabla de caché (solo si CACHE_BACKEND=db; con otros backends no hace nada)
+python manage.py createcachetable
 
 # Recolectar archivos estáticos
 echo "Recolectando archivos estáticos..."
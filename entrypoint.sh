@@ -38,6 +38,7 @@ wait_for_db
 echo -e "${YELLOW}Applying database migrations...${NC}"
 python manage.py makemigrations
 python manage.py migrate
+python manage.py createcachetable
 
 # Collect static files
 echo -e "${YELLOW}Collecting static files...${NC}"
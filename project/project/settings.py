@@ -128,6 +128,9 @@ if USE_S3:
         'AWS_S3_CUSTOM_DOMAIN',
         default=f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
     )
+    # S3 compatible local (MinIO...) para probar sin AWS, p.ej. http://localhost:9000
+    AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+    AWS_S3_MAX_POOL_CONNECTIONS = config('AWS_S3_MAX_POOL_CONNECTIONS', default=20, cast=int)
 
     # Parámetros S3
     AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
@@ -161,11 +164,104 @@ else:
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# --- Subidas grandes (opcional) ---
-FILE_UPLOAD_MAX_MEMORY_SIZE = 2**31 - 1
+# --- Caché ---
+# Sin servicios externos: memoria local por proceso (por defecto), fichero en disco
+# compartido entre procesos, o tabla en la base de datos (manage.py createcachetable)
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bodapitis',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(BASE_DIR, '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    },
+}
+CACHES = {
+    'default': {
+        **_CACHE_BACKENDS[CACHE_BACKEND],
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=1000, cast=int)},
+    }
+}
+# Respuestas de gallery/list/stats (ver wedding_gallery/cache.py). La clave lleva la
+# versión de la galería, así que el timeout solo sirve para liberar entradas viejas
+GALLERY_CACHE_ALIAS = 'default'
+GALLERY_CACHE_TIMEOUT = config('GALLERY_CACHE_TIMEOUT', default=60 * 60, cast=int)
+# Cache-Control de gallery/list/retrieve/stats: el navegador (o Caddy) puede guardar
+# la respuesta pero revalida siempre con ETag / If-None-Match (304 si no cambió nada)
+API_CACHE_CONTROL = {'public': True, 'max_age': 0, 'must_revalidate': True}
+
+# --- Notificaciones en tiempo real (SSE, requiere ASGI: ver wedding_gallery/events.py) ---
+# DatabasePollingBackend funciona con varios procesos; LocalBackend solo ve los cambios del propio proceso
+MEDIA_EVENTS_BACKEND = config('MEDIA_EVENTS_BACKEND', default='wedding_gallery.events.DatabasePollingBackend')
+MEDIA_EVENTS_POLL_SECONDS = config('MEDIA_EVENTS_POLL_SECONDS', default=2.0, cast=float)
+MEDIA_EVENTS_HEARTBEAT_SECONDS = 20
+MEDIA_EVENTS_QUEUE_SIZE = 100      # eventos pendientes por conexión antes de cortarla
+MEDIA_EVENTS_RETRY_MS = 5000
+
+# --- Subidas grandes ---
+# MediaUploadHandler hashea y detecta tipo/dimensiones mientras recibe, y vuelca
+# a disco todo lo que pase de FILE_UPLOAD_MAX_MEMORY_SIZE (memoria acotada por subida)
+FILE_UPLOAD_HANDLERS = ['wedding_gallery.uploadhandlers.MediaUploadHandler']
+FILE_UPLOAD_MAX_MEMORY_SIZE = config('FILE_UPLOAD_MAX_MEMORY_SIZE', default=5 * 1024 * 1024, cast=int)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 2**31 - 1
 FILE_UPLOAD_TEMP_DIR = None
 
+# --- Subida por lotes (POST /api/media/batch/) ---
+MEDIA_BATCH_MAX_FILES = 50
+MEDIA_BATCH_WORKERS = config('MEDIA_BATCH_WORKERS', default=8, cast=int)  # subidas simultáneas al storage
+
+# --- Derivados de imagen (miniaturas responsive) ---
+MEDIA_DERIVATIVE_WIDTHS = [320, 640, 1280]
+MEDIA_DERIVATIVE_QUALITY = config('MEDIA_DERIVATIVE_QUALITY', default=80, cast=int)
+# AVIF necesita Pillow >= 11.3 o el plugin pillow-avif-plugin
+MEDIA_DERIVATIVE_AVIF = config('MEDIA_DERIVATIVE_AVIF', default=False, cast=bool)
+
+# --- Línea de tiempo (fecha de captura EXIF, ver wedding_gallery/exif.py) ---
+# Zona horaria de la boda: la de las fotos sin zona en el EXIF y la de los tramos por hora/día.
+# Con MySQL y una zona distinta de TIME_ZONE hay que cargar las zonas horarias (mysql_tzinfo_to_sql)
+WEDDING_TIME_ZONE = config('WEDDING_TIME_ZONE', default=TIME_ZONE)
+
+# --- Moderación en bloque (POST /api/media/moderate/) ---
+MEDIA_MODERATE_MAX_IDS = 1000
+
+# --- Casi duplicados (ver wedding_gallery/similarity.py) ---
+# Bits distintos (de 64) del hash perceptual para considerar dos fotos la misma
+MEDIA_SIMILAR_MAX_DISTANCE = config('MEDIA_SIMILAR_MAX_DISTANCE', default=6, cast=int)
+MEDIA_SIMILAR_MAX_CLUSTERS = 200   # grupos por respuesta en /api/media/similar/
+
+# --- Cola de trabajos en segundo plano (manage.py process_media_jobs) ---
+# En eager los trabajos se ejecutan al final de la propia petición (útil en desarrollo)
+MEDIA_JOBS_EAGER = config('MEDIA_JOBS_EAGER', default=DEBUG, cast=bool)
+MEDIA_JOBS_RETRY_BASE_SECONDS = 30
+MEDIA_JOBS_RETRY_MAX_SECONDS = 60 * 60
+MEDIA_JOBS_LOCK_TIMEOUT = 15 * 60  # un trabajo 'running' más viejo se considera huérfano
+# Reescribir los MP4/MOV con el moov al final para que empiecen a reproducirse al instante
+MEDIA_FASTSTART = config('MEDIA_FASTSTART', default=True, cast=bool)
+
+# --- Subida directa al almacenamiento (URLs prefirmadas) ---
+DIRECT_UPLOAD_PART_SIZE = 8 * 1024 * 1024      # S3 exige >= 5 MB salvo en la última parte
+DIRECT_UPLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DIRECT_UPLOAD_URL_EXPIRES = 60 * 60             # segundos de validez de cada URL
+
+# --- Descargas (GET /api/media/{id}/download/) ---
+# Con S3, redirigir a una URL prefirmada en vez de pasar los bytes por Django
+MEDIA_DOWNLOAD_REDIRECT = config('MEDIA_DOWNLOAD_REDIRECT', default=True, cast=bool)
+MEDIA_DOWNLOAD_URL_EXPIRES = 5 * 60
+MEDIA_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MEDIA_ZIP_MAX_FILES = 500   # por ZIP (GET /api/media/zip/)
+
+# --- Ficheros /media/ sin S3 (ver wedding_gallery/serving.py) ---
+# Con True, Django solo comprueba permisos y el proxy (Caddy/nginx) envía el fichero
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default=False, cast=bool)
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/')   # nginx: '/protected-media/'
+MEDIA_CACHE_SECONDS = 30 * 24 * 60 * 60
+
 # --- Seguridad varias ---
 SECURE_CROSS_ORIGIN_OPENER_POLICY = 'same-origin-allow-popups'
 
@@ -190,5 +286,6 @@ SPECTACULAR_SETTINGS = {
         {'name': 'media', 'description': 'Operaciones con archivos multimedia'},
         {'name': 'gallery', 'description': 'Endpoints de galería'},
         {'name': 'stats', 'description': 'Estadísticas del sistema'},
+        {'name': 'uploads', 'description': 'Subidas directas al almacenamiento (URLs prefirmadas)'},
     ],
 }
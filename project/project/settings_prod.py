@@ -92,7 +92,7 @@ LOGGING = {
 }
 
 # Configuración para uploads grandes
-FILE_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100MB
+# (los ficheros se vuelcan a disco por encima de FILE_UPLOAD_MAX_MEMORY_SIZE, ver settings.py)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
 
@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from wedding_gallery.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -38,8 +41,13 @@ urlpatterns = [
     path('ayuda/', TemplateView.as_view(template_name='ayuda.html'), name='ayuda'),
 ]
 
-# Serve static and media files in development
+# Serve static files in development
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    if not settings.USE_S3:
-        urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# Sin S3 los ficheros subidos los sirve Django (también en producción): comprueba
+# que son visibles y delega el envío en el proxy (ver wedding_gallery/serving.py)
+if not settings.USE_S3:
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', serve_media, name='media'),
+    ]
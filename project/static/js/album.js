@@ -1,79 +1,293 @@
 (function () {
   const gallery = document.getElementById('album-gallery');
+
+  // Ancho aproximado de cada miniatura: 2 columnas dentro de una galería de máx. 600px
+  const TILE_SIZES = '(max-width: 600px) 50vw, 300px';
+
+  // { "320": url, "640": url } -> "url 320w, url 640w"
+  function buildSrcset(byWidth) {
+    return Object.entries(byWidth || {})
+      .map(([width, url]) => `${url} ${width}w`)
+      .join(', ');
+  }
+
+  // Derivado más grande disponible (para el visor); si no hay, el original
+  function largestDerivative(media) {
+    const byWidth = media.srcset && media.srcset.webp;
+    if (!byWidth) return media.file_url;
+    const widest = Math.max(...Object.keys(byWidth).map(Number));
+    return byWidth[widest];
+  }
   
-  async function loadGallery() {
+  // 83500 -> "1:24"
+  function formatDuration(ms) {
+    const total = Math.round(ms / 1000);
+    const seconds = String(total % 60).padStart(2, '0');
+    return `${Math.floor(total / 60)}:${seconds}`;
+  }
+
+  // Hueco con el tamaño definitivo y el placeholder (WebP de 16px + color
+  // dominante) pintado al instante; al cargar la foto se quita el fondo
+  function applyPlaceholder(element, media) {
+    if (media.width && media.height) {
+      element.width = media.width;
+      element.height = media.height;
+      element.style.aspectRatio = `${media.width} / ${media.height}`;
+    }
+    if (media.dominant_color) element.style.backgroundColor = media.dominant_color;
+    if (media.placeholder) {
+      element.style.backgroundImage = `url("${media.placeholder}")`;
+      element.classList.add('has-placeholder');
+    }
+    element.addEventListener('load', () => {
+      element.style.backgroundImage = '';
+      element.style.backgroundColor = '';
+    }, { once: true });
+  }
+
+  function createMediaElement(media) {
+    if (media.media_type === 'video') {
+      // Crear elemento de video
+      const videoWrapper = document.createElement('div');
+      videoWrapper.className = 'album-img album-video-wrapper';
+      videoWrapper.dataset.url = media.file_url;
+      videoWrapper.dataset.type = 'video';
+      videoWrapper.dataset.id = media.id;
+
+      const video = document.createElement('video');
+      video.src = media.file_url;
+      video.className = 'album-video';
+      video.muted = true;
+      video.playsInline = true;
+      video.preload = 'metadata';
+
+      // Dimensiones conocidas (leídas del MP4): el hueco se reserva antes de
+      // cargar el vídeo y la galería no salta
+      if (media.width && media.height) {
+        video.width = media.width;
+        video.height = media.height;
+        video.style.aspectRatio = `${media.width} / ${media.height}`;
+      }
+
+      const playIcon = document.createElement('div');
+      playIcon.className = 'video-play-icon';
+      playIcon.innerHTML = '▶';
+
+      videoWrapper.appendChild(video);
+      videoWrapper.appendChild(playIcon);
+
+      if (media.duration_ms) {
+        const duration = document.createElement('span');
+        duration.className = 'video-duration';
+        duration.textContent = formatDuration(media.duration_ms);
+        videoWrapper.appendChild(duration);
+      }
+      return videoWrapper;
+    }
+
+    // Crear elemento de imagen (miniaturas responsive si existen)
+    const srcset = media.srcset || {};
+    const img = document.createElement('img');
+    img.src = largestDerivative(media);
+    if (srcset.webp) {
+      img.srcset = buildSrcset(srcset.webp);
+      img.sizes = TILE_SIZES;
+    }
+    img.loading = 'lazy';
+    img.decoding = 'async';
+    img.alt = 'foto boda';
+    img.className = 'album-img';
+    applyPlaceholder(img, media);
+    img.dataset.url = media.file_url;   // original: descargar / compartir
+    img.dataset.full = largestDerivative(media);
+    img.dataset.type = 'image';
+    img.dataset.id = media.id;
+
+    if (!srcset.avif) return img;
+
+    // <picture> para que el navegador elija AVIF si lo soporta
+    const picture = document.createElement('picture');
+    picture.style.display = 'contents';
+    const source = document.createElement('source');
+    source.type = 'image/avif';
+    source.srcset = buildSrcset(srcset.avif);
+    source.sizes = TILE_SIZES;
+    picture.appendChild(source);
+    picture.appendChild(img);
+    return picture;
+  }
+
+  // Carga por páginas: la API devuelve un cursor "next" y pedimos la siguiente
+  // página cuando el final de la galería se acerca a la pantalla
+  let nextUrl = '/api/media/gallery/';
+  let loading = false;
+  let loadedCount = 0;
+  let oldestLoaded = null;   // created_at del último elemento cargado
+
+  const sentinel = document.createElement('div');
+  sentinel.className = 'album-sentinel';
+  sentinel.setAttribute('aria-hidden', 'true');
+
+  const observer = 'IntersectionObserver' in window
+    ? new IntersectionObserver((entries) => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+      }, { rootMargin: '800px 0px' })
+    : null;
+
+  async function loadNextPage() {
+    if (loading || !nextUrl) return;
+    loading = true;
     try {
-      const response = await fetch('/api/media/gallery/');
+      // 'no-cache': el navegador guarda la respuesta y la revalida enviando
+      // If-None-Match / If-Modified-Since; si nada cambió el servidor contesta 304
+      // sin cuerpo y se reutiliza la copia guardada
+      const response = await fetch(nextUrl, {
+        cache: 'no-cache',
+        headers: { 'Accept': 'application/json' },
+      });
       if (!response.ok) {
         throw new Error('Error al cargar la galería');
       }
-      
+
       const data = await response.json();
-      
-      // Combinar imágenes y videos
-      const allMedia = [...(data.images || []), ...(data.videos || [])];
-      
-      if (allMedia.length > 0) {
-        gallery.innerHTML = '';
-        
-        allMedia.forEach(media => {
-          if (media.media_type === 'video') {
-            // Crear elemento de video
-            const videoWrapper = document.createElement('div');
-            videoWrapper.className = 'album-img album-video-wrapper';
-            videoWrapper.dataset.url = media.file_url;
-            videoWrapper.dataset.type = 'video';
-            
-            const video = document.createElement('video');
-            video.src = media.file_url;
-            video.className = 'album-video';
-            video.muted = true;
-            video.playsInline = true;
-            
-            const playIcon = document.createElement('div');
-            playIcon.className = 'video-play-icon';
-            playIcon.innerHTML = '▶';
-            
-            videoWrapper.appendChild(video);
-            videoWrapper.appendChild(playIcon);
-            gallery.appendChild(videoWrapper);
-          } else {
-            // Crear elemento de imagen
-            const img = document.createElement('img');
-            img.src = media.file_url;
-            img.alt = 'foto boda';
-            img.className = 'album-img';
-            img.dataset.url = media.file_url;
-            img.dataset.type = 'image';
-            gallery.appendChild(img);
-          }
-        });
-        
-        // Añadir event listeners para abrir el viewer
-        document.querySelectorAll('.album-img').forEach(element => {
-          element.addEventListener('click', (e) => {
-            // No abrir el visor si estamos en modo selección O acabamos de salir
-            if (document.body.classList.contains('selecting') || 
-                window.justExitedSelectionMode) {
-              e.preventDefault();
-              e.stopPropagation();
-              return;
-            }
-            openMediaViewer(element);
-          });
-        });
-      } else {
+      // Mantener el orden cronológico de la página (imágenes y videos mezclados)
+      const pageMedia = [...(data.images || []), ...(data.videos || [])]
+        .sort((a, b) => (b.created_at || '').localeCompare(a.created_at || '') || b.id - a.id);
+
+      if (loadedCount === 0) gallery.innerHTML = '';
+
+      const fragment = document.createDocumentFragment();
+      pageMedia.forEach(media => fragment.appendChild(createMediaElement(media)));
+      gallery.appendChild(fragment);
+      loadedCount += pageMedia.length;
+      if (pageMedia.length > 0) oldestLoaded = pageMedia[pageMedia.length - 1].created_at;
+      nextUrl = data.next;
+      if (data.sync_token) startSync(data.sync_token);
+
+      if (loadedCount === 0) {
         gallery.innerHTML = '<p style="text-align:center; padding:20px; width:100%; font-size:20px;">No hay fotos ni videos aún. ¡Sé el primero en subir!</p>';
+      } else if (nextUrl) {
+        // El centinela siempre al final de lo cargado
+        gallery.appendChild(sentinel);
+        if (observer) observer.observe(sentinel);
+      } else {
+        sentinel.remove();
+        if (observer) observer.disconnect();
       }
     } catch (error) {
       console.error('Error cargando galería:', error);
-      gallery.innerHTML = '<p style="text-align:center; padding:20px; width:100%; color:red;">Error al cargar las fotos. Intenta recargar la página.</p>';
+      if (loadedCount === 0) {
+        gallery.innerHTML = '<p style="text-align:center; padding:20px; width:100%; color:red;">Error al cargar las fotos. Intenta recargar la página.</p>';
+      }
+    } finally {
+      loading = false;
     }
+
+    // Sin IntersectionObserver (navegadores antiguos) cargamos todo seguido
+    if (!observer && nextUrl) loadNextPage();
   }
-  
+
+  // Sincronización: el servidor avisa de lo que cambia (fotos nuevas, ocultadas o
+  // con miniaturas nuevas) por Server-Sent Events. Si no hay EventSource o el
+  // servidor no lo soporta (WSGI), pedimos /changes/ cada pocos segundos
+  const SYNC_INTERVAL_MS = 15000;
+  let syncToken = null;
+  let syncing = false;
+  let syncTimer = null;
+
+  function startPolling() {
+    if (syncTimer === null) syncTimer = setInterval(syncChanges, SYNC_INTERVAL_MS);
+  }
+
+  function startSync(token) {
+    const firstTime = syncToken === null;
+    syncToken = token;
+    if (!firstTime) return;
+
+    if (!('EventSource' in window)) {
+      startPolling();
+      return;
+    }
+    const source = new EventSource(`/api/media/events/?since=${encodeURIComponent(token)}`);
+    source.addEventListener('changes', (event) => {
+      const data = JSON.parse(event.data);
+      data.changes.forEach(applyChange);
+      syncToken = data.token;
+    });
+    source.addEventListener('error', () => {
+      // CLOSED: el servidor rechazó la conexión y el navegador no reintentará
+      if (source.readyState === EventSource.CLOSED) startPolling();
+    });
+  }
+
+  function applyChange(media) {
+    const current = gallery.querySelector(`.album-img[data-id="${media.id}"]`);
+    // Las imágenes AVIF van dentro de un <picture>: se sustituye el envoltorio
+    const existing = current && current.parentElement.tagName === 'PICTURE' ? current.parentElement : current;
+
+    if (media.status !== 1) {
+      if (existing) existing.remove();
+      return;
+    }
+    // Aún no cargado y más antiguo que lo que se ve: ya llegará con su página
+    if (!existing && nextUrl && oldestLoaded && media.created_at < oldestLoaded) return;
+
+    const element = createMediaElement(media);
+    if (existing) {
+      existing.replaceWith(element);
+    } else {
+      if (loadedCount === 0) gallery.innerHTML = '';
+      gallery.prepend(element);
+      loadedCount++;
+    }
+  }
+
+  async function syncChanges() {
+    if (syncing || !syncToken || document.hidden) return;
+    syncing = true;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const response = await fetch(`/api/media/changes/?since=${encodeURIComponent(syncToken)}`, {
+          cache: 'no-cache',
+          headers: { 'Accept': 'application/json' },
+        });
+        if (!response.ok) break;
+        const data = await response.json();
+        // Del más antiguo al más reciente: al anteponer, lo último queda arriba
+        data.changes.forEach(applyChange);
+        syncToken = data.token;
+        hasMore = data.has_more;
+      }
+    } catch (error) {
+      console.warn('No se pudieron comprobar los cambios:', error);
+    } finally {
+      syncing = false;
+    }
+  }
+
+  // Al volver a la pestaña (si estamos sondeando), comprobar enseguida
+  document.addEventListener('visibilitychange', () => {
+    if (!document.hidden && syncTimer !== null) syncChanges();
+  });
+
+  // Abrir el viewer (delegado: sirve también para las páginas que llegan después)
+  gallery.addEventListener('click', (e) => {
+    const element = e.target.closest('.album-img');
+    if (!element) return;
+    // No abrir el visor si estamos en modo selección O acabamos de salir
+    if (document.body.classList.contains('selecting') ||
+        window.justExitedSelectionMode) {
+      e.preventDefault();
+      e.stopPropagation();
+      return;
+    }
+    openMediaViewer(element);
+  });
+
   // Visor de medios (lightbox)
   function openMediaViewer(element) {
-    const url = element.dataset.url;
+    const url = element.dataset.full || element.dataset.url;
     const type = element.dataset.type;
     
     // Crear modal viewer
@@ -103,5 +317,5 @@
     viewer.remove();
   }
   
-  loadGallery();
+  loadNextPage();
 })();
@@ -152,7 +152,207 @@
     }
   }
 
-  // Helper para delay entre subidas
+  async function responseError(resp) {
+    const errorText = await resp.text();
+    const errorMsg = `HTTP ${resp.status}: ${errorText.substring(0, 200)}`;
+    console.error('❌ Error en respuesta:', errorMsg);
+    return new Error(errorMsg);
+  }
+
+  // Subida directa al almacenamiento (S3 o local) por partes con URLs prefirmadas.
+  // Es reanudable: el id de la sesión se guarda en localStorage y, tras un corte
+  // (o recargar la página), solo se suben las partes que el servidor no tiene.
+  const DIRECT_UPLOAD_MIN_BYTES = 8 * 1024 * 1024;
+  const PART_RETRIES = 4;
+
+  function resumeKey(file, name) {
+    return `bodapitis:upload:${name}:${file.size}:${file.lastModified}`;
+  }
+
+  async function uploadStatus(sessionId) {
+    try {
+      const resp = await fetch(`/api/uploads/${sessionId}/`, { headers: { 'Accept': 'application/json' } });
+      return resp.ok ? resp.json() : null;
+    } catch (err) {
+      return null;
+    }
+  }
+
+  async function directUpload(file, name, csrfToken, onProgress) {
+    const jsonHeaders = {
+      'Content-Type': 'application/json',
+      'X-CSRFToken': csrfToken,
+    };
+    const storageKey = resumeKey(file, name);
+
+    let session = null;
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+      session = await uploadStatus(savedId);
+      if (session) {
+        console.log(`↩️ Reanudando ${name} desde ${(session.offset / (1024 * 1024)).toFixed(1)}MB`);
+      } else {
+        localStorage.removeItem(storageKey);
+      }
+    }
+
+    if (!session) {
+      // Con el hash el servidor devuelve el archivo si ya lo tiene y comprueba que llegó entero
+      const sha256 = await fileSha256(file).catch(() => null);
+      const initResp = await fetch('/api/uploads/', {
+        method: 'POST',
+        headers: jsonHeaders,
+        body: JSON.stringify({ filename: name, bytes: file.size, content_type: file.type || '', sha256: sha256 || '' }),
+      });
+      if (!initResp.ok) throw await responseError(initResp);
+      session = await initResp.json();
+      if (session.duplicate) return session.media;
+      localStorage.setItem(storageKey, session.id);
+      session.uploaded_parts = [];
+    }
+
+    const totalParts = Math.ceil(file.size / session.part_size);
+    const etags = new Map(session.uploaded_parts.map(p => [p.part_number, p.etag]));
+    let pending = session.parts;
+    let failures = 0;
+
+    while (pending.length > 0) {
+      const part = pending[0];
+      const partBytes = part.end - part.start;
+      try {
+        const resp = await fetchWithTimeout(part.url, {
+          method: 'PUT',
+          // Un único PUT a S3 va firmado con el Content-Type
+          headers: totalParts === 1 ? session.headers : {},
+          body: file.slice(part.start, part.end),
+        }, 60000 + (partBytes / (1024 * 1024)) * 1000);
+        if (!resp.ok) throw await responseError(resp);
+        etags.set(part.part_number, resp.headers.get('ETag'));
+        pending = pending.slice(1);
+        failures = 0;
+        if (onProgress) onProgress(etags.size / totalParts);
+      } catch (err) {
+        failures++;
+        if (failures > PART_RETRIES) throw err;
+        console.warn(`⚠️ Parte ${part.part_number} de ${name} falló (${failures}/${PART_RETRIES}), reintentando…`, err);
+        await delay(1000 * 2 ** (failures - 1));
+        // Preguntamos qué falta: las URLs pueden haber caducado o la parte llegó aunque fallara la respuesta
+        const status = await uploadStatus(session.id);
+        if (status) {
+          status.uploaded_parts.forEach(p => etags.set(p.part_number, p.etag));
+          pending = status.parts;
+        }
+      }
+    }
+
+    // Sin ETag (CORS sin exponerlo) el servidor los consulta él mismo
+    const parts = Array.from(etags, ([part_number, etag]) => ({ part_number, etag }));
+    const finalizeResp = await fetch(`/api/uploads/${session.id}/finalize/`, {
+      method: 'POST',
+      headers: jsonHeaders,
+      body: JSON.stringify({ parts: parts.every(p => p.etag) ? parts : [] }),
+    });
+    if (!finalizeResp.ok) throw await responseError(finalizeResp);
+    localStorage.removeItem(storageKey);
+    return finalizeResp.json();
+  }
+
+  // Hash SHA-256 en el cliente (requiere contexto seguro; los vídeos enormes se suben sin comprobar)
+  const MAX_HASH_BYTES = 25 * 1024 * 1024;
+  const HASHES_PER_CHECK = 200;
+
+  async function sha256Hex(file) {
+    if (!window.crypto || !crypto.subtle || file.size > MAX_HASH_BYTES) return null;
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+      .map(b => b.toString(16).padStart(2, '0'))
+      .join('');
+  }
+
+  // Cada archivo se hashea una sola vez (comprobación previa y subida directa)
+  const fileHashes = new WeakMap();
+
+  function fileSha256(file) {
+    if (!fileHashes.has(file)) fileHashes.set(file, sha256Hex(file));
+    return fileHashes.get(file);
+  }
+
+  // Pregunta al servidor qué archivos ya tiene, para no volver a subirlos
+  async function findAlreadyUploaded(files, csrfToken) {
+    const found = new Set();
+    try {
+      const hashes = [];
+      for (const file of files) {
+        hashes.push(await fileSha256(file).catch(() => null));
+      }
+
+      for (let start = 0; start < files.length; start += HASHES_PER_CHECK) {
+        const slice = hashes.slice(start, start + HASHES_PER_CHECK);
+        const known = slice.filter(Boolean);
+        if (known.length === 0) continue;
+
+        const resp = await fetch('/api/media/check_hashes/', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrfToken,
+          },
+          body: JSON.stringify({ sha256: known }),
+        });
+        if (!resp.ok) continue;
+
+        const { existing } = await resp.json();
+        slice.forEach((hash, idx) => {
+          if (hash && existing[hash] !== undefined) found.add(files[start + idx]);
+        });
+      }
+    } catch (err) {
+      // Si falla la comprobación, simplemente se sube todo (el servidor deduplica igualmente)
+      console.warn('No se pudo comprobar duplicados:', err);
+    }
+    return found;
+  }
+
+  // Subida por lotes: muchas fotos en una sola petición (el servidor las guarda en paralelo).
+  // Caddy limita el cuerpo a 100MB, así que los lotes se cortan bastante antes.
+  const BATCH_MAX_FILES = 20;
+  const BATCH_MAX_BYTES = 40 * 1024 * 1024;
+
+  function makeBatches(items) {
+    const batches = [];
+    let current = [];
+    let bytes = 0;
+    for (const item of items) {
+      if (current.length > 0 && (current.length >= BATCH_MAX_FILES || bytes + item.file.size > BATCH_MAX_BYTES)) {
+        batches.push(current);
+        current = [];
+        bytes = 0;
+      }
+      current.push(item);
+      bytes += item.file.size;
+    }
+    if (current.length > 0) batches.push(current);
+    return batches;
+  }
+
+  async function uploadBatch(batch, csrfToken, batchBytes) {
+    const fd = new FormData();
+    batch.forEach(({ file, name }) => fd.append('files', file, name));
+
+    // Timeout mayor para lotes grandes (60s base + 1s por MB)
+    const resp = await fetchWithTimeout('/api/media/batch/', {
+      method: 'POST',
+      headers: { 'X-CSRFToken': csrfToken },
+      body: fd,
+    }, 60000 + (batchBytes / (1024 * 1024)) * 1000);
+
+    // 207: el lote se procesó pero algún archivo falló (viene en results)
+    if (!resp.ok) throw await responseError(resp);
+    const { results } = await resp.json();
+    return results;
+  }
+
+  // Helper para esperar entre reintentos
   function delay(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
   }
@@ -165,60 +365,75 @@
     statusEl.textContent = `Subiendo 0/${selectedFiles.length}…`;
 
     try {
-      const UPLOAD_URL = '/api/media/';
       const csrfToken = getCsrfToken();
       let uploadedCount = 0;
       let failedCount = 0;
       const failedFiles = [];
 
-      // Subir archivos secuencialmente con delay
-      for (let i = 0; i < selectedFiles.length; i++) {
-        const file = selectedFiles[i];
-        const fd = new FormData();
+      statusEl.textContent = 'Comprobando archivos…';
+      const alreadyUploaded = await findAlreadyUploaded(selectedFiles, csrfToken);
+      if (alreadyUploaded.size > 0) {
+        console.log(`⏭️ ${alreadyUploaded.size} archivos ya estaban subidos, se omiten`);
+      }
+
+      const updateStatus = (extra = '') => {
+        statusEl.textContent = `Subiendo ${uploadedCount}/${selectedFiles.length}${extra}…`;
+      };
+      const markFailed = (name, size, err) => {
+        console.error(`❌ Error subiendo archivo ${name}:`, err);
+        failedFiles.push({
+          name,
+          size: (size / (1024 * 1024)).toFixed(2),
+          error: err.message || 'Error desconocido'
+        });
+        failedCount++;
+      };
+
+      // Nombres seguros y separación: los grandes van directos al almacenamiento
+      // (reanudables), el resto se agrupa en lotes de una sola petición
+      const small = [];
+      const large = [];
+      selectedFiles.forEach((file, i) => {
+        if (alreadyUploaded.has(file)) {
+          uploadedCount++;
+          return;
+        }
         const safeName = file.name && file.name.trim() !== '' ? file.name : `archivo_${Date.now()}_${i}.jpg`;
-        fd.append('file', file, safeName);
+        (file.size >= DIRECT_UPLOAD_MIN_BYTES ? large : small).push({ file, name: safeName });
+      });
+      updateStatus();
 
-        const fileSizeMB = (file.size / (1024 * 1024)).toFixed(2);
-        console.log(`📤 Subiendo ${i + 1}/${selectedFiles.length}: ${safeName} (${fileSizeMB}MB, ${file.type})`);
+      for (const batch of makeBatches(small)) {
+        const batchBytes = batch.reduce((sum, item) => sum + item.file.size, 0);
+        console.log(`📤 Subiendo lote de ${batch.length} archivos (${(batchBytes / (1024 * 1024)).toFixed(2)}MB)`);
+        try {
+          const results = await uploadBatch(batch, csrfToken, batchBytes);
+          results.forEach((result) => {
+            const item = batch[result.index];
+            if (result.status === 'error') {
+              markFailed(item.name, item.file.size, new Error(result.error));
+            } else {
+              uploadedCount++;
+            }
+          });
+        } catch (err) {
+          batch.forEach(item => markFailed(item.name, item.file.size, err));
+        }
+        updateStatus();
+      }
 
+      for (const { file, name } of large) {
+        console.log(`📤 Subida directa: ${name} (${(file.size / (1024 * 1024)).toFixed(2)}MB, ${file.type})`);
         try {
-          // Timeout mayor para archivos grandes (60s base + 1s por MB)
-          const timeoutMs = 60000 + (file.size / (1024 * 1024)) * 1000;
-          
-          const resp = await fetchWithTimeout(UPLOAD_URL, {
-            method: 'POST',
-            headers: {
-              'X-CSRFToken': csrfToken,
-            },
-            body: fd,
-          }, timeoutMs);
-
-          if (!resp.ok) {
-            const errorText = await resp.text();
-            const errorMsg = `HTTP ${resp.status}: ${errorText.substring(0, 200)}`;
-            console.error('❌ Error en respuesta:', errorMsg);
-            throw new Error(errorMsg);
-          }
-          
-          const result = await resp.json();
+          const result = await directUpload(file, name, csrfToken, (fraction) => {
+            updateStatus(` (${name}: ${Math.round(fraction * 100)}%)`);
+          });
           console.log('✅ Archivo subido:', result);
-          
           uploadedCount++;
-          statusEl.textContent = `Subiendo ${uploadedCount}/${selectedFiles.length}…`;
-          
-          // Delay entre subidas para no saturar (excepto en el último)
-          if (i < selectedFiles.length - 1) {
-            await delay(800); // 800ms entre subidas
-          }
         } catch (err) {
-          console.error(`❌ Error subiendo archivo ${safeName}:`, err);
-          failedFiles.push({
-            name: safeName,
-            size: fileSizeMB,
-            error: err.message || 'Error desconocido'
-          });
-          failedCount++;
+          markFailed(name, file.size, err);
         }
+        updateStatus();
       }
 
       if (failedCount === 0) {
@@ -129,150 +129,26 @@
       }
     };
     
-    // En móvil, mostrar advertencia inicial para múltiples archivos
-    if (isMobile && items.length > 1) {
-      const continuar = confirm(
-        `Se van a descargar ${items.length} archivos uno por uno.\n\n` +
-        `En algunos navegadores móviles (especialmente iOS Safari) puede que necesites:\n` +
-        `• Confirmar cada descarga manualmente\n` +
-        `• Dar permiso de descarga si te lo solicita\n\n` +
-        `TIP: El botón "Compartir" puede ser más cómodo para múltiples archivos.\n\n` +
-        `¿Continuar con la descarga?`
-      );
-      if (!continuar) {
-        return;
-      }
-    }
-    
-    // Delay entre descargas: más largo en móvil para evitar bloqueos
-    const delayBetweenDownloads = isMobile ? 1000 : 500;
+    // Un archivo: se descarga tal cual. Varios: un único ZIP que el servidor
+    // genera mientras se descarga (sin esperas entre archivos ni blobs en memoria)
+    const ids = items.map(item => item.dataset.id).filter(id => id);
+    if (ids.length === 0) return;
     
-    let successCount = 0;
-    let failCount = 0;
+    const a = document.createElement('a');
+    a.href = ids.length === 1
+      ? `/api/media/${encodeURIComponent(ids[0])}/download/`
+      : `/api/media/zip/?ids=${ids.map(encodeURIComponent).join(',')}`;
+    a.download = '';
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
     
-    for (let i = 0; i < items.length; i++) {
-      const item = items[i];
-      const url = item.dataset.url;
-      const type = item.dataset.type || 'image';
-      
-      if (!url) continue;
-      
-      try {
-        // Mostrar progreso
-        showFeedback(`Descargando ${i + 1} de ${items.length}...`);
-        
-        // Usar endpoint proxy para evitar CORS (tanto móvil como PC)
-        const downloadUrl = `/api/media/download_proxy/?url=${encodeURIComponent(url)}`;
-        
-        // Fetch para obtener el archivo como blob
-        const response = await fetch(downloadUrl);
-        if (!response.ok) {
-          const errorMsg = `HTTP ${response.status}: ${response.statusText}`;
-          console.error('Error en fetch:', errorMsg, 'URL:', downloadUrl);
-          throw new Error(errorMsg);
-        }
-        
-        const blob = await response.blob();
-        console.log(`Blob descargado: ${blob.size} bytes, tipo: ${blob.type}`);
-        
-        // Crear URL temporal del blob
-        const blobUrl = URL.createObjectURL(blob);
-        
-        // Obtener extensión del archivo desde la URL original
-        const urlPath = new URL(url).pathname;
-        const extension = urlPath.substring(urlPath.lastIndexOf('.'));
-        
-        // Crear enlace temporal y forzar descarga
-        const a = document.createElement('a');
-        a.href = blobUrl;
-        a.download = `${type}_${Date.now()}_${i}${extension}`;
-        
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        
-        // Liberar el blob URL después de un momento
-        setTimeout(() => URL.revokeObjectURL(blobUrl), 100);
-        
-        successCount++;
-        
-        // Delay entre descargas para no saturar el navegador
-        if (i < items.length - 1) {
-          await new Promise(resolve => setTimeout(resolve, delayBetweenDownloads));
-        }
-      } catch (error) {
-        // Log detallado del error
-        const errorDetails = {
-          mensaje: error.message,
-          nombre: error.name,
-          url: url,
-          navegador: navigator.userAgent,
-          index: i + 1,
-          total: items.length
-        };
-        console.error('❌ Error descargando archivo:', errorDetails);
-        
-        failCount++;
-        
-        // En móvil, guardar el primer error para mostrarlo después
-        if (isMobile && failCount === 1) {
-          window._lastDownloadError = errorDetails;
-        }
-      }
-    }
-    
-    // Mostrar resultado final
-    if (successCount > 0) {
-      showFeedback(
-        successCount === items.length
-          ? `✓ ${successCount} archivo${successCount > 1 ? 's descargados' : ' descargado'}`
-          : `✓ ${successCount} descargados, ${failCount} fallaron`
-      );
-      vibrate(15);
-      
-      // Mostrar detalles del error si hubo fallos y estamos en móvil
-      if (failCount > 0 && isMobile && window._lastDownloadError) {
-        setTimeout(() => {
-          const err = window._lastDownloadError;
-          alert(
-            `Detalles del error de descarga:\n\n` +
-            `Error: ${err.mensaje}\n` +
-            `Tipo: ${err.nombre}\n` +
-            `Archivo ${err.index} de ${err.total}\n\n` +
-            `Revisa la consola del navegador para más detalles.\n\n` +
-            `Tip: Prueba con el botón "Compartir" como alternativa.`
-          );
-          delete window._lastDownloadError;
-        }, 2500);
-      }
-    } else {
-      // Si todo falló, mostrar error con detalles
-      if (isMobile && window._lastDownloadError) {
-        const err = window._lastDownloadError;
-        showFeedback(
-          `✗ Error: ${err.mensaje}\n` +
-          `(${err.nombre})`
-        );
-        
-        setTimeout(() => {
-          alert(
-            `Detalles del error de descarga:\n\n` +
-            `Error: ${err.mensaje}\n` +
-            `Tipo: ${err.nombre}\n` +
-            `URL: ${err.url}\n\n` +
-            `Navegador: ${err.navegador.substring(0, 50)}...\n\n` +
-            `Soluciones posibles:\n` +
-            `• Verifica tu conexión a internet\n` +
-            `• Intenta con menos archivos a la vez\n` +
-            `• Usa el botón "Compartir" como alternativa\n` +
-            `• Comprueba la consola del navegador (DevTools)`
-          );
-          delete window._lastDownloadError;
-        }, 2500);
-      } else {
-        showFeedback('✗ Error en la descarga');
-      }
-    }
+    showFeedback(
+      ids.length === 1
+        ? '✓ Descargando 1 archivo'
+        : `✓ Descargando ${ids.length} archivos (ZIP)`
+    );
+    vibrate(15);
     
     // Ocultar feedback después de 2 segundos
     setTimeout(hideFeedback, 2000);
@@ -1,15 +1,49 @@
+from django.conf import settings
 from django.contrib import admin
-from django.utils.html import format_html
-from .models import Media
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from .jobs import refresh_processing_state, run_pending
+from .models import Media, ProcessingJob, UploadSession
+from .moderation import moderate
+
+
+def _thumbnail_url(media):
+    # La miniatura más pequeña basta para 100px; si aún no hay, el original
+    thumbs = (media.derivatives or {}).get('webp') or {}
+    return media.file.storage.url(thumbs[min(thumbs, key=int)]) if thumbs else media.file.url
+
+
+class SimilarFilter(admin.SimpleListFilter):
+    """Grupos de casi duplicados (ver similarity.py)"""
+    title = "casi duplicados"
+    parameter_name = 'similar'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('grouped', "En un grupo (original y copias)"),
+            ('copies', "Solo copias"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'copies':
+            return queryset.filter(similar_to__isnull=False)
+        if self.value() == 'grouped':
+            return queryset.filter(Q(similar_to__isnull=False) | Q(similar_media__isnull=False)).distinct()
+        return queryset
 
 
 @admin.register(Media)
 class MediaAdmin(admin.ModelAdmin):
-    list_display = ['id', 'media_type', 'file_preview', 'object_key', 'status', 'bytes_formatted', 'created_at']
-    list_filter = ['media_type', 'status', 'created_at']
+    list_display = ['id', 'media_type', 'file_preview', 'object_key', 'status', 'similar_to', 'bytes_formatted', 'created_at']
+    list_filter = ['media_type', 'status', 'processing_state', SimilarFilter, 'created_at']
     search_fields = ['object_key', 'mime_type']
-    readonly_fields = ['object_key', 'bytes', 'width', 'height', 'duration_ms', 'sha256', 'created_at', 'file_preview']
-    list_editable = ['status']
+    readonly_fields = ['object_key', 'bytes', 'width', 'height', 'duration_ms', 'sha256', 'original_sha256',
+                       'created_at', 'file_preview', 'derivatives', 'processing_state', 'phash', 'similar_to',
+                       'similar_preview', 'status', 'deleted_at']
+    # status solo cambia con las acciones de moderación (versión, contadores y deleted_at)
     ordering = ['-created_at']
     
     fieldsets = (
@@ -17,13 +51,13 @@ class MediaAdmin(admin.ModelAdmin):
             'fields': ('file', 'file_preview', 'object_key')
         }),
         ('Metadatos', {
-            'fields': ('media_type', 'mime_type', 'bytes', 'width', 'height', 'duration_ms')
+            'fields': ('media_type', 'mime_type', 'bytes', 'width', 'height', 'duration_ms', 'derivatives')
         }),
         ('Control', {
-            'fields': ('status', 'created_at')
+            'fields': ('status', 'deleted_at', 'processing_state', 'created_at')
         }),
         ('Deduplicación', {
-            'fields': ('sha256',),
+            'fields': ('sha256', 'original_sha256', 'phash', 'similar_to', 'similar_preview'),
             'classes': ('collapse',)
         }),
     )
@@ -33,8 +67,8 @@ class MediaAdmin(admin.ModelAdmin):
         if obj.file:
             if obj.media_type == 'image':
                 return format_html(
-                    '<img src="{}" style="max-width: 100px; max-height: 100px;" />',
-                    obj.file.url
+                    '<img src="{}" style="max-width: 100px; max-height: 100px;" loading="lazy" />',
+                    _thumbnail_url(obj)
                 )
             elif obj.media_type == 'video':
                 return format_html(
@@ -44,6 +78,22 @@ class MediaAdmin(admin.ModelAdmin):
                 )
         return "No preview available"
     file_preview.short_description = "Preview"
+
+    def similar_preview(self, obj):
+        """Miniaturas del grupo de casi duplicados de este archivo"""
+        root_id = obj.similar_to_id or obj.pk
+        group = Media.objects.filter(Q(pk=root_id) | Q(similar_to_id=root_id)).order_by('id')
+        if obj.pk is None or len(group) < 2:
+            return "Sin fotos parecidas"
+        return format_html_join(
+            ' ', '<a href="{}"><img src="{}" title="#{}" style="max-height: 100px;{}" loading="lazy" /></a>',
+            (
+                (reverse('admin:wedding_gallery_media_change', args=[m.pk]), _thumbnail_url(m), m.pk,
+                 ' outline: 3px solid #417690;' if m.pk == obj.pk else '')
+                for m in group
+            )
+        )
+    similar_preview.short_description = "Grupo de parecidas"
     
     def bytes_formatted(self, obj):
         """Format bytes in human readable format"""
@@ -58,16 +108,67 @@ class MediaAdmin(admin.ModelAdmin):
         return "Unknown"
     bytes_formatted.short_description = "Size"
     
-    actions = ['mark_as_visible', 'mark_as_hidden']
+    actions = ['mark_as_visible', 'mark_as_hidden', 'soft_delete', 'restore', 'hide_similar_copies']
     
     def mark_as_visible(self, request, queryset):
         """Mark selected media as visible"""
-        updated = queryset.update(status=1)
+        updated = moderate(queryset, 'show')
         self.message_user(request, f'{updated} archivos marcados como visibles.')
     mark_as_visible.short_description = "Marcar como visible"
     
     def mark_as_hidden(self, request, queryset):
         """Mark selected media as hidden"""
-        updated = queryset.update(status=0)
+        updated = moderate(queryset, 'hide')
         self.message_user(request, f'{updated} archivos marcados como ocultos.')
     mark_as_hidden.short_description = "Marcar como oculto"
+
+    def soft_delete(self, request, queryset):
+        """Borrado lógico: la fila y el fichero se quedan y se puede restaurar"""
+        updated = moderate(queryset, 'delete')
+        self.message_user(request, f'{updated} archivos eliminados (se pueden restaurar).')
+    soft_delete.short_description = "Eliminar (se puede restaurar)"
+
+    def restore(self, request, queryset):
+        """Volver a mostrar archivos eliminados"""
+        updated = moderate(queryset, 'restore')
+        self.message_user(request, f'{updated} archivos restaurados.')
+    restore.short_description = "Restaurar eliminados"
+
+    def hide_similar_copies(self, request, queryset):
+        """Ocultar las copias seleccionadas y quedarse con la original de cada grupo"""
+        updated = moderate(queryset.filter(similar_to__isnull=False), 'hide')
+        self.message_user(request, f'{updated} copias ocultadas (las originales siguen visibles).')
+    hide_similar_copies.short_description = "Ocultar casi duplicados (se queda la original)"
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'media', 'kind', 'state', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['kind', 'state']
+    readonly_fields = ['media', 'kind', 'payload', 'attempts', 'locked_at', 'last_error', 'created_at', 'updated_at']
+    ordering = ['-created_at']
+
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """Re-encolar los trabajos seleccionados para ejecución inmediata"""
+        jobs = queryset.exclude(state='running')
+        media_ids = set(jobs.values_list('media_id', flat=True))
+        updated = jobs.update(state='pending', attempts=0, run_after=timezone.now(), last_error='')
+        # El archivo deja de verse como fallido
+        for media_id in media_ids:
+            refresh_processing_state(media_id)
+        # Sin worker (modo eager) nadie los recogería
+        if settings.MEDIA_JOBS_EAGER:
+            transaction.on_commit(lambda: [run_pending(media_id=pk) for pk in media_ids])
+        self.message_user(request, f'{updated} trabajos re-encolados.')
+    retry_now.short_description = "Reintentar ahora"
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'filename', 'total_bytes', 'state', 'media', 'created_at']
+    list_filter = ['state']
+    search_fields = ['filename', 'object_key']
+    readonly_fields = [f.name for f in UploadSession._meta.fields]
+    ordering = ['-created_at']
@@ -0,0 +1,130 @@
+"""
+Subida de varios archivos en una sola petición (``POST /api/media/batch/``).
+
+En vez de una petición, un PUT al storage y varias consultas por foto:
+
+1. se valida el tipo y se descartan los duplicados (una sola consulta por hash),
+2. los ficheros se suben al storage en paralelo con un pool de hilos acotado
+   (``MEDIA_BATCH_WORKERS``); ``Media.prepare_file`` no toca la base de datos
+   y cada fichero lleva ya un nombre único (iOS manda muchos ``image.jpg``),
+3. las filas se insertan con un único ``bulk_create`` y los trabajos de
+   procesado con otro (``jobs.enqueue_many``).
+
+Cada archivo tiene su propio resultado: que falle uno no tumba el lote.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Media
+from .serializers import validate_upload
+
+logger = logging.getLogger(__name__)
+
+
+def _result(index, upload, status, media=None, error=None):
+    return {'index': index, 'filename': upload.name, 'status': status, 'media': media, 'error': error}
+
+
+def _store(media):
+    """Sube un fichero al storage (se ejecuta en un hilo del pool)."""
+    try:
+        media.prepare_file()
+        media.mime_type = media.mime_type or 'application/octet-stream'
+        media.processing_state = 'pending'
+    except Exception as e:
+        logger.exception("No se pudo guardar %s en el storage", media.file.name)
+        return e
+    return None
+
+
+def _assign_pks(created):
+    # MySQL no devuelve los ids de un bulk_create: los buscamos por object_key
+    missing = {m.object_key: m for m in created if m.pk is None}
+    if missing:
+        for pk, key in Media.objects.filter(object_key__in=missing).values_list('pk', 'object_key'):
+            missing[key].pk = pk
+    for media in created:
+        media._state.adding = False
+        media._state.db = 'default'
+
+
+def save_batch(uploads):
+    """
+    Guarda ``uploads`` (ficheros de ``request.FILES``) y devuelve un resultado por
+    archivo, en el mismo orden: ``status`` es ``created``, ``duplicate`` o ``error``.
+    """
+    from .jobs import enqueue_many
+
+    results = [None] * len(uploads)
+
+    # 1) Tipo permitido y duplicados (hash calculado por MediaUploadHandler)
+    hashes = {u.sha256 for u in uploads if getattr(u, 'sha256', None)}
+    existing = {}
+    for media in Media.with_hashes(hashes).order_by('-id'):
+        for sha256 in media.content_hashes():
+            existing[sha256] = media  # nos quedamos con el más antiguo
+
+    pending = []      # (index, Media sin guardar)
+    repeated = {}     # index -> index del primer archivo con el mismo hash en el lote
+    first_in_batch = {}
+    for index, upload in enumerate(uploads):
+        try:
+            validate_upload(upload)
+        except serializers.ValidationError as e:
+            results[index] = _result(index, upload, 'error', error=' '.join(e.detail))
+            continue
+
+        sha256 = getattr(upload, 'sha256', None)
+        if sha256 in existing:
+            results[index] = _result(index, upload, 'duplicate', media=existing[sha256])
+        elif sha256 and sha256 in first_in_batch:
+            repeated[index] = first_in_batch[sha256]
+        else:
+            if sha256:
+                first_in_batch[sha256] = index
+            # prepare_file le da una clave única antes de subirlo (ver unique_filename)
+            media = Media(file=upload)
+            pending.append((index, media))
+
+    # 2) Subida concurrente al storage
+    workers = max(1, min(settings.MEDIA_BATCH_WORKERS, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(_store, [media for _, media in pending]))
+
+    stored = []
+    for (index, media), error in zip(pending, errors):
+        if error is None:
+            stored.append((index, media))
+        else:
+            results[index] = _result(index, uploads[index], 'error', error=f'Error al subir el archivo: {error}')
+
+    # 3) Una inserción para todas las filas y otra para sus trabajos
+    created = [media for _, media in stored]
+    if created:
+        try:
+            with transaction.atomic():
+                Media.objects.bulk_create(created)
+                _assign_pks(created)
+                enqueue_many(created)
+        except Exception as e:
+            logger.exception("Falló la inserción del lote")
+            for media in created:
+                media.file.storage.delete(media.file.name)
+            for index, media in stored:
+                results[index] = _result(index, uploads[index], 'error', error=f'Error al guardar: {e}')
+        else:
+            for index, media in stored:
+                results[index] = _result(index, uploads[index], 'created', media=media)
+
+    for index, first in repeated.items():
+        first_result = results[first]
+        if first_result['status'] == 'error':
+            results[index] = _result(index, uploads[index], 'error', error=first_result['error'])
+        else:
+            results[index] = _result(index, uploads[index], 'duplicate', media=first_result['media'])
+
+    return results
@@ -0,0 +1,110 @@
+"""
+Caché de respuestas de la galería (``gallery``, ``list`` y ``stats``).
+
+Las claves llevan la versión de ``GalleryState``: cualquier cambio en ``Media``
+(``save``, ``delete``, ``update`` masivos del admin, ``bulk_create``...) la
+incrementa y las entradas anteriores simplemente dejan de usarse hasta caducar.
+No hay que borrar nada a mano ni hace falta un servicio externo: sirve cualquier
+backend de caché de Django (memoria local, fichero o base de datos, ver
+``CACHE_BACKEND`` en settings).
+
+La versión se lee de la base de datos (una consulta por clave primaria), así que
+es correcta aunque haya varios procesos de gunicorn cada uno con su caché local.
+
+La misma versión sirve de validador HTTP (``conditional_by_version``): ``ETag`` y
+``Last-Modified`` salen de ``GalleryState`` sin serializar nada, y un
+``If-None-Match`` / ``If-Modified-Since`` que coincide recibe un 304 directamente.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from .models import GalleryState
+
+
+def gallery_cache():
+    return caches[settings.GALLERY_CACHE_ALIAS]
+
+
+def gallery_state(request=None):
+    """``(version, updated_at)`` de la galería (se lee una sola vez por petición)."""
+    if request is not None and hasattr(request, '_gallery_state'):
+        return request._gallery_state
+    state = GalleryState.objects.filter(pk=1).values_list('version', 'updated_at').first() or (0, None)
+    if request is not None:
+        request._gallery_state = state
+    return state
+
+
+def gallery_version(request=None):
+    return gallery_state(request)[0]
+
+
+def _request_fingerprint(request):
+    # Las respuestas llevan URLs absolutas: esquema y host forman parte de la clave
+    query = '&'.join(f'{k}={v}' for k, values in sorted(request.GET.lists()) for v in values)
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_key(prefix, request, version):
+    return f'gallery:{prefix}:v{version}:{_request_fingerprint(request)}'
+
+
+def version_etag(prefix, request):
+    """ETag débil: versión + URL + formato (JSON o API navegable)."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    fmt = getattr(renderer, 'format', 'json')
+    return f'W/"{prefix}-{gallery_version(request)}-{fmt}-{_request_fingerprint(request)[:16]}"'
+
+
+def cached_by_version(prefix):
+    """
+    Cachea el ``response.data`` de una vista de DRF bajo la versión actual.
+    La versión se lee ANTES de consultar los datos: si alguien sube algo a mitad,
+    lo que se guarde queda bajo la versión vieja y nadie lo vuelve a pedir.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = gallery_cache()
+            key = cache_key(prefix, request, gallery_version(request))
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.GALLERY_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_by_version(prefix):
+    """
+    ETag / Last-Modified a partir de la versión de la galería y 304 si el cliente
+    ya tiene esa versión, antes de ejecutar la vista (ni consultas ni serializers).
+    ``Cache-Control`` (``API_CACHE_CONTROL``) permite guardar la respuesta pero
+    obliga a revalidarla, que con el ETag es prácticamente gratis.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            view = condition(
+                etag_func=lambda req, *a, **kw: version_etag(prefix, req),
+                last_modified_func=lambda req, *a, **kw: gallery_state(req)[1],
+            )(lambda req, *a, **kw: method(self, req, *a, **kw))
+
+            response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, **settings.API_CACHE_CONTROL)
+                patch_vary_headers(response, ['Accept'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,65 @@
+"""
+Feed incremental de cambios para los clientes del álbum.
+
+Cada escritura sobre ``Media`` estampa en ``change_seq`` la nueva versión de
+``GalleryState`` (ver ``MediaQuerySet`` y ``Media.save``). Como las versiones se
+confirman en orden, "lo que cambió desde N" es simplemente::
+
+    WHERE change_seq > N ORDER BY change_seq, id     (idx_change_seq)
+
+El cliente recibe un token opaco (la secuencia firmada) y lo devuelve en la
+siguiente consulta. Los archivos ocultados (``status = 0``) o eliminados
+(``status = 2``, borrado lógico) aparecen para que el cliente los quite; los
+borrados físicos (admin) no se notifican.
+"""
+from django.core import signing
+from django.db.models import Q
+
+from .cache import gallery_version
+from .models import Media
+
+TOKEN_SALT = 'wedding_gallery.changes'
+MAX_CHANGES = 500
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def make_token(seq, last_id=0):
+    """``last_id`` > 0: la secuencia ``seq`` quedó a medias (lote masivo partido en páginas)."""
+    return signing.dumps([seq, last_id], salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token):
+    try:
+        seq, last_id = signing.loads(token, salt=TOKEN_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidToken(token)
+    if not all(isinstance(v, int) and v >= 0 for v in (seq, last_id)):
+        raise InvalidToken(token)
+    return seq, last_id
+
+
+def current_token(request=None):
+    return make_token(gallery_version(request))
+
+
+def changes_since(token, request=None, limit=MAX_CHANGES):
+    """
+    ``(filas cambiadas, token siguiente, hay_más)``. La versión se lee antes que
+    las filas: un cambio que se confirme a mitad se volverá a enviar la próxima
+    vez, nunca se pierde.
+    """
+    seq, last_id = read_token(token)
+    current = gallery_version(request)
+
+    after = Q(change_seq__gt=seq)
+    if last_id:
+        after |= Q(change_seq=seq, id__gt=last_id)
+    rows = list(Media.objects.filter(after).order_by('change_seq', 'id')[:limit + 1])
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, make_token(rows[-1].change_seq, rows[-1].pk), True
+    return rows, make_token(max([current, seq] + [m.change_seq for m in rows])), False
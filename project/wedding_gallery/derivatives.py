@@ -0,0 +1,108 @@
+"""
+Derivados responsive de las imágenes subidas.
+
+Para cada imagen se generan varias anchuras (``MEDIA_DERIVATIVE_WIDTHS``) en WebP
+y, si Pillow lo soporta y está activado, también en AVIF. Los ficheros se guardan
+junto al original (misma carpeta de ``get_upload_path``) y sus claves se apuntan
+en ``Media.derivatives``::
+
+    {"webp": {"320": "images/foto_320w.webp", "640": "images/foto_640w.webp"}}
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .placeholders import dominant_color, placeholder_data_uri
+from .similarity import dhash
+
+
+def _avif_supported():
+    try:
+        import pillow_avif  # noqa: F401  (plugin opcional para Pillow < 11.3)
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def available_formats():
+    """Formatos de derivado que se pueden generar con la instalación actual."""
+    formats = ['webp']
+    if settings.MEDIA_DERIVATIVE_AVIF and _avif_supported():
+        formats.append('avif')
+    return formats
+
+
+def derivative_name(object_key, width, fmt):
+    """``images/foto.jpg`` -> ``foto_640w.webp`` (la carpeta la pone get_upload_path)."""
+    stem, _ = os.path.splitext(os.path.basename(object_key))
+    return f'{stem}_{width}w.{fmt}'
+
+
+def _prepare(img, max_width):
+    # En JPEG, draft() deja que el decodificador escale por DCT: mucho menos
+    # trabajo y memoria que decodificar la foto de 12 MP entera.
+    img.draft('RGB', (max_width, max_width))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    return img
+
+
+def render_derivatives(fileobj, widths=None, formats=None):
+    """
+    Decodifica la imagen una sola vez y devuelve ``([(width, fmt, bytes), ...], thumbnail)``,
+    donde ``thumbnail`` es la miniatura más pequeña ya girada según el EXIF (de ella
+    salen el hash perceptual y el placeholder sin volver a decodificar nada).
+    Nunca amplía: las anchuras mayores que el original se descartan (salvo la
+    más pequeña, para que siempre haya al menos una miniatura).
+    """
+    widths = sorted(widths or settings.MEDIA_DERIVATIVE_WIDTHS, reverse=True)
+    formats = formats or available_formats()
+    quality = settings.MEDIA_DERIVATIVE_QUALITY
+
+    rendered = []
+    with Image.open(fileobj) as original:
+        frame = _prepare(original, widths[0])
+        targets = [w for w in widths if w < frame.width] or [min(frame.width, widths[-1])]
+        for width in targets:
+            height = max(1, round(frame.height * width / frame.width))
+            # Reducimos en cascada desde el tamaño anterior: cada paso es más barato
+            frame = frame.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            for fmt in formats:
+                buf = BytesIO()
+                frame.save(buf, fmt.upper(), quality=quality)
+                rendered.append((width, fmt, buf.getvalue()))
+    return rendered, frame
+
+
+def generate_derivatives(media):
+    """
+    Genera y guarda los derivados de ``media`` y actualiza ``media.derivatives``,
+    ``media.phash``, ``media.placeholder`` y ``media.dominant_color``.
+    No guarda la fila: el llamante decide cuándo hacer ``save(update_fields=...)``.
+    """
+    from .models import get_upload_path
+
+    if media.media_type != 'image' or not media.file:
+        return {}
+
+    storage = media.file.storage
+    with storage.open(media.file.name, 'rb') as fh:
+        rendered, thumbnail = render_derivatives(fh)
+    media.phash = dhash(thumbnail)
+    media.placeholder = placeholder_data_uri(thumbnail)
+    media.dominant_color = dominant_color(thumbnail)
+
+    derivatives = {}
+    for width, fmt, data in rendered:
+        name = get_upload_path(media, derivative_name(media.object_key or media.file.name, width, fmt))
+        key = storage.save(name, ContentFile(data))
+        derivatives.setdefault(fmt, {})[str(width)] = key
+
+    media.derivatives = derivatives
+    return derivatives
+
@@ -0,0 +1,348 @@
+"""
+Subidas directas al almacenamiento con URLs prefirmadas.
+
+1. ``POST /api/uploads/``: se crea una ``UploadSession`` y se devuelven las URLs
+   (una por parte de ``DIRECT_UPLOAD_PART_SIZE``).
+2. El cliente sube cada parte con ``PUT`` directamente a esa URL.
+3. ``POST /api/uploads/{id}/finalize/``: se comprueban el tamaño y los *magic
+   bytes* (tienen que ser del tipo declarado), se crea el ``Media`` y se encola
+   el procesado (el hash declarado se verifica en el job).
+
+La subida se puede reanudar: ``GET /api/uploads/{id}/`` dice qué partes ya están
+en el almacenamiento (``offset`` = bytes confirmados de forma contigua) y vuelve
+a firmar las URLs de las que faltan, así que tras un corte solo se reenvía la
+parte que estaba a medias.
+
+Con S3 las URLs apuntan al bucket (``put_object`` o ``upload_part`` multipart) y
+Django no toca los bytes. En modo local (``FileSystemStorage``) apuntan a
+``PUT /api/uploads/{id}/parts/{n}/`` firmadas con ``django.core.signing``, así el
+mismo cliente funciona sin S3.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+
+from .models import Media, UploadSession, get_upload_path, unique_filename
+from .serializers import ALLOWED_IMAGE_TYPES, ALLOWED_VIDEO_TYPES
+from .storage import RangedReader, bucket_name, is_s3, s3_client
+from .uploadhandlers import SNIFF_BYTES, sniff_mime_type
+
+PART_TOKEN_SALT = 'wedding_gallery.direct_upload.part'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class DirectUploadError(Exception):
+    """La subida no es válida (se responde con 400)."""
+
+
+def object_key_for(session_id, filename):
+    """``IMG_0001.jpg`` -> ``images/IMG_0001_1a2b3c4d.jpg`` (único por sesión)."""
+    return get_upload_path(None, unique_filename(filename, session_id))
+
+
+def part_range(session, part_number):
+    start = (part_number - 1) * session.part_size
+    return start, min(start + session.part_size, session.total_bytes)
+
+
+# ----------------- Creación de la sesión -----------------
+
+def create_session(filename, total_bytes, mime_type, sha256=''):
+    session = UploadSession(
+        filename=filename,
+        mime_type=mime_type,
+        total_bytes=total_bytes,
+        part_size=settings.DIRECT_UPLOAD_PART_SIZE,
+        sha256=sha256,
+    )
+    session.object_key = object_key_for(session.id, filename)
+
+    if is_s3() and session.part_count > 1:
+        response = s3_client().create_multipart_upload(
+            Bucket=bucket_name(), Key=session.object_key, ContentType=mime_type
+        )
+        session.s3_upload_id = response['UploadId']
+
+    session.save()
+    return session
+
+
+def part_url(session, part_number, request):
+    expires = settings.DIRECT_UPLOAD_URL_EXPIRES
+    if is_s3():
+        if session.s3_upload_id:
+            return s3_client().generate_presigned_url('upload_part', Params={
+                'Bucket': bucket_name(),
+                'Key': session.object_key,
+                'UploadId': session.s3_upload_id,
+                'PartNumber': part_number,
+            }, ExpiresIn=expires)
+        return s3_client().generate_presigned_url('put_object', Params={
+            'Bucket': bucket_name(),
+            'Key': session.object_key,
+            'ContentType': session.mime_type,
+        }, ExpiresIn=expires)
+
+    token = signing.dumps({'s': str(session.pk), 'p': part_number}, salt=PART_TOKEN_SALT)
+    url = reverse('wedding_gallery:upload-part', kwargs={'pk': session.pk, 'part_number': part_number})
+    return request.build_absolute_uri(f'{url}?token={token}')
+
+
+def describe_parts(session, request, part_numbers=None):
+    """Lo que necesita el cliente para subir cada parte."""
+    parts = []
+    for number in part_numbers or range(1, session.part_count + 1):
+        start, end = part_range(session, number)
+        parts.append({
+            'part_number': number,
+            'start': start,
+            'end': end,
+            'method': 'PUT',
+            'url': part_url(session, number, request),
+        })
+    return parts
+
+
+# ----------------- Partes en modo local -----------------
+
+def _parts_dir(session):
+    base = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+    return os.path.join(base, 'wedding_uploads', str(session.pk))
+
+
+def _part_path(session, part_number):
+    return os.path.join(_parts_dir(session), f'{part_number:05d}.part')
+
+
+def verify_part_token(session, part_number, token):
+    try:
+        data = signing.loads(token or '', salt=PART_TOKEN_SALT, max_age=settings.DIRECT_UPLOAD_URL_EXPIRES)
+    except signing.BadSignature:
+        return False
+    return data == {'s': str(session.pk), 'p': part_number}
+
+
+def write_local_part(session, part_number, stream):
+    """Vuelca el cuerpo de la petición a disco por bloques. Devuelve el ETag (MD5, como S3)."""
+    if not 1 <= part_number <= session.part_count:
+        raise DirectUploadError(f'Parte {part_number} fuera de rango')
+    start, end = part_range(session, part_number)
+    expected = end - start
+
+    os.makedirs(_parts_dir(session), exist_ok=True)
+    path = _part_path(session, part_number)
+    md5 = hashlib.md5()
+    written = 0
+    with open(f'{path}.tmp', 'wb') as fh:
+        for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+            written += len(chunk)
+            if written > expected:
+                break
+            fh.write(chunk)
+            md5.update(chunk)
+
+    if written != expected:
+        os.remove(f'{path}.tmp')
+        raise DirectUploadError(f'La parte {part_number} debe tener {expected} bytes')
+    etag = f'"{md5.hexdigest()}"'
+    with open(f'{path}.etag', 'w') as fh:
+        fh.write(etag)
+    # La parte solo cuenta como subida cuando está completa en su sitio
+    os.replace(f'{path}.tmp', path)
+    return etag
+
+
+def _local_parts(session):
+    parts = []
+    for number in range(1, session.part_count + 1):
+        path = _part_path(session, number)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(f'{path}.etag') as fh:
+                etag = fh.read()
+        except FileNotFoundError:
+            etag = ''
+        parts.append({'part_number': number, 'size': os.path.getsize(path), 'etag': etag})
+    return parts
+
+
+def _assemble_local(session):
+    """Une las partes en el storage. Devuelve (clave, tamaño, sha256)."""
+    hasher = hashlib.sha256()
+    with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as out:
+        for number in range(1, session.part_count + 1):
+            path = _part_path(session, number)
+            if not os.path.exists(path):
+                raise DirectUploadError(f'Falta la parte {number}')
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(COPY_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    out.write(chunk)
+        size = out.tell()
+        out.seek(0)
+        key = default_storage.save(session.object_key, File(out, name=session.object_key))
+    shutil.rmtree(_parts_dir(session), ignore_errors=True)
+    return key, size, hasher.hexdigest()
+
+
+# ----------------- Estado (reanudar) -----------------
+
+def _s3_parts(session):
+    client = s3_client()
+    try:
+        if not session.s3_upload_id:
+            head = client.head_object(Bucket=bucket_name(), Key=session.object_key)
+            return [{'part_number': 1, 'size': head['ContentLength'], 'etag': head['ETag']}]
+
+        parts = []
+        paginator = client.get_paginator('list_parts')
+        for page in paginator.paginate(
+            Bucket=bucket_name(), Key=session.object_key, UploadId=session.s3_upload_id
+        ):
+            parts.extend(
+                {'part_number': p['PartNumber'], 'size': p['Size'], 'etag': p['ETag']}
+                for p in page.get('Parts', [])
+            )
+        return parts
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return []
+        raise DirectUploadError(f'No se pudo consultar la subida: {e}')
+
+
+def uploaded_parts(session):
+    """
+    Partes completas que ya están en el almacenamiento: ``[{part_number, size, etag}]``.
+    Una parte con un tamaño distinto del esperado (subida cortada) no cuenta.
+    """
+    parts = _s3_parts(session) if is_s3() else _local_parts(session)
+    complete = []
+    for part in parts:
+        start, end = part_range(session, part['part_number'])
+        if part['part_number'] <= session.part_count and part['size'] == end - start:
+            complete.append(part)
+    return sorted(complete, key=lambda p: p['part_number'])
+
+
+def committed_offset(session, parts):
+    """Bytes confirmados de forma contigua desde el principio del archivo."""
+    offset = 0
+    numbers = {p['part_number'] for p in parts}
+    for number in range(1, session.part_count + 1):
+        if number not in numbers:
+            break
+        offset = part_range(session, number)[1]
+    return offset
+
+
+def describe_status(session, request):
+    parts = uploaded_parts(session)
+    done = {p['part_number'] for p in parts}
+    missing = [n for n in range(1, session.part_count + 1) if n not in done]
+    return {
+        'id': session.pk,
+        'state': session.state,
+        'total_bytes': session.total_bytes,
+        'part_size': session.part_size,
+        'offset': committed_offset(session, parts),
+        'uploaded_parts': parts,
+        'headers': {'Content-Type': session.mime_type},
+        'parts': describe_parts(session, request, missing) if missing else [],
+    }
+
+
+# ----------------- Finalización -----------------
+
+def _complete_s3(session, parts):
+    client = s3_client()
+    if session.s3_upload_id and not parts:
+        # El cliente puede haber perdido los ETag al reanudar: se los pedimos a S3
+        parts = uploaded_parts(session)
+    try:
+        if session.s3_upload_id:
+            numbers = sorted(p['part_number'] for p in parts)
+            if numbers != list(range(1, session.part_count + 1)):
+                raise DirectUploadError(f'Se esperaban {session.part_count} partes')
+            client.complete_multipart_upload(
+                Bucket=bucket_name(),
+                Key=session.object_key,
+                UploadId=session.s3_upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': p['part_number'], 'ETag': p['etag']}
+                    for p in sorted(parts, key=lambda p: p['part_number'])
+                ]},
+            )
+        head = client.head_object(Bucket=bucket_name(), Key=session.object_key)
+    except ClientError as e:
+        raise DirectUploadError(f'No se pudo completar la subida: {e}')
+    return session.object_key, head['ContentLength']
+
+
+def content_matches(sniffed, declared):
+    """
+    Los *magic bytes* tienen que ser de un tipo permitido y de la misma familia
+    (imagen o vídeo) que el declarado: un MOV declarado como MP4 vale, un HTML no.
+    """
+    if sniffed not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES:
+        return False
+    return sniffed.split('/')[0] == declared.split('/')[0]
+
+
+def _reject(session, key, message):
+    default_storage.delete(key)
+    session.state = 'aborted'
+    session.save(update_fields=['state', 'updated_at'])
+    raise DirectUploadError(message)
+
+
+def finalize_session(session, parts=None):
+    """Comprueba lo subido y crea el Media (que encola su procesado)."""
+    if session.state != 'open':
+        raise DirectUploadError('La subida ya está cerrada')
+
+    sha256 = None
+    if is_s3():
+        key, size = _complete_s3(session, parts or [])
+    else:
+        key, size, sha256 = _assemble_local(session)
+
+    if size != session.total_bytes or (sha256 and session.sha256 and sha256 != session.sha256):
+        _reject(session, key, 'El archivo recibido no coincide con el declarado (tamaño o hash)')
+    with RangedReader(key) as reader:
+        sniffed = sniff_mime_type(reader.read(0, SNIFF_BYTES))
+    if not content_matches(sniffed, session.mime_type):
+        _reject(session, key, 'El contenido del archivo no es del tipo declarado')
+
+    # El fichero ya está en el storage: Media solo apunta a él (no se vuelve a subir).
+    # Con S3 el hash declarado lo verifica el job 'hash' (ver jobs.py).
+    media = Media(file=key, object_key=key, bytes=size, sha256=sha256, mime_type=session.mime_type)
+    with transaction.atomic():
+        media.save()
+        session.media = media
+        session.state = 'complete'
+        session.save(update_fields=['media', 'state', 'updated_at'])
+    return media
+
+
+def abort_session(session):
+    if session.s3_upload_id:
+        try:
+            s3_client().abort_multipart_upload(
+                Bucket=bucket_name(), Key=session.object_key, UploadId=session.s3_upload_id
+            )
+        except ClientError:
+            pass
+    elif not is_s3():
+        shutil.rmtree(_parts_dir(session), ignore_errors=True)
+    session.state = 'aborted'
+    session.save(update_fields=['state', 'updated_at'])
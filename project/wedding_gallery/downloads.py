@@ -0,0 +1,259 @@
+"""
+Descarga de un ``Media`` como adjunto (``GET /api/media/{id}/download/``).
+
+El archivo se resuelve por id, nunca por una URL del cliente, y se sirve de la
+forma más barata posible:
+
+- S3 con ``MEDIA_DOWNLOAD_REDIRECT`` (por defecto): redirección a una URL
+  prefirmada de pocos minutos con ``Content-Disposition: attachment``. Los bytes
+  van directamente del bucket al navegador.
+- S3 sin redirección (bucket no accesible desde fuera, p.ej. MinIO interno):
+  ``get_object`` con el cliente boto3 compartido (pool de conexiones keep-alive)
+  reenviando ``Range`` / ``If-None-Match`` y devolviendo 206/304 con ``ETag``.
+- Local: el fichero desde disco, también con soporte de ``Range`` (o, con
+  ``MEDIA_ACCEL_REDIRECT``, lo manda el proxy; ver serving.py).
+
+Con ``Range`` el navegador puede reanudar descargas y hacer seek en los vídeos.
+
+Bajo ASGI Django acumula entera en memoria cualquier respuesta streaming con un
+iterador síncrono antes de mandar el primer byte; ``streaming_body`` lo
+convierte en uno asíncrono que pide los trozos de uno en uno (en WSGI no cambia
+nada).
+"""
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date
+
+from .serializers import ALLOWED_IMAGE_TYPES, ALLOWED_VIDEO_TYPES
+from .storage import bucket_name, is_s3, s3_client
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Lo único que se muestra en el navegador (las miniaturas pueden ser AVIF); el
+# resto se descarga como adjunto aunque se pida inline
+INLINE_CONTENT_TYPES = frozenset(ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES + ['image/avif'])
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+_END = object()
+
+
+async def _async_chunks(iterator):
+    # Cada trozo se lee en el hilo síncrono de la petición: nunca hay más de uno en memoria
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(iterator, _END)) is not _END:
+        yield chunk
+
+
+def is_asgi(request):
+    # Desde un ViewSet llega el Request de DRF, que envuelve al de Django
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def streaming_body(request, iterable):
+    """Cuerpo para ``StreamingHttpResponse``: bajo ASGI, un iterador asíncrono trozo a trozo."""
+    return _async_chunks(iter(iterable)) if is_asgi(request) else iterable
+
+
+def parse_range(header, size):
+    """
+    ``(inicio, fin)`` inclusivos de un ``Range: bytes=...`` con un solo rango, o
+    ``None`` si no hay cabecera o no se entiende (se sirve el fichero entero).
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-500: los últimos 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def attachment_name(media):
+    return os.path.basename(media.object_key or media.file.name)
+
+
+def _disposition(media):
+    return content_disposition_header(as_attachment=True, filename=attachment_name(media))
+
+
+def _not_satisfiable(size):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+# ----------------- S3 -----------------
+
+def _presigned_redirect(media):
+    url = s3_client().generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket_name(),
+            'Key': media.object_key or media.file.name,
+            'ResponseContentDisposition': _disposition(media),
+        },
+        ExpiresIn=settings.MEDIA_DOWNLOAD_URL_EXPIRES,
+    )
+    response = HttpResponseRedirect(url)
+    # La URL caduca: que nadie guarde la redirección
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def _iter_body(body):
+    try:
+        yield from body.iter_chunks(chunk_size=settings.MEDIA_DOWNLOAD_CHUNK_SIZE)
+    finally:
+        # Si el cliente corta, la conexión vuelve al pool en vez de quedarse colgada
+        body.close()
+
+
+def _s3_proxy(media, request):
+    params = {'Bucket': bucket_name(), 'Key': media.object_key or media.file.name}
+    if 'Range' in request.headers:
+        params['Range'] = request.headers['Range']
+    if 'If-None-Match' in request.headers:
+        params['IfNoneMatch'] = request.headers['If-None-Match']
+
+    try:
+        obj = s3_client().get_object(**params)
+    except ClientError as e:
+        error = e.response.get('Error', {}).get('Code')
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if status == 304 or error == 'NotModified':
+            response = HttpResponse(status=304)
+            response['ETag'] = request.headers['If-None-Match']
+            return response
+        if error == 'InvalidRange':
+            return _not_satisfiable(media.bytes or 0)
+        if error in ('NoSuchKey', '404'):
+            return HttpResponse(status=404)
+        raise
+
+    response = StreamingHttpResponse(
+        streaming_body(request, _iter_body(obj['Body'])),
+        status=206 if 'ContentRange' in obj else 200,
+        content_type=obj.get('ContentType') or media.mime_type or 'application/octet-stream',
+    )
+    response['Content-Length'] = obj['ContentLength']
+    response['X-Content-Type-Options'] = 'nosniff'
+    if 'ContentRange' in obj:
+        response['Content-Range'] = obj['ContentRange']
+    if 'ETag' in obj:
+        response['ETag'] = obj['ETag']
+    if 'LastModified' in obj:
+        response['Last-Modified'] = http_date(obj['LastModified'].timestamp())
+    return response
+
+
+# ----------------- Local -----------------
+
+def _ranged_file(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(path, request, content_type, etag=None, filename=None, as_attachment=True, accel_key=None):
+    """
+    Fichero local con ``Range`` (206/416) y ``If-None-Match`` (304). Con
+    ``MEDIA_ACCEL_REDIRECT`` y ``accel_key`` (clave dentro de ``MEDIA_ROOT``) el
+    envío se delega en el proxy con ``X-Accel-Redirect``. Fuera de
+    ``INLINE_CONTENT_TYPES`` siempre se manda como adjunto.
+    """
+    as_attachment = as_attachment or content_type not in INLINE_CONTENT_TYPES
+    if etag and etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    if accel_key and settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(accel_key)
+        response['X-Content-Type-Options'] = 'nosniff'
+        if as_attachment:
+            response['Content-Disposition'] = content_disposition_header(
+                as_attachment=True, filename=filename or os.path.basename(path)
+            )
+        return response
+
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        return _not_satisfiable(size)
+    # If-Range con otro ETag: el fichero cambió, se manda entero
+    if byte_range and etag and request.headers.get('If-Range', etag) != etag:
+        byte_range = None
+
+    if byte_range is None:
+        response = FileResponse(
+            open(path, 'rb'), content_type=content_type,
+            as_attachment=as_attachment, filename=filename or os.path.basename(path),
+        )
+        response.block_size = settings.MEDIA_DOWNLOAD_CHUNK_SIZE
+        if is_asgi(request):
+            # FileResponse también es streaming síncrono. Solo bajo ASGI: reasignar el
+            # contenido quita file_to_stream, que es lo que usa sendfile en WSGI
+            response.streaming_content = streaming_body(request, response.streaming_content)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            streaming_body(request, _ranged_file(path, start, end - start + 1, settings.MEDIA_DOWNLOAD_CHUNK_SIZE)),
+            status=206, content_type=content_type,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        if as_attachment:
+            response['Content-Disposition'] = content_disposition_header(
+                as_attachment=True, filename=filename or os.path.basename(path)
+            )
+
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(os.path.getmtime(path))
+    return response
+
+
+def serve_download(media, request):
+    if is_s3():
+        if settings.MEDIA_DOWNLOAD_REDIRECT:
+            return _presigned_redirect(media)
+        response = _s3_proxy(media, request)
+        response['Accept-Ranges'] = 'bytes'
+        if response.status_code in (200, 206):
+            response['Content-Disposition'] = _disposition(media)
+        return response
+
+    # El contenido no cambia nunca para un mismo Media: su hash es un ETag fuerte
+    etag = f'"{media.sha256}"' if media.sha256 else None
+    return serve_file(
+        media.file.path, request,
+        content_type=media.mime_type or 'application/octet-stream',
+        etag=etag, filename=attachment_name(media), accel_key=media.file.name,
+    )
@@ -0,0 +1,179 @@
+"""
+Notificaciones en tiempo real para el álbum (Server-Sent Events sobre ASGI).
+
+Cada proceso tiene un único ``EventHub``: espera a que cambie la galería, lee el
+feed de cambios (changes.py) una vez, lo serializa una vez y lo reparte a todas
+las conexiones abiertas del proceso. Un evento cuesta una consulta por proceso,
+no una por invitado conectado.
+
+Cómo se entera el hub de que hay cambios lo decide ``MEDIA_EVENTS_BACKEND``:
+
+- ``DatabasePollingBackend`` (por defecto): mira la versión de la galería cada
+  ``MEDIA_EVENTS_POLL_SECONDS`` (una lectura por clave primaria). Funciona con
+  varios procesos y con el worker de trabajos sin ningún broker.
+- ``LocalBackend``: solo se despierta cuando este mismo proceso confirma un
+  cambio (``notify_change``). Suficiente con un único proceso (desarrollo).
+
+En ambos casos ``GalleryState.bump`` avisa al hub del propio proceso al hacer
+commit, así que los cambios locales se notifican al instante.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from .cache import gallery_version
+from .changes import changes_since, make_token
+
+logger = logging.getLogger(__name__)
+
+# Una subida genera varios commits seguidos (fila, trabajos, miniaturas...):
+# se espera un poco para mandarlos en un solo evento
+COALESCE_SECONDS = 0.5
+
+
+class LocalBackend:
+    """Espera a que alguien llame a ``wake`` (commit en este proceso)."""
+
+    # Aunque no haya cambios, el hub revisa de vez en cuando si le quedan suscriptores
+    idle_timeout = 30
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def wake(self):
+        self._event.set()
+
+    async def wait(self):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=self.idle_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+class DatabasePollingBackend(LocalBackend):
+    """Como ``LocalBackend``, pero además revisa la versión cada pocos segundos."""
+
+    @property
+    def idle_timeout(self):
+        return settings.MEDIA_EVENTS_POLL_SECONDS
+
+
+def _load_changes(token):
+    """Todo lo cambiado desde ``token`` ya serializado: ``(cambios, token nuevo)``."""
+    from .serializers import MediaChangeSerializer
+
+    close_old_connections()
+    rows, has_more = [], True
+    while has_more:
+        page, token, has_more = changes_since(token)
+        rows.extend(page)
+    return MediaChangeSerializer(rows, many=True).data, token
+
+
+def format_event(changes, token):
+    data = json.dumps({'changes': changes, 'token': token}, separators=(',', ':'), default=str)
+    return f'event: changes\nid: {token}\ndata: {data}\n\n'
+
+
+class EventHub:
+    """Reparto en el propio proceso: una cola por conexión SSE."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.subscribers = set()
+        self.loop = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=settings.MEDIA_EVENTS_QUEUE_SIZE)
+        queue.overflowed = False
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.loop = asyncio.get_running_loop()
+            self.task = self.loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def notify(self):
+        """Se puede llamar desde cualquier hilo (p.ej. un ``on_commit`` de una vista síncrona)."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.backend.wake)
+
+    def broadcast(self, message):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: se le cierra y al reconectar se pone al día
+                queue.overflowed = True
+                self.subscribers.discard(queue)
+
+    async def _run(self):
+        version = await sync_to_async(gallery_version)()
+        token = make_token(version)
+        try:
+            while self.subscribers:
+                await self.backend.wait()
+                if not self.subscribers:
+                    break
+                await asyncio.sleep(COALESCE_SECONDS)
+                current = await sync_to_async(gallery_version)()
+                if current == version:
+                    continue
+                changes, token = await sync_to_async(_load_changes)(token)
+                version = current
+                if changes:
+                    self.broadcast(format_event(changes, token))
+        except Exception:
+            logger.exception("El hub de eventos se ha detenido")
+        finally:
+            self.task = None
+
+
+_hub = None
+
+
+def get_hub():
+    global _hub
+    if _hub is None:
+        backend = import_string(settings.MEDIA_EVENTS_BACKEND)()
+        _hub = EventHub(backend)
+    return _hub
+
+
+def notify_change():
+    """Avisar al hub de este proceso (``GalleryState.bump`` lo llama en el commit)."""
+    if _hub is not None:
+        _hub.notify()
+
+
+async def event_stream(since=None):
+    """Generador SSE de una conexión: ponerse al día desde ``since`` y luego escuchar."""
+    hub = get_hub()
+    queue = hub.subscribe()
+    try:
+        # Reintento del navegador si se corta la conexión
+        yield f'retry: {settings.MEDIA_EVENTS_RETRY_MS}\n\n'
+        if since:
+            changes, token = await sync_to_async(_load_changes)(since)
+            if changes:
+                yield format_event(changes, token)
+
+        while not queue.overflowed:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.MEDIA_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ': ping\n\n'
+                continue
+            yield message
+    finally:
+        hub.unsubscribe(queue)
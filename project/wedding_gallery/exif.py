@@ -0,0 +1,94 @@
+"""
+Fecha de captura y cámara a partir del EXIF de las fotos.
+
+``created_at`` es el momento de la subida: una foto subida tres días después
+acaba arriba del todo. ``DateTimeOriginal`` dice cuándo se hizo de verdad y
+permite ordenar el álbum por momentos (ceremonia, banquete, baile...).
+
+El EXIF va en la cabecera del fichero (en JPEG, el segmento APP1 de como mucho
+64 KB antes de los píxeles), así que basta con la cabecera que ya lee
+``MediaUploadHandler`` o con una lectura por rango de unos KB.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import ExifTags, Image
+
+from .storage import RangedReader
+
+# Lo que hay que leer del principio del fichero para encontrar el EXIF
+HEADER_BYTES = 128 * 1024
+
+EXIF_DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+# Fechas de cámaras sin la hora configurada (1970, 2000-01-01...) no sirven de nada
+MIN_YEAR = 2001
+# Orientaciones EXIF giradas 90°/270°: la foto se muestra con ancho y alto cambiados
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def wedding_time_zone():
+    """Zona horaria del evento: para las fechas EXIF sin zona y para agrupar por hora/día."""
+    return ZoneInfo(settings.WEDDING_TIME_ZONE)
+
+
+def parse_exif_datetime(value, offset=None):
+    """``'2024:06:15 18:30:05'`` (+ ``'+02:00'`` opcional) -> datetime con zona, o ``None``."""
+    if not isinstance(value, str):
+        return None
+    try:
+        naive = datetime.strptime(value.strip('\x00 ')[:19], EXIF_DATETIME_FORMAT)
+    except ValueError:
+        return None  # '0000:00:00 00:00:00', vacío, formatos raros de algunas cámaras
+    if naive.year < MIN_YEAR:
+        return None
+
+    if isinstance(offset, str) and len(offset) >= 6 and offset[0] in '+-':
+        try:
+            hours, minutes = int(offset[1:3]), int(offset[4:6])
+        except ValueError:
+            pass
+        else:
+            delta = timedelta(hours=hours, minutes=minutes)
+            return naive.replace(tzinfo=dt_timezone(delta if offset[0] == '+' else -delta))
+    # Sin OffsetTimeOriginal la hora es la local de la cámara: la del evento
+    return timezone.make_aware(naive, wedding_time_zone())
+
+
+def read_exif(img):
+    """
+    ``{'taken_at', 'camera_model', 'size'}`` de una imagen de Pillow ya abierta
+    (sin decodificar píxeles). ``size`` es ``(ancho, alto)`` tal como se muestra,
+    ya girado según la orientación EXIF (los móviles guardan casi todo apaisado).
+    """
+    try:
+        exif = img.getexif()
+        details = exif.get_ifd(ExifTags.IFD.Exif)
+    except Exception:
+        return {'taken_at': None, 'camera_model': '', 'size': img.size}
+
+    taken_at = parse_exif_datetime(
+        details.get(ExifTags.Base.DateTimeOriginal), details.get(ExifTags.Base.OffsetTimeOriginal)
+    ) or parse_exif_datetime(
+        details.get(ExifTags.Base.DateTimeDigitized), details.get(ExifTags.Base.OffsetTimeDigitized)
+    )
+    model = exif.get(ExifTags.Base.Model)
+    camera_model = model.strip('\x00 ')[:64] if isinstance(model, str) else ''
+    width, height = img.size
+    if exif.get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    return {'taken_at': taken_at, 'camera_model': camera_model, 'size': (width, height)}
+
+
+def probe(name):
+    """EXIF de la imagen ``name`` del storage con una sola lectura por rango de la cabecera."""
+    with RangedReader(name) as reader:
+        head = reader.read(0, HEADER_BYTES)
+    try:
+        with Image.open(BytesIO(head)) as img:
+            return read_exif(img)
+    except Exception:
+        # Formato sin EXIF en la cabecera (o cabecera enorme): no hay fecha
+        return {'taken_at': None, 'camera_model': '', 'size': None}
@@ -0,0 +1,299 @@
+"""
+Cola de trabajos en segundo plano respaldada por la base de datos.
+
+La subida solo guarda el fichero y la fila ``Media``; todo lo que implica leer el
+fichero desde el storage (hash, dimensiones, miniaturas, metadatos de vídeo) se
+encola como ``ProcessingJob`` y lo ejecuta ``manage.py process_media_jobs``.
+
+Con ``MEDIA_JOBS_EAGER=True`` (por defecto en DEBUG) los trabajos se ejecutan
+al terminar la transacción de la propia petición, sin necesidad de worker.
+"""
+import logging
+import os
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .derivatives import generate_derivatives
+from .models import Media, ProcessingJob, UploadSession, unique_filename
+from .similarity import link_similar
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """Error que no se arregla reintentando: el trabajo pasa directamente a fallido."""
+
+
+class DeferJob(Exception):
+    """El trabajo aún no puede ejecutarse: vuelve a la cola sin gastar un intento."""
+
+
+def job_handler(kind):
+    """Registra la función que ejecuta los trabajos de tipo ``kind``."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+# ----------------- Handlers -----------------
+
+@job_handler('hash')
+def _run_hash(media, job):
+    media.sha256 = media._calculate_hash()
+    media.bytes = media.file.storage.size(media.file.name)
+
+    # Subidas directas: el hash declarado por el cliente tiene que cuadrar
+    # (salvo que el fichero ya se haya reescrito con faststart)
+    declared = UploadSession.objects.filter(media=media).values_list('sha256', flat=True).first()
+    rewritten = ProcessingJob.objects.filter(media=media, kind='faststart', state='done').exists()
+    if declared and declared != media.sha256 and not rewritten:
+        media.status = 0
+        media.save(update_fields=['sha256', 'bytes', 'status'])
+        raise PermanentJobError(f"SHA256 declarado {declared} != real {media.sha256}; archivo oculto")
+    media.save(update_fields=['sha256', 'bytes'])
+
+
+@job_handler('dimensions')
+def _run_dimensions(media, job):
+    media._calculate_image_metadata()
+    media.save(update_fields=['width', 'height', 'taken_at', 'camera_model'])
+
+
+@job_handler('derivatives')
+def _run_derivatives(media, job):
+    generate_derivatives(media)
+    media.save(update_fields=['derivatives', 'phash', 'placeholder', 'dominant_color'])
+    # Comparación con el resto del álbum en memoria (ver similarity.py)
+    link_similar(media)
+
+
+@job_handler('video_metadata')
+def _run_video_metadata(media, job):
+    media._calculate_video_metadata()
+    media.save(update_fields=['duration_ms', 'width', 'height', 'video_codec', 'taken_at'])
+
+
+@job_handler('faststart')
+def _run_faststart(media, job):
+    from . import mp4
+
+    # El fichero original se borra al terminar: no hacerlo mientras otro trabajo lo está leyendo
+    busy = ProcessingJob.objects.filter(media=media, state__in=['pending', 'running']).exclude(pk=job.pk)
+    if busy.exists():
+        raise DeferJob("Esperando a que terminen los demás trabajos de este archivo")
+
+    # Clave nueva: lo ya publicado nunca cambia de contenido (sus URLs se cachean
+    # como inmutables, ver serving.py)
+    old_key = media.file.name
+    new_key = os.path.join(os.path.dirname(old_key), unique_filename(old_key))
+    try:
+        result = mp4.faststart(old_key, new_key, content_type=media.mime_type)
+    except mp4.NotIsoBmff:
+        return
+    if result is None:
+        return  # moov ya estaba delante
+    sha256, size = result
+
+    # Cambio de clave en un solo UPDATE; si mientras tanto el archivo cambió, se descarta la copia
+    with transaction.atomic():
+        switched = Media.objects.filter(pk=media.pk, file=old_key).update(
+            file=new_key, object_key=new_key, sha256=sha256, bytes=size,
+            # Para deduplicar se sigue reconociendo el fichero tal como se subió
+            original_sha256=media.original_sha256 or media.sha256,
+        )
+        if switched:
+            transaction.on_commit(lambda: default_storage.delete(old_key), robust=True)
+    if not switched:
+        default_storage.delete(new_key)
+
+
+# ----------------- Encolado -----------------
+
+# Contenedores ISO-BMFF (los que tienen moov / mdat)
+FASTSTART_MIME_TYPES = {'video/mp4', 'video/quicktime'}
+
+def default_job_kinds(media):
+    """
+    Trabajos que necesita un Media recién subido. Lo que ya calculó el upload
+    handler durante la subida (hash, dimensiones) no se vuelve a encolar.
+    """
+    kinds = [] if media.sha256 else ['hash']
+    if media.media_type == 'image':
+        if media.width is None:
+            kinds.append('dimensions')
+        kinds.append('derivatives')
+    elif media.media_type == 'video':
+        kinds.append('video_metadata')
+        # El último: reescribe el fichero cuando los demás ya lo han leído
+        if settings.MEDIA_FASTSTART and media.mime_type in FASTSTART_MIME_TYPES:
+            kinds.append('faststart')
+    return kinds
+
+
+def enqueue(media, kinds, payload=None):
+    """Crea los trabajos ``kinds`` para ``media`` y lo marca como pendiente."""
+    if not kinds:
+        return []
+    jobs = ProcessingJob.objects.bulk_create([
+        ProcessingJob(media=media, kind=kind, payload=payload or {}) for kind in kinds
+    ])
+    Media.objects.filter(pk=media.pk).update_internal(processing_state='pending')
+    media.processing_state = 'pending'
+
+    if settings.MEDIA_JOBS_EAGER:
+        transaction.on_commit(lambda: run_pending(media_id=media.pk))
+    return jobs
+
+
+def enqueue_media_jobs(media):
+    kinds = default_job_kinds(media)
+    if not kinds:
+        Media.objects.filter(pk=media.pk).exclude(processing_state='ready').update(processing_state='ready')
+        media.processing_state = 'ready'
+    return enqueue(media, kinds)
+
+
+def enqueue_many(media_list):
+    """``enqueue_media_jobs`` para muchos Media a la vez (subida por lotes)."""
+    jobs, pending, ready = [], [], []
+    for media in media_list:
+        kinds = default_job_kinds(media)
+        jobs.extend(ProcessingJob(media=media, kind=kind) for kind in kinds)
+        media.processing_state = 'pending' if kinds else 'ready'
+        (pending if kinds else ready).append(media.pk)
+
+    ProcessingJob.objects.bulk_create(jobs)
+    if pending:
+        Media.objects.filter(pk__in=pending).update_internal(processing_state='pending')
+    if ready:
+        Media.objects.filter(pk__in=ready).exclude(processing_state='ready').update(processing_state='ready')
+
+    if pending and settings.MEDIA_JOBS_EAGER:
+        transaction.on_commit(lambda: [run_pending(media_id=pk) for pk in pending])
+    return jobs
+
+
+# ----------------- Ejecución -----------------
+
+def retry_delay(attempts):
+    """Backoff exponencial: base, 2*base, 4*base... con tope."""
+    delay = settings.MEDIA_JOBS_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.MEDIA_JOBS_RETRY_MAX_SECONDS))
+
+
+def claim_jobs(limit, media_id=None):
+    """
+    Toma hasta ``limit`` trabajos listos y los marca como ``running``.
+    ``SKIP LOCKED`` permite varios workers sin que se pisen. Los trabajos
+    ``running`` cuyo worker murió (lock caducado) se vuelven a tomar.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.MEDIA_JOBS_LOCK_TIMEOUT)
+    ready = Q(state='pending', run_after__lte=now) | Q(state='running', locked_at__lt=stale)
+
+    with transaction.atomic():
+        qs = ProcessingJob.objects.filter(ready)
+        if media_id is not None:
+            qs = qs.filter(media_id=media_id)
+        ids = list(
+            qs.select_for_update(skip_locked=True)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            ProcessingJob.objects.filter(id__in=ids).update(
+                state='running', locked_at=now, attempts=F('attempts') + 1
+            )
+    return ids
+
+
+def run_job(job_id):
+    """Ejecuta un trabajo ya reclamado. Devuelve el estado final."""
+    job = ProcessingJob.objects.select_related('media').get(pk=job_id)
+    media = job.media
+    Media.objects.filter(pk=media.pk, processing_state='pending').update_internal(processing_state='processing')
+
+    try:
+        JOB_HANDLERS[job.kind](media, job)
+    except DeferJob as e:
+        job.state = 'pending'
+        job.run_after = timezone.now() + retry_delay(1)
+        job.attempts -= 1
+        job.last_error = str(e)
+    except Exception as e:
+        job.last_error = f"{e}\n{traceback.format_exc()}"
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            job.state = 'failed'
+            logger.error("Trabajo %s agotó sus reintentos: %s", job, e)
+        else:
+            job.state = 'pending'
+            job.run_after = timezone.now() + retry_delay(job.attempts)
+            logger.warning("Trabajo %s falló (intento %s), reintento en %s", job, job.attempts, job.run_after)
+    else:
+        job.state = 'done'
+        job.last_error = ''
+    job.locked_at = None
+    job.save(update_fields=['state', 'run_after', 'locked_at', 'attempts', 'last_error', 'updated_at'])
+
+    refresh_processing_state(media.pk)
+    return job.state
+
+
+def release_lost_jobs(job_ids, error):
+    """
+    Trabajos reclamados cuyo proceso murió sin responder (p. ej. el OOM killer con
+    un vídeo enorme): cuentan como intento fallido y se reintentan o quedan
+    fallidos ya, sin esperar a que caduque el lock. Devuelve cuántos se liberan.
+    """
+    now = timezone.now()
+    jobs = list(ProcessingJob.objects.filter(id__in=job_ids, state='running'))
+    for job in jobs:
+        job.last_error = error
+        job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.state = 'failed'
+            logger.error("Trabajo %s agotó sus reintentos: %s", job, error)
+        else:
+            job.state = 'pending'
+            job.run_after = now + retry_delay(job.attempts)
+            logger.warning("Trabajo %s perdido (intento %s), reintento en %s", job, job.attempts, job.run_after)
+        job.save(update_fields=['state', 'run_after', 'locked_at', 'last_error', 'updated_at'])
+    for media_id in {job.media_id for job in jobs}:
+        refresh_processing_state(media_id)
+    return len(jobs)
+
+
+def refresh_processing_state(media_id):
+    """Resume el estado de los trabajos de un Media en ``Media.processing_state``."""
+    states = set(ProcessingJob.objects.filter(media_id=media_id).values_list('state', flat=True))
+    if 'failed' in states:
+        state = 'failed'
+    elif states & {'pending', 'running'}:
+        state = 'processing'
+    else:
+        state = 'ready'
+    media = Media.objects.filter(pk=media_id).exclude(processing_state=state)
+    if state == 'processing':
+        media.update_internal(processing_state=state)
+    else:
+        # Terminado (o fallido): sí cambia lo que ve el detalle, nueva versión si hubo cambio
+        media.update(processing_state=state)
+    return state
+
+
+def run_pending(limit=100, media_id=None):
+    """Ejecuta en este proceso los trabajos listos (modo eager y tests)."""
+    done = 0
+    for job_id in claim_jobs(limit, media_id=media_id):
+        run_job(job_id)
+        done += 1
+    return done
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+from PIL import Image
+
+from wedding_gallery import exif, mp4, storage
+from wedding_gallery.jobs import FASTSTART_MIME_TYPES
+from wedding_gallery.models import Media, MediaCounter
+
+# Campos que rellena, por orden de coste: bytes (HEAD), dimensiones (cabecera), hash (fichero entero)
+FIELDS = ['bytes', 'width', 'height', 'duration_ms', 'video_codec', 'sha256']
+
+INCOMPLETE = (
+    Q(sha256__isnull=True) | Q(sha256='') | Q(bytes__isnull=True)
+    | Q(media_type='image', width__isnull=True)
+    # Del resto de vídeos (WebM, AVI...) no se sabe sacar nada sin ffmpeg
+    | Q(media_type='video', mime_type__in=FASTSTART_MIME_TYPES, duration_ms__isnull=True)
+)
+
+
+def _image_size(key):
+    """Tamaño ya girado leyendo solo la cabecera; si el EXIF no cabe en ella, con el fichero."""
+    size = exif.probe(key)['size']
+    if size is None:
+        # Image.open tampoco decodifica píxeles: solo lee hasta el final de la cabecera
+        with default_storage.open(key, 'rb') as fh, Image.open(fh) as img:
+            size = exif.read_exif(img)['size']
+    return size
+
+
+def _probe(row):
+    """
+    Se ejecuta en un proceso del pool: ``(id, {campo: valor}, bytes leídos, error)``.
+    Solo lee del storage; la base de datos la actualiza el proceso principal.
+    """
+    media_id, key, media_type, mime_type, missing = row
+    fields = {}
+    read = 0
+    try:
+        if media_type == 'image' and 'width' in missing:
+            fields['width'], fields['height'] = _image_size(key)
+        elif media_type == 'video' and 'duration_ms' in missing:
+            try:
+                info = mp4.probe(key)
+            except mp4.Mp4Error:
+                pass
+            else:
+                fields.update(duration_ms=info['duration_ms'], width=info['width'],
+                              height=info['height'], video_codec=info['codec'] or '')
+
+        if 'sha256' in missing:
+            digest = hashlib.sha256()
+            for chunk in storage.iter_file(key):
+                digest.update(chunk)
+                read += len(chunk)
+            fields.update(sha256=digest.hexdigest(), bytes=read)
+        elif 'bytes' in missing:
+            with storage.RangedReader(key) as reader:
+                fields['bytes'] = reader.size
+    except Exception as e:
+        return media_id, fields, read, f"{key}: {e}"
+    return media_id, fields, read, None
+
+
+def _missing(media):
+    missing = set()
+    if not media.sha256:
+        missing.add('sha256')
+    if media.bytes is None:
+        missing.add('bytes')
+    if media.media_type == 'image' and media.width is None:
+        missing.add('width')
+    if media.media_type == 'video' and media.mime_type in FASTSTART_MIME_TYPES and media.duration_ms is None:
+        missing.add('duration_ms')
+    return missing
+
+
+class Command(BaseCommand):
+    help = ("Rellena bytes, sha256, dimensiones y duración de los archivos a los que les faltan, "
+            "leyendo en paralelo. Guarda por dónde va: si se corta, se relanza y continúa.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Procesos del pool (por defecto 4)")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Archivos por lote; se guarda al terminar cada uno (por defecto 200)")
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, '.backfill_media.json'),
+                            help="Fichero donde se guarda el último id procesado")
+        parser.add_argument('--restart', action='store_true',
+                            help="Empezar desde el principio aunque haya un checkpoint")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if getattr(settings, 'USE_S3', False):
+            workers = min(workers, settings.AWS_S3_MAX_POOL_CONNECTIONS)
+        batch_size = max(1, options['batch_size'])
+        checkpoint_path = options['checkpoint']
+
+        # changed_ids: filas actualizadas, para publicarlas al final (sobrevive a un corte)
+        state = {'last_id': 0, 'updated': 0, 'failed': 0, 'changed_ids': []}
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                state.update(json.load(fh))
+            self.stdout.write(f"↩️  Continuando desde el id {state['last_id']} ({checkpoint_path})")
+
+        queryset = (
+            Media.objects.filter(INCOMPLETE).exclude(object_key=None).order_by('id')
+            .only('id', 'object_key', 'media_type', 'mime_type', 'status', *FIELDS)
+        )
+        self.stdout.write(f"🧮 Rellenando metadatos ({workers} procesos)")
+        started = time.monotonic()
+        processed = read = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # Keyset por id: las filas que no se pudieron completar no se vuelven a pedir
+                batch = {media.pk: media for media in queryset.filter(id__gt=state['last_id'])[:batch_size]}
+                if not batch:
+                    break
+                rows = [
+                    (media.pk, media.object_key, media.media_type, media.mime_type, _missing(media))
+                    for media in batch.values()
+                ]
+
+                # No compartir el socket de la BD con los procesos hijos (fork)
+                connections.close_all()
+                changed, before = [], []
+                for media_id, fields, bytes_read, error in pool.map(_probe, rows, chunksize=8):
+                    read += bytes_read
+                    if error:
+                        state['failed'] += 1
+                        self.stderr.write(f"  ✗ {error}")
+                    media = batch[media_id]
+                    fields = {name: value for name, value in fields.items() if getattr(media, name) != value}
+                    if fields:
+                        before.append((media.media_type, media.status, 1, media.bytes))
+                        for name, value in fields.items():
+                            setattr(media, name, value)
+                        changed.append(media)
+
+                if changed:
+                    # Sin versión nueva por lote: el feed de cambios y los eventos se enterarían
+                    # cientos de veces; se publica todo de una vez al terminar
+                    with transaction.atomic():
+                        state['updated'] += Media.objects.bulk_update_internal(changed, FIELDS)
+                        # Los contadores sí van por lote (solo cambian los bytes): así no se
+                        # pierde nada si se corta antes de publicar
+                        MediaCounter.apply_changes(before, [(m.media_type, m.status, 1, m.bytes) for m in changed])
+                    state['changed_ids'] += [media.pk for media in changed]
+                state['last_id'] = rows[-1][0]
+                self._save_checkpoint(checkpoint_path, state)
+
+                processed += len(rows)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f"  • {processed} archivos ({processed / elapsed:.0f}/s, "
+                    f"{read / elapsed / 1024 ** 2:.1f} MB/s), {state['updated']} actualizados"
+                )
+
+        # Una sola versión nueva para todo lo actualizado (los contadores ya van al día)
+        Media.objects.publish(state['changed_ids'])
+        # Terminado: la próxima vez se empieza de cero (por si hay filas nuevas incompletas)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {state['updated']} archivos actualizados ({processed} revisados en {elapsed:.1f} s)"
+        ))
+        if state['failed']:
+            self.stdout.write(self.style.WARNING(f"⚠️  {state['failed']} archivos no se pudieron leer"))
+
+    def _save_checkpoint(self, path, state):
+        # Se escribe al lado y se renombra: un corte a mitad no deja el fichero a medias
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(state, fh)
+        os.replace(tmp_path, path)
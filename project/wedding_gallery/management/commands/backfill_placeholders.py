@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from wedding_gallery.models import Media
+from wedding_gallery.placeholders import dominant_color, placeholder_data_uri
+
+THUMBNAIL_SIZE = 320
+
+
+def _load_thumbnail(media):
+    """La miniatura más pequeña (unos KB) o, si aún no hay, el original reducido al decodificar."""
+    thumbs = (media.derivatives or {}).get('webp') or {}
+    name = thumbs[min(thumbs, key=int)] if thumbs else media.file.name
+    with media.file.storage.open(name, 'rb') as fh, Image.open(fh) as img:
+        img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        return img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'PA') else 'RGB')
+
+
+class Command(BaseCommand):
+    help = ("Calcula el placeholder (WebP de 16px) y el color dominante de las imágenes que no lo "
+            "tienen, a partir de su miniatura más pequeña. Se puede relanzar.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Imágenes en paralelo (por defecto 8)")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Imágenes por lote (por defecto 200)")
+        parser.add_argument('--all', action='store_true',
+                            help="Recalcular también las que ya tienen placeholder")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if getattr(settings, 'USE_S3', False):
+            workers = min(workers, settings.AWS_S3_MAX_POOL_CONNECTIONS)
+        batch_size = max(1, options['batch_size'])
+
+        queryset = Media.objects.filter(media_type='image').exclude(object_key=None).order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(placeholder='')
+        queryset = queryset.only('id', 'file', 'derivatives')
+
+        self.stdout.write(f"🎨 Calculando placeholders ({workers} en paralelo)")
+        started = time.monotonic()
+        last_id = 0
+        done = failed = 0
+        changed_ids = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+                    if not batch:
+                        break
+                    last_id = batch[-1].pk
+
+                    changed = []
+                    for media in pool.map(self._process, batch):
+                        if media is None:
+                            failed += 1
+                            continue
+                        changed.append(media)
+                    if changed:
+                        done += Media.objects.bulk_update_internal(changed, ['placeholder', 'dominant_color'])
+                        changed_ids += [media.pk for media in changed]
+
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(f"  • {done} imágenes ({done / elapsed:.0f}/s)")
+        finally:
+            # Sin versión nueva por lote: lo ya escrito se publica de una vez, también si se corta
+            Media.objects.publish(changed_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {done} placeholders calculados"))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"⚠️  {failed} imágenes no se pudieron leer"))
+
+    def _process(self, media):
+        try:
+            thumbnail = _load_thumbnail(media)
+        except Exception as e:
+            self.stderr.write(f"  ✗ {media.file.name}: {e}")
+            return None
+        media.placeholder = placeholder_data_uri(thumbnail)
+        media.dominant_color = dominant_color(thumbnail)
+        return media
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wedding_gallery import exif, mp4
+from wedding_gallery.jobs import FASTSTART_MIME_TYPES
+from wedding_gallery.models import Media
+
+
+def _read_capture_info(row):
+    """``(id, taken_at, camera_model)`` leyendo solo la cabecera (fotos) o el moov (vídeos)."""
+    media_id, key, media_type, mime_type = row
+    if media_type == 'image':
+        info = exif.probe(key)
+        return media_id, info['taken_at'], info['camera_model']
+    if media_type == 'video' and mime_type in FASTSTART_MIME_TYPES:
+        try:
+            return media_id, mp4.probe(key)['created_at'], ''
+        except mp4.Mp4Error:
+            pass
+    return media_id, None, ''
+
+
+class Command(BaseCommand):
+    help = ("Rellena la fecha de captura (taken_at) y la cámara de los archivos subidos antes de que "
+            "se leyera el EXIF. Solo lee las cabeceras; se puede relanzar.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Lecturas en paralelo (por defecto 8)")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Archivos por lote (por defecto 200)")
+        parser.add_argument('--all', action='store_true',
+                            help="Volver a leer también los que ya tienen fecha")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if getattr(settings, 'USE_S3', False):
+            workers = min(workers, settings.AWS_S3_MAX_POOL_CONNECTIONS)
+        batch_size = max(1, options['batch_size'])
+
+        queryset = Media.objects.exclude(object_key=None).order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(taken_at__isnull=True)
+
+        self.stdout.write(f"📅 Leyendo fechas de captura ({workers} lecturas en paralelo)")
+        started = time.monotonic()
+        last_id = 0
+        read = dated = 0
+        changed_ids = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    # Keyset por id: los que no tienen fecha no se vuelven a pedir
+                    rows = list(
+                        queryset.filter(id__gt=last_id)
+                        .values_list('id', 'object_key', 'media_type', 'mime_type')[:batch_size]
+                    )
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+
+                    changed = []
+                    for media_id, taken_at, camera_model in pool.map(self._safe_read, rows):
+                        read += 1
+                        if taken_at is None and not camera_model:
+                            continue
+                        changed.append(Media(pk=media_id, taken_at=taken_at, camera_model=camera_model))
+                    if changed:
+                        Media.objects.bulk_update_internal(changed, ['taken_at', 'camera_model'])
+                        changed_ids += [media.pk for media in changed]
+                        dated += sum(1 for media in changed if media.taken_at)
+
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(f"  • {read} archivos leídos, {dated} con fecha ({read / elapsed:.0f} archivos/s)")
+        finally:
+            # Sin versión nueva por lote: lo ya escrito se publica de una vez, también si se corta
+            Media.objects.publish(changed_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {dated} de {read} archivos con fecha de captura; el resto quedan en \"undated\" en la línea de tiempo"
+        ))
+
+    def _safe_read(self, row):
+        try:
+            return _read_capture_info(row)
+        except Exception as e:
+            self.stderr.write(f"  ✗ {row[1]}: {e}")
+            return row[0], None, ''
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wedding_gallery import mp4
+from wedding_gallery.models import Media
+from wedding_gallery.storage import RangedReader
+
+
+class Command(BaseCommand):
+    help = ("Mide cuánto se lee del almacenamiento para sacar duración y dimensiones de los vídeos "
+            "(solo la caja moov) frente a su tamaño completo. No modifica nada.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help="Vídeos a medir (por defecto 50)")
+
+    def handle(self, *args, **options):
+        videos = (Media.objects.filter(media_type='video').exclude(object_key=None)
+                  .order_by('-id')[:options['limit']])
+
+        total_size = total_read = total_requests = 0
+        measured = 0
+        started = time.monotonic()
+        for media in videos:
+            t0 = time.monotonic()
+            with RangedReader(media.object_key) as reader:
+                try:
+                    info = mp4.parse_moov(mp4.read_moov(reader))
+                except mp4.Mp4Error as e:
+                    self.stdout.write(self.style.WARNING(f"  ✗ {media.object_key}: {e}"))
+                    continue
+                size = reader.size
+            elapsed_ms = (time.monotonic() - t0) * 1000
+
+            measured += 1
+            total_size += size
+            total_read += reader.bytes_read
+            total_requests += reader.requests
+            self.stdout.write(
+                f"  • {media.object_key}: {reader.bytes_read:,} de {size:,} bytes "
+                f"({reader.bytes_read / max(size, 1):.2%}) en {reader.requests} lecturas, "
+                f"{elapsed_ms:.0f} ms → {info['width']}x{info['height']}, "
+                f"{info['duration_ms']} ms, {info['codec']}"
+            )
+
+        if not measured:
+            self.stdout.write("No hay vídeos que medir")
+            return
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {measured} vídeos: leídos {total_read:,} de {total_size:,} bytes "
+            f"({total_read / max(total_size, 1):.3%}), {total_requests / measured:.1f} lecturas "
+            f"y {total_read // measured:,} bytes por vídeo, {elapsed * 1000 / measured:.0f} ms por vídeo"
+        ))
@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from wedding_gallery.models import Media
+from wedding_gallery.similarity import dhash, find_clusters
+
+BATCH_SIZE = 200
+
+
+def _compute_phash(media):
+    """dHash desde la miniatura más pequeña (o el original si aún no hay)."""
+    thumbs = (media.derivatives or {}).get('webp') or {}
+    name = thumbs[min(thumbs, key=int)] if thumbs else media.file.name
+    with media.file.storage.open(name, 'rb') as fh, Image.open(fh) as img:
+        img.draft('RGB', (320, 320))
+        return dhash(ImageOps.exif_transpose(img))
+
+
+class Command(BaseCommand):
+    help = ("Recalcula los grupos de fotos casi iguales (Media.similar_to) comparando los hashes "
+            "perceptuales de todas las imágenes visibles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compute-missing', action='store_true',
+                            help="Calcular antes el hash de las imágenes subidas antes de que existiera")
+        parser.add_argument('--max-distance', type=int, default=None,
+                            help="Bits distintos para considerar dos fotos iguales "
+                                 "(por defecto MEDIA_SIMILAR_MAX_DISTANCE)")
+        parser.add_argument('--check', action='store_true',
+                            help="Solo muestra cuántas fotos cambiarían de grupo, sin guardar nada")
+
+    def handle(self, *args, **options):
+        max_distance = options['max_distance']
+        if max_distance is None:
+            max_distance = settings.MEDIA_SIMILAR_MAX_DISTANCE
+
+        # Se escribe por lotes sin versión nueva y se publica todo junto al final:
+        # el feed de cambios y los eventos se enteran una sola vez
+        changed_ids = []
+        if options['compute_missing']:
+            changed_ids += self._compute_missing()
+        changed_ids += self._cluster(max_distance, options['check'])
+        Media.objects.publish(changed_ids)
+
+    def _cluster(self, max_distance, check):
+        started = time.monotonic()
+        rows = list(
+            Media.objects.filter(media_type='image', status=1, phash__isnull=False)
+            .order_by('id').values_list('id', 'phash', 'similar_to_id')
+        )
+        if not rows:
+            self.stdout.write("No hay imágenes con hash perceptual")
+            return []
+        ids, hashes, current = zip(*rows)
+        roots = find_clusters(ids, hashes, max_distance)
+        elapsed = time.monotonic() - started
+
+        changed = [
+            Media(pk=pk, similar_to_id=roots[pk])
+            for pk, similar_to in zip(ids, current) if roots[pk] != similar_to
+        ]
+        copies = sum(1 for root in roots.values() if root is not None)
+        groups = len({root for root in roots.values() if root is not None})
+        self.stdout.write(
+            f"🔍 {len(rows)} imágenes comparadas en {elapsed * 1000:.0f} ms: "
+            f"{groups} grupos, {copies} copias (distancia ≤ {max_distance})"
+        )
+
+        if not changed:
+            self.stdout.write(self.style.SUCCESS("✓ Los grupos estaban al día"))
+            return []
+        if check:
+            self.stdout.write(self.style.WARNING(f"⚠️  {len(changed)} imágenes cambiarían de grupo (sin cambios, --check)"))
+            return []
+        Media.objects.bulk_update_internal(changed, ['similar_to'], batch_size=BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(changed)} imágenes cambiadas de grupo"))
+        return [media.pk for media in changed]
+
+    def _compute_missing(self):
+        """Ids con el hash recién calculado (sin publicar)."""
+        pending = Media.objects.filter(media_type='image', phash__isnull=True).exclude(object_key=None)
+        self.stdout.write(f"🧮 Calculando el hash de {pending.count()} imágenes...")
+        batch = []
+        done = []
+        for media in pending.only('id', 'file', 'derivatives').iterator(chunk_size=BATCH_SIZE):
+            try:
+                media.phash = _compute_phash(media)
+            except Exception as e:
+                self.stderr.write(f"  ✗ {media.file.name}: {e}")
+                continue
+            batch.append(media)
+            if len(batch) >= BATCH_SIZE:
+                Media.objects.bulk_update_internal(batch, ['phash'])
+                done += [m.pk for m in batch]
+                batch = []
+        if batch:
+            Media.objects.bulk_update_internal(batch, ['phash'])
+            done += [m.pk for m in batch]
+        self.stdout.write(f"  • {len(done)} hashes calculados")
+        return done
@@ -0,0 +1,170 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wedding_gallery.models import Media
+from wedding_gallery.storage import iter_file
+
+CHECKPOINT_NAME = '.export-progress.jsonl'
+MANIFEST_FIELDS = [
+    'id', 'key', 'path', 'media_type', 'sha256', 'bytes',
+    'width', 'height', 'duration_ms', 'created_at',
+]
+
+
+class HashMismatch(Exception):
+    pass
+
+
+def _download(row, dest, retries):
+    """
+    Descarga un fichero a ``dest/<key>`` calculando el SHA256 mientras llega.
+    Se escribe en ``.part`` y solo se renombra si el hash cuadra, así un corte
+    nunca deja un fichero a medias con el nombre bueno. Se ejecuta en un hilo.
+    """
+    path = os.path.join(dest, row['key'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.part'
+
+    for attempt in range(1, retries + 1):
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with open(partial, 'wb') as f:
+                for chunk in iter_file(row['key'], settings.MEDIA_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            if row['sha256'] and sha256 != row['sha256']:
+                raise HashMismatch(f"SHA256 {sha256} != {row['sha256']}")
+            os.replace(partial, path)
+            return {**row, 'sha256': sha256, 'bytes': size}
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
+class Command(BaseCommand):
+    help = ("Exporta el álbum completo a un directorio (misma estructura que el almacenamiento) "
+            "con un manifiesto JSON y CSV. Se puede relanzar: lo ya descargado se salta.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('dest', help="Directorio de destino")
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Descargas en paralelo (por defecto 8; con S3 como mucho "
+                                 "AWS_S3_MAX_POOL_CONNECTIONS)")
+        parser.add_argument('--retries', type=int, default=3, help="Intentos por archivo (por defecto 3)")
+        parser.add_argument('--include-hidden', action='store_true',
+                            help="Incluir también los archivos ocultos (status=0); los eliminados nunca")
+
+    def handle(self, *args, **options):
+        dest = os.path.abspath(options['dest'])
+        os.makedirs(dest, exist_ok=True)
+        workers = max(1, options['workers'])
+        if getattr(settings, 'USE_S3', False):
+            workers = min(workers, settings.AWS_S3_MAX_POOL_CONNECTIONS)
+
+        checkpoint_path = os.path.join(dest, CHECKPOINT_NAME)
+        done = self._load_checkpoint(checkpoint_path)
+        if done:
+            self.stdout.write(f"↻ Reanudando: {len(done)} archivos ya exportados")
+
+        queryset = Media.objects.exclude(object_key=None).exclude(status=2).order_by('id')
+        if not options['include_hidden']:
+            queryset = queryset.filter(status=1)
+        rows = queryset.values_list(
+            'id', 'object_key', 'media_type', 'sha256', 'bytes',
+            'width', 'height', 'duration_ms', 'created_at',
+        ).iterator(chunk_size=500)
+
+        self.stdout.write(f"📦 Exportando a {dest} ({workers} descargas en paralelo)")
+        started = time.monotonic()
+        exported = skipped = failed = 0
+        exported_bytes = 0
+        failures = []
+
+        with open(checkpoint_path, 'a') as checkpoint, ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+
+            def collect(futures):
+                nonlocal exported, exported_bytes, failed
+                for future in futures:
+                    row = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed += 1
+                        done.pop(row['id'], None)
+                        failures.append((row['id'], row['key'], e))
+                        self.stderr.write(f"  ✗ {row['key']}: {e}")
+                        continue
+                    # Una línea por archivo terminado: lo que esté aquí no se vuelve a bajar
+                    checkpoint.write(json.dumps(result, default=str) + '\n')
+                    checkpoint.flush()
+                    done[result['id']] = result
+                    exported += 1
+                    exported_bytes += result['bytes']
+                    if exported % 100 == 0:
+                        self._progress(exported, exported_bytes, started)
+
+            for media_id, key, media_type, sha256, size, width, height, duration_ms, created_at in rows:
+                if media_id in done and os.path.exists(os.path.join(dest, key)):
+                    skipped += 1
+                    continue
+                row = {
+                    'id': media_id, 'key': key, 'path': key, 'media_type': media_type,
+                    'sha256': sha256, 'bytes': size, 'width': width, 'height': height,
+                    'duration_ms': duration_ms, 'created_at': created_at.isoformat(),
+                }
+                pending[pool.submit(_download, row, dest, options['retries'])] = row
+                # Cola acotada: no se encolan miles de descargas de golpe
+                if len(pending) >= workers * 4:
+                    finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(list(pending))
+
+        self._write_manifest(dest, done)
+        self._progress(exported, exported_bytes, started)
+        self.stdout.write(f"  {skipped} ya estaban exportados, {len(done)} en el manifiesto")
+        if failures:
+            raise CommandError(f"{failed} archivos no se pudieron exportar; vuelve a lanzar el comando para reintentarlos")
+        self.stdout.write(self.style.SUCCESS("✅ Exportación completa"))
+
+    def _load_checkpoint(self, path):
+        done = {}
+        if not os.path.exists(path):
+            return done
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # última línea cortada por una interrupción
+                done[row['id']] = row
+        return done
+
+    def _write_manifest(self, dest, done):
+        rows = [done[media_id] for media_id in sorted(done)]
+        with open(os.path.join(dest, 'manifest.json'), 'w') as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False, default=str)
+        with open(os.path.join(dest, 'manifest.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def _progress(self, exported, exported_bytes, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f"  • {exported} archivos, {exported_bytes / 1024 / 1024:.1f} MB "
+            f"({exported / elapsed:.1f} archivos/s, {exported_bytes / 1024 / 1024 / elapsed:.1f} MB/s)"
+        )
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from wedding_gallery.jobs import claim_jobs, release_lost_jobs, run_job
+
+
+def _run_in_child(job_id):
+    # Cada proceso del pool abre su propia conexión a la base de datos
+    try:
+        return job_id, run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de trabajos: procesa hash, dimensiones, miniaturas y metadatos de vídeo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Procesos del pool (por defecto 2)")
+        parser.add_argument('--batch', type=int, default=0,
+                            help="Trabajos a reclamar por vuelta (por defecto 2 por proceso)")
+        parser.add_argument('--poll', type=float, default=2.0, help="Segundos de espera cuando no hay trabajo")
+        parser.add_argument('--once', action='store_true', help="Procesa lo pendiente y termina")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch = options['batch'] or workers * 2
+        self.stdout.write(f"🛠️  Worker de trabajos iniciado ({workers} procesos)")
+
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                job_ids = claim_jobs(batch)
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                # No compartir el socket de la BD con los procesos hijos (fork)
+                connections.close_all()
+                futures = {pool.submit(_run_in_child, job_id): job_id for job_id in job_ids}
+                lost = []
+                broken = False
+                for future in as_completed(futures):
+                    try:
+                        job_id, state = future.result()
+                    except BrokenProcessPool:
+                        # Un hijo murió (OOM...): el pool entero queda inutilizable
+                        broken = True
+                        lost.append(futures[future])
+                        continue
+                    except Exception as e:
+                        self.stderr.write(f"  ✗ Error en el proceso hijo: {e}")
+                        lost.append(futures[future])
+                        continue
+                    self.stdout.write(f"  • Trabajo {job_id}: {state}")
+
+                if lost:
+                    error = ("El proceso del worker murió (¿falta de memoria?)" if broken
+                             else "El proceso del worker no devolvió resultado")
+                    released = release_lost_jobs(lost, error)
+                    self.stderr.write(f"  ✗ {released} trabajos sin terminar: se reintentarán o quedan fallidos")
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    self.stderr.write("  ↻ Pool de procesos recreado")
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS("✅ No quedan trabajos pendientes"))
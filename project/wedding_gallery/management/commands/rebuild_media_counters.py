@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wedding_gallery.models import GalleryState, MediaCounter
+
+
+class Command(BaseCommand):
+    help = "Recalcula los contadores de archivos visibles (media_counter) desde la tabla media."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Solo muestra las diferencias, sin corregir nada")
+
+    def handle(self, *args, **options):
+        before = MediaCounter.totals()
+
+        with transaction.atomic():
+            rebuilt = MediaCounter.rebuild()
+            after = {t: (row['total'], row['size'] or 0) for t, row in rebuilt.items()}
+            drift = {t: (before.get(t), value) for t, value in after.items() if before.get(t) != value}
+            if options['check']:
+                transaction.set_rollback(True)
+            elif drift:
+                GalleryState.bump()
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("✓ Los contadores estaban al día"))
+            return
+        for media_type, (old, new) in sorted(drift.items()):
+            old = old or (0, 0)
+            self.stdout.write(f"  {media_type}: {old[0]} → {new[0]} archivos, {old[1]} → {new[1]} bytes")
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f"⚠️  {len(drift)} contadores desincronizados (sin cambios, --check)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ {len(drift)} contadores corregidos"))
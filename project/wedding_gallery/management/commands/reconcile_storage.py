@@ -0,0 +1,206 @@
+import hashlib
+import time
+from array import array
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wedding_gallery import storage
+from wedding_gallery.models import Media, UploadSession
+
+BATCH_SIZE = 2000
+# Claves que se muestran de cada lista (con -v 2 se muestran todas)
+SAMPLE_SIZE = 20
+
+
+def _key_hash(key):
+    """Huella de 8 bytes de una clave: un millón de claves caben en 8 MB."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+def _media_keys(object_key, file_name, derivatives):
+    """Clave del original y claves de sus miniaturas (``{'webp': {'320': clave}}``)."""
+    original = object_key or file_name or None
+    thumbs = [key for sizes in (derivatives or {}).values() for key in sizes.values()]
+    return original, thumbs
+
+
+class KeyIndex:
+    """
+    Claves referenciadas como huellas uint64 ordenadas; las claves del listado
+    se buscan por páginas con ``searchsorted``.
+
+    No se hace un merge ordenado con ``ORDER BY object_key`` porque el orden de
+    MySQL depende de la colación y no coincide con el de S3 (bytes UTF-8). Un
+    choque de huellas (~1e-8 con un millón de claves) solo haría pasar un
+    huérfano por referenciado, nunca al revés: no se borra nada que esté en la
+    base de datos.
+    """
+
+    def __init__(self, keys):
+        hashes = array('Q', map(_key_hash, keys))
+        self.hashes = np.unique(np.frombuffer(hashes, dtype=np.uint64))
+        self.seen = np.zeros(len(self.hashes), dtype=bool)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _find(self, keys):
+        probe = np.fromiter(map(_key_hash, keys), dtype=np.uint64, count=len(keys))
+        if not len(self.hashes):
+            return np.zeros(len(keys), dtype=np.intp), np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.hashes, probe).clip(max=len(self.hashes) - 1)
+        return positions, self.hashes[positions] == probe
+
+    def mark(self, keys):
+        """Marca como vistas las ``keys`` referenciadas; devuelve la máscara de las que lo están."""
+        positions, found = self._find(keys)
+        self.seen[positions[found]] = True
+        return found
+
+    def missing(self, keys):
+        """Máscara de las ``keys`` referenciadas que no aparecieron en el listado."""
+        positions, found = self._find(keys)
+        if not len(self.seen):
+            return found
+        return found & ~self.seen[positions]
+
+
+class Command(BaseCommand):
+    help = ("Compara el almacenamiento con la tabla media: lista los ficheros huérfanos (sin fila, "
+            "p. ej. subidas fallidas o borrados a mano) y las filas cuyo fichero falta. "
+            "Sin --delete no borra nada.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='',
+                            help="Revisar solo las claves que empiezan así (p. ej. images/)")
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="No tocar ficheros más recientes (subidas en curso); por defecto 24")
+        parser.add_argument('--delete', action='store_true',
+                            help="Borrar los huérfanos (delete_objects de 1000 en 1000)")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        self.verbose = options['verbosity'] >= 2
+        started = time.monotonic()
+
+        index, max_id = self._build_index(prefix)
+        self.stdout.write(f"🗂️  {len(index)} claves referenciadas en la base de datos")
+
+        listed = orphans = orphan_bytes = recent = deleted = 0
+        failed = []
+        pending_delete = []
+        sample = []
+        for page in storage.iter_object_pages(prefix):
+            referenced = index.mark([key for key, _, _ in page])
+            for (key, size, modified), is_referenced in zip(page, referenced):
+                if is_referenced:
+                    continue
+                if modified > cutoff:
+                    recent += 1
+                    continue
+                orphans += 1
+                orphan_bytes += size
+                self._sample(sample, f"{key} ({size} bytes, {modified:%Y-%m-%d %H:%M})")
+                if options['delete']:
+                    pending_delete.append(key)
+
+            listed += len(page)
+            if len(pending_delete) >= storage.S3_PAGE_SIZE:
+                failed += storage.delete_many(pending_delete)
+                deleted += len(pending_delete)
+                pending_delete = []
+            if listed % (10 * storage.S3_PAGE_SIZE) < len(page):
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f"  • {listed} ficheros revisados ({listed / elapsed:.0f}/s)")
+        if pending_delete:
+            failed += storage.delete_many(pending_delete)
+            deleted += len(pending_delete)
+
+        self._report_orphans(sample, orphans, orphan_bytes, recent, options)
+        if options['delete'] and orphans:
+            self.stdout.write(self.style.SUCCESS(f"🗑️  {deleted - len(failed)} huérfanos borrados"))
+            for key, error in failed:
+                self.stderr.write(f"  ✗ {key}: {error}")
+
+        self._report_dangling(index, prefix, max_id)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"⏱️  {listed} ficheros revisados en {elapsed:.1f} s")
+
+    def _build_index(self, prefix):
+        """Claves de originales y miniaturas de todas las filas, y de las subidas directas abiertas."""
+        max_id = 0
+
+        def keys():
+            nonlocal max_id
+            rows = Media.objects.order_by().values_list('id', 'object_key', 'file', 'derivatives')
+            for media_id, *row in rows.iterator(chunk_size=BATCH_SIZE):
+                max_id = max(max_id, media_id)
+                original, thumbs = _media_keys(*row)
+                for key in [original, *thumbs]:
+                    if key and key.startswith(prefix):
+                        yield key
+            # El fichero de una subida directa aún abierta existe antes que su fila
+            sessions = UploadSession.objects.filter(state='open').values_list('object_key', flat=True)
+            yield from (key for key in sessions.iterator() if key.startswith(prefix))
+
+        return KeyIndex(keys()), max_id
+
+    def _report_orphans(self, sample, orphans, orphan_bytes, recent, options):
+        if not orphans:
+            self.stdout.write(self.style.SUCCESS("✓ No hay ficheros huérfanos"))
+        else:
+            self._print_sample(sample, orphans)
+            message = f"⚠️  {orphans} ficheros huérfanos ({orphan_bytes / 1024 ** 2:.1f} MB)"
+            if not options['delete']:
+                message += " (sin cambios; --delete para borrarlos)"
+            self.stdout.write(self.style.WARNING(message))
+        if recent:
+            self.stdout.write(
+                f"  {recent} ficheros sin fila de menos de {options['grace_hours']:g} h no se tocan (subidas en curso)"
+            )
+
+    def _report_dangling(self, index, prefix, max_id):
+        """Filas (hasta ``max_id``: las nuevas pueden no estar en el listado) con ficheros que faltan."""
+        rows = (
+            Media.objects.filter(id__lte=max_id).order_by()
+            .values_list('id', 'object_key', 'file', 'derivatives', 'status')
+        )
+        originals = []
+        missing_originals = missing_thumbs = 0
+        for media_id, object_key, file_name, derivatives, status in rows.iterator(chunk_size=BATCH_SIZE):
+            original, thumbs = _media_keys(object_key, file_name, derivatives)
+            keys = [key for key in [original, *thumbs] if key and key.startswith(prefix)]
+            if not keys:
+                continue
+            missing = index.missing(keys)
+            if original in keys and missing[keys.index(original)]:
+                missing_originals += 1
+                self._sample(originals, f"#{media_id} {original} (status={status})")
+            elif missing.any():
+                missing_thumbs += 1
+
+        if not missing_originals:
+            self.stdout.write(self.style.SUCCESS("✓ Todas las filas tienen su fichero"))
+        else:
+            self._print_sample(originals, missing_originals)
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {missing_originals} filas sin fichero en el almacenamiento (no se tocan: revísalas en el admin)"
+            ))
+        if missing_thumbs:
+            self.stdout.write(self.style.WARNING(f"⚠️  {missing_thumbs} archivos con alguna miniatura que falta"))
+
+    def _sample(self, sample, line):
+        if self.verbose:
+            self.stdout.write(f"  {line}")
+        elif len(sample) < SAMPLE_SIZE:
+            sample.append(line)
+
+    def _print_sample(self, sample, total):
+        for line in sample:
+            self.stdout.write(f"  {line}")
+        if total > len(sample) and not self.verbose:
+            self.stdout.write(f"  ... y {total - len(sample)} más (-v 2 para verlos todos)")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text="Claves de las miniaturas por formato y anchura, p.ej. {'webp': {'320': 'images/x_320w.webp'}}"),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0002_media_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('ready', 'Listo'), ('failed', 'Fallido')], default='ready', help_text='Estado del procesado en segundo plano (hash, dimensiones, miniaturas...)', max_length=12),
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hash', 'Hash SHA256'), ('dimensions', 'Dimensiones'), ('derivatives', 'Miniaturas'), ('video_metadata', 'Metadatos de vídeo')], help_text='Tipo de trabajo', max_length=20)),
+                ('state', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En curso'), ('done', 'Hecho'), ('failed', 'Fallido')], default='pending', help_text='Estado del trabajo', max_length=10)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Parámetros adicionales del trabajo')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Intentos realizados')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, help_text='Intentos máximos antes de marcarlo como fallido')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='No se ejecuta antes de esta fecha (backoff entre reintentos)')),
+                ('locked_at', models.DateTimeField(blank=True, help_text='Momento en que un worker lo tomó', null=True)),
+                ('last_error', models.TextField(blank=True, help_text='Último error registrado')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('media', models.ForeignKey(help_text='Archivo sobre el que se ejecuta el trabajo', on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='wedding_gallery.media')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de procesado',
+                'verbose_name_plural': 'Trabajos de procesado',
+                'db_table': 'processing_job',
+                'ordering': ['run_after', 'id'],
+                'indexes': [models.Index(fields=['state', 'run_after'], name='idx_job_state_run')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:30
+
+from django.db import migrations, models
+
+
+def sha256_to_hex(apps, schema_editor):
+    Media = apps.get_model('wedding_gallery', 'Media')
+    batch = []
+    for media in Media.objects.exclude(sha256=None).only('id', 'sha256').iterator(chunk_size=1000):
+        media.sha256_hex = bytes(media.sha256).hex()
+        batch.append(media)
+        if len(batch) >= 1000:
+            Media.objects.bulk_update(batch, ['sha256_hex'])
+            batch = []
+    if batch:
+        Media.objects.bulk_update(batch, ['sha256_hex'])
+
+
+def sha256_to_binary(apps, schema_editor):
+    Media = apps.get_model('wedding_gallery', 'Media')
+    batch = []
+    for media in Media.objects.exclude(sha256_hex=None).only('id', 'sha256_hex').iterator(chunk_size=1000):
+        media.sha256 = bytes.fromhex(media.sha256_hex)
+        batch.append(media)
+        if len(batch) >= 1000:
+            Media.objects.bulk_update(batch, ['sha256'])
+            batch = []
+    if batch:
+        Media.objects.bulk_update(batch, ['sha256'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0003_processing_jobs'),
+    ]
+
+    # En MySQL un BLOB no se puede indexar sin prefijo: pasamos el hash a hex (CHAR 64)
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='sha256_hex',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(sha256_to_hex, sha256_to_binary),
+        migrations.RemoveField(
+            model_name='media',
+            name='sha256',
+        ),
+        migrations.RenameField(
+            model_name='media',
+            old_name='sha256_hex',
+            new_name='sha256',
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='sha256',
+            field=models.CharField(blank=True, help_text='Hash SHA256 (hex) del archivo para deduplicación', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['sha256'], name='idx_sha256'),
+        ),
+    ]
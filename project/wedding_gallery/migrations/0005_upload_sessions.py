@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:24
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0004_sha256_hex_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('object_key', models.CharField(help_text='Clave definitiva del archivo en el almacenamiento', max_length=512, unique=True)),
+                ('filename', models.CharField(help_text='Nombre original del archivo', max_length=255)),
+                ('mime_type', models.CharField(help_text='Tipo MIME declarado por el cliente', max_length=100)),
+                ('total_bytes', models.PositiveBigIntegerField(help_text='Tamaño total declarado')),
+                ('part_size', models.PositiveIntegerField(help_text='Tamaño de cada parte (la última puede ser menor)')),
+                ('sha256', models.CharField(blank=True, help_text='SHA256 (hex) declarado por el cliente; se verifica al procesar', max_length=64)),
+                ('s3_upload_id', models.CharField(blank=True, help_text='UploadId de la subida multipart de S3', max_length=255)),
+                ('state', models.CharField(choices=[('open', 'Abierta'), ('complete', 'Completada'), ('aborted', 'Cancelada')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('media', models.OneToOneField(blank=True, help_text='Media creado al finalizar', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='wedding_gallery.media')),
+            ],
+            options={
+                'verbose_name': 'Subida directa',
+                'verbose_name_plural': 'Subidas directas',
+                'db_table': 'upload_session',
+            },
+        ),
+    ]
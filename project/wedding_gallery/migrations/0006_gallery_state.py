@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_state(apps, schema_editor):
+    GalleryState = apps.get_model('wedding_gallery', 'GalleryState')
+    GalleryState.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0005_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Estado de la galería',
+                'verbose_name_plural': 'Estado de la galería',
+                'db_table': 'gallery_state',
+            },
+        ),
+        migrations.RunPython(create_state, migrations.RunPython.noop),
+    ]
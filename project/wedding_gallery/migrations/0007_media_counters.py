@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+def build_counters(apps, schema_editor):
+    Media = apps.get_model('wedding_gallery', 'Media')
+    MediaCounter = apps.get_model('wedding_gallery', 'MediaCounter')
+    for media_type in ('image', 'video'):
+        visible = Media.objects.filter(status=1, media_type=media_type)
+        MediaCounter.objects.update_or_create(
+            media_type=media_type,
+            defaults={
+                'count': visible.count(),
+                'bytes': visible.aggregate(total=models.Sum('bytes'))['total'] or 0,
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0006_gallery_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_type', models.CharField(help_text='Tipo de media', max_length=10, unique=True)),
+                ('count', models.PositiveIntegerField(default=0, help_text='Archivos visibles')),
+                ('bytes', models.PositiveBigIntegerField(default=0, help_text='Bytes de los archivos visibles')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador de media',
+                'verbose_name_plural': 'Contadores de media',
+                'db_table': 'media_counter',
+            },
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0007_media_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0, help_text='Versión de la galería en la que cambió por última vez'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['change_seq'], name='idx_change_seq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0008_media_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='video_codec',
+            field=models.CharField(blank=True, default='', help_text='Códec de la pista de vídeo (avc1, hvc1...), leído del MP4', max_length=8),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='height',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Alto en píxeles (en vídeos, ya girado como se reproduce)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='width',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Ancho en píxeles (en vídeos, ya girado como se reproduce)', null=True),
+        ),
+    ]
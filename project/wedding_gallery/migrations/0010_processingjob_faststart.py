@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0009_media_video_codec'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('hash', 'Hash SHA256'), ('dimensions', 'Dimensiones'), ('derivatives', 'Miniaturas'), ('video_metadata', 'Metadatos de vídeo'), ('faststart', 'Faststart (moov al principio)')], help_text='Tipo de trabajo', max_length=20),
+        ),
+    ]
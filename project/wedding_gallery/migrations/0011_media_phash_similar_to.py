@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0010_processingjob_faststart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='phash',
+            field=models.BigIntegerField(blank=True, help_text='Hash perceptual (dHash de 64 bits) para detectar fotos casi iguales', null=True),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='similar_to',
+            field=models.ForeignKey(blank=True, help_text='Foto original del grupo de casi duplicados (vacío si es la original o no tiene parecidas)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='similar_media', to='wedding_gallery.media'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0011_media_phash_similar_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='camera_model',
+            field=models.CharField(blank=True, default='', help_text='Modelo de cámara o móvil (EXIF)', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='taken_at',
+            field=models.DateTimeField(blank=True, help_text='Fecha de captura (EXIF DateTimeOriginal o creation_time del MP4)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['taken_at'], name='idx_taken_at'),
+        ),
+    ]
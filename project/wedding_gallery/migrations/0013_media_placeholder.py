@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0012_media_taken_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='dominant_color',
+            field=models.CharField(blank=True, default='', help_text='Color dominante (#rrggbb)', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='placeholder',
+            field=models.CharField(blank=True, default='', help_text='Imagen de 16px en WebP como data: URI', max_length=1024),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='height',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Alto en píxeles, ya girado como se muestra (orientación EXIF / matriz del vídeo)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='width',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Ancho en píxeles, ya girado como se muestra (orientación EXIF / matriz del vídeo)', null=True),
+        ),
+    ]
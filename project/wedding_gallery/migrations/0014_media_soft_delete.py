@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0013_media_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, help_text='Momento del borrado lógico (status=2)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Oculto'), (1, 'Visible'), (2, 'Eliminado')], default=1, help_text='1=visible, 0=oculto, 2=eliminado (borrado lógico, se puede restaurar)'),
+        ),
+    ]
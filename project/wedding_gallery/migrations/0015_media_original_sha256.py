@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wedding_gallery', '0014_media_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='original_sha256',
+            field=models.CharField(blank=True, help_text='SHA256 del archivo tal como se subió, si después se reescribió (faststart)', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['original_sha256'], name='idx_original_sha256'),
+        ),
+    ]
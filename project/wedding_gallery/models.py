@@ -1,17 +1,279 @@
 import hashlib
+import logging
 import mimetypes
-from django.db import models
+import os
+import uuid
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+from .uploadhandlers import guess_mime_type, streamed_upload
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
 
 def get_upload_path(instance, filename):
     """Ruta de subida según el tipo de archivo."""
     ext = filename.split('.')[-1].lower()
-    if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
+    if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif']:
         return f'images/{filename}'
     elif ext in ['mp4', 'mov', 'avi', 'mkv', 'webm']:
         return f'videos/{filename}'
     return f'other/{filename}'
 
 
+def unique_filename(filename, token=None):
+    """
+    ``IMG_0001.jpg`` -> ``IMG_0001_1a2b3c4d.jpg``: con el sufijo (de ``token`` o
+    aleatorio) dos subidas con el mismo nombre nunca comparten clave, sin
+    depender de ``get_available_name`` (en S3 comprueba y luego escribe).
+    """
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    token = (token or uuid.uuid4()).hex[:8]
+    return get_valid_filename(f'{stem[:100]}_{token}{ext.lower()}')
+
+
+class GalleryState(models.Model):
+    """
+    Fila única con la versión de la galería. Cualquier cambio en ``Media`` la
+    incrementa, así que las respuestas cacheadas (ver cache.py) se invalidan
+    solas: la clave de caché lleva la versión.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'gallery_state'
+        verbose_name = "Estado de la galería"
+        verbose_name_plural = "Estado de la galería"
+
+    def __str__(self):
+        return f"v{self.version}"
+
+    @classmethod
+    def current(cls):
+        state, _ = cls.objects.get_or_create(pk=1)
+        return state
+
+    @classmethod
+    def bump(cls):
+        """
+        Nueva versión (dentro de la transacción de quien cambia los datos).
+        El UPDATE bloquea la fila hasta el commit, así que las versiones se
+        confirman en orden: sirven también de secuencia de cambios (``Media.change_seq``).
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(pk=1).update(
+                version=models.F('version') + 1, updated_at=timezone.now()
+            )
+            if not updated:
+                cls.objects.get_or_create(pk=1, defaults={'version': 1})
+            # Las conexiones SSE de este proceso se enteran al instante (events.py)
+            from .events import notify_change
+            transaction.on_commit(notify_change)
+            return cls.objects.filter(pk=1).values_list('version', flat=True).get()
+
+
+class MediaCounter(models.Model):
+    """
+    Totales de archivos visibles por tipo, mantenidos al vuelo para que ``stats``
+    y ``gallery.total_count`` no hagan ``COUNT(*)``. ``Media.save``/``delete``
+    y las operaciones masivas aplican solo la diferencia de las filas que tocan.
+    Si alguna vez se desincronizan: ``manage.py rebuild_media_counters``.
+    """
+
+    media_type = models.CharField(
+        max_length=10,
+        unique=True,
+        help_text="Tipo de media"
+    )
+    count = models.PositiveIntegerField(
+        default=0,
+        help_text="Archivos visibles"
+    )
+    bytes = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Bytes de los archivos visibles"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'media_counter'
+        verbose_name = "Contador de media"
+        verbose_name_plural = "Contadores de media"
+
+    def __str__(self):
+        return f"{self.media_type}: {self.count}"
+
+    @classmethod
+    def apply(cls, media_type, count, size):
+        """
+        Suma ``count`` archivos y ``size`` bytes al contador de ``media_type``.
+        Devuelve False si ha tenido que recalcularlo todo (ya no queda nada que sumar).
+        """
+        if not media_type or not (count or size):
+            return True
+        updated = cls.objects.filter(media_type=media_type).update(
+            count=models.F('count') + count, bytes=models.F('bytes') + size
+        )
+        if not updated:
+            # Primera vez que aparece el tipo: se calcula desde cero
+            cls.rebuild()
+            return False
+        return True
+
+    @classmethod
+    def apply_changes(cls, before, after):
+        """
+        Aplica la diferencia entre dos recuentos de las mismas filas
+        (``[(media_type, status, count, bytes), ...]``, ver ``MediaQuerySet.counted_totals``).
+        """
+        delta = {}
+        for sign, rows in ((-1, before), (1, after)):
+            for media_type, status, count, size in rows:
+                if status == 1:
+                    total = delta.setdefault(media_type, [0, 0])
+                    total[0] += sign * count
+                    total[1] += sign * (size or 0)
+        for media_type, (count, size) in delta.items():
+            if not cls.apply(media_type, count, size):
+                break
+
+    @classmethod
+    def rebuild(cls):
+        """Recalcula todos los contadores desde la tabla ``media``."""
+        totals = {
+            row['media_type']: row
+            for row in Media.objects.filter(status=1).exclude(media_type='')
+            .values('media_type')
+            .annotate(total=models.Count('id'), size=models.Sum('bytes'))
+        }
+        for media_type, _ in Media.MEDIA_TYPE_CHOICES:
+            totals.setdefault(media_type, {'total': 0, 'size': 0})
+        for media_type, row in totals.items():
+            cls.objects.update_or_create(
+                media_type=media_type,
+                defaults={'count': row['total'], 'bytes': row['size'] or 0},
+            )
+        return totals
+
+    @classmethod
+    def totals(cls):
+        """``{media_type: (count, bytes)}`` en una sola consulta."""
+        return {t: (c, b) for t, c, b in cls.objects.values_list('media_type', 'count', 'bytes')}
+
+
+# Campos de Media que afectan a los contadores
+COUNTED_FIELDS = {'status', 'media_type', 'bytes'}
+
+
+class MediaQuerySet(models.QuerySet):
+    """
+    Las operaciones masivas (``update`` de las acciones del admin, ``bulk_create``
+    de la subida por lotes...) no pasan por ``Media.save``: aquí también se
+    incrementa la versión de la galería y se mantienen los contadores.
+    """
+
+    def update(self, **kwargs):
+        if 'change_seq' in kwargs:
+            # Desde bulk_update, que ya lleva versión y contadores
+            return super().update(**kwargs)
+        counted = bool(COUNTED_FIELDS & kwargs.keys())
+        with transaction.atomic(using=self.db):
+            # Los contadores se ajustan con lo que había y lo que queda en estas
+            # filas: un GROUP BY sobre ellas, no sobre toda la tabla
+            before = self.counted_totals() if counted else None
+            if not (before if counted else self.exists()):
+                # Nada que cambiar: ni versión nueva ni bloqueo de gallery_state
+                return 0
+            change_seq = kwargs['change_seq'] = GalleryState.bump()
+            rows = super().update(**kwargs)
+            if rows and counted:
+                # change_seq es nuevo: identifica justo las filas cambiadas
+                MediaCounter.apply_changes(before, Media.objects.filter(change_seq=change_seq).counted_totals())
+        return rows
+
+    def counted_totals(self):
+        """``[(media_type, status, count, bytes), ...]`` de las filas del queryset."""
+        return list(
+            self.order_by().values_list('media_type', 'status')
+            .annotate(total=models.Count('id'), size=models.Sum('bytes'))
+        )
+
+    def _without_bookkeeping(self):
+        return models.QuerySet(self.model, query=self.query.chain(), using=self._db)
+
+    def update_internal(self, **kwargs):
+        """
+        ``update`` sin versión nueva, ``change_seq`` ni contadores: para campos
+        que ningún cliente ve cambiar (estado intermedio del procesado...).
+        """
+        return self._without_bookkeeping().update(**kwargs)
+
+    def bulk_update_internal(self, objs, fields, *args, **kwargs):
+        """``bulk_update`` sin versión ni contadores; quien lo usa sube la versión al terminar."""
+        return self._without_bookkeeping().bulk_update(objs, fields, *args, **kwargs)
+
+    def publish(self, pks, batch_size=1000):
+        """
+        Publica de una vez filas ya escritas con ``update_internal`` /
+        ``bulk_update_internal`` (comandos que van por lotes): una sola versión
+        nueva y ese ``change_seq`` en todas. Los contadores no se tocan.
+        """
+        pks = list(pks)
+        if not pks:
+            return None
+        with transaction.atomic(using=self.db):
+            change_seq = GalleryState.bump()
+            for start in range(0, len(pks), batch_size):
+                self.filter(pk__in=pks[start:start + batch_size]).update_internal(change_seq=change_seq)
+        return change_seq
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            before = self.counted_totals()
+            deleted = super().delete()
+            if deleted[0]:
+                MediaCounter.apply_changes(before, [])
+                GalleryState.bump()
+        return deleted
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return objs
+        if any(not media.media_type for media in objs):
+            raise ValueError("Tipo de archivo no soportado: solo imágenes y vídeos")
+        with transaction.atomic(using=self.db):
+            change_seq = GalleryState.bump()
+            for media in objs:
+                media.change_seq = change_seq
+            objs = super().bulk_create(objs, *args, **kwargs)
+            MediaCounter.apply_changes([], [(m.media_type, m.status, 1, m.bytes) for m in objs])
+            for media in objs:
+                media._remember_counted()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return 0
+        counted = bool(COUNTED_FIELDS & set(fields))
+        with transaction.atomic(using=self.db):
+            before = Media.objects.filter(pk__in=[m.pk for m in objs]).counted_totals() if counted else []
+            change_seq = GalleryState.bump()
+            for media in objs:
+                media.change_seq = change_seq
+            rows = super().bulk_update(objs, [*fields, 'change_seq'], *args, **kwargs)
+            if counted:
+                MediaCounter.apply_changes(before, Media.objects.filter(change_seq=change_seq).counted_totals())
+        return rows
+
+
 class Media(models.Model):
     MEDIA_TYPE_CHOICES = [
         ('image', 'Image'),
@@ -21,6 +283,14 @@ class Media(models.Model):
     STATUS_CHOICES = [
         (0, 'Oculto'),
         (1, 'Visible'),
+        (2, 'Eliminado'),
+    ]
+
+    PROCESSING_STATE_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('processing', 'Procesando'),
+        ('ready', 'Listo'),
+        ('failed', 'Fallido'),
     ]
 
     # --- Campos principales ---
@@ -54,22 +324,60 @@ class Media(models.Model):
     )
     width = models.PositiveSmallIntegerField(
         null=True, blank=True,
-        help_text="Ancho en píxeles (solo imágenes)"
+        help_text="Ancho en píxeles, ya girado como se muestra (orientación EXIF / matriz del vídeo)"
     )
     height = models.PositiveSmallIntegerField(
         null=True, blank=True,
-        help_text="Alto en píxeles (solo imágenes)"
+        help_text="Alto en píxeles, ya girado como se muestra (orientación EXIF / matriz del vídeo)"
     )
     duration_ms = models.PositiveIntegerField(
         null=True, blank=True,
         help_text="Duración en milisegundos (solo videos)"
     )
+    video_codec = models.CharField(
+        max_length=8, blank=True, default='',
+        help_text="Códec de la pista de vídeo (avc1, hvc1...), leído del MP4"
+    )
+    taken_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Fecha de captura (EXIF DateTimeOriginal o creation_time del MP4)"
+    )
+    camera_model = models.CharField(
+        max_length=64, blank=True, default='',
+        help_text="Modelo de cámara o móvil (EXIF)"
+    )
+
+    # Marcador de posición para pintar la cuadrícula antes de las miniaturas (ver placeholders.py)
+    placeholder = models.CharField(
+        max_length=1024, blank=True, default='',
+        help_text="Imagen de 16px en WebP como data: URI"
+    )
+    dominant_color = models.CharField(
+        max_length=7, blank=True, default='',
+        help_text="Color dominante (#rrggbb)"
+    )
+
+    derivatives = models.JSONField(
+        default=dict, blank=True,
+        help_text="Claves de las miniaturas por formato y anchura, p.ej. {'webp': {'320': 'images/x_320w.webp'}}"
+    )
+
+    processing_state = models.CharField(
+        max_length=12,
+        choices=PROCESSING_STATE_CHOICES,
+        default='ready',
+        help_text="Estado del procesado en segundo plano (hash, dimensiones, miniaturas...)"
+    )
 
     # --- Control y moderación ---
     status = models.PositiveSmallIntegerField(
         choices=STATUS_CHOICES,
         default=1,
-        help_text="1=visible, 0=oculto"
+        help_text="1=visible, 0=oculto, 2=eliminado (borrado lógico, se puede restaurar)"
+    )
+    deleted_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Momento del borrado lógico (status=2)"
     )
 
     # --- Timestamps ---
@@ -78,19 +386,51 @@ class Media(models.Model):
         help_text="Fecha y hora de creación"
     )
 
-    # Hash para deduplicación (opcional)
-    sha256 = models.BinaryField(
-        max_length=32,
+    # Secuencia del último cambio (versión de GalleryState): feed de cambios para el álbum
+    change_seq = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Versión de la galería en la que cambió por última vez"
+    )
+
+    # Hash para deduplicación (hex, indexado: se consulta en cada subida)
+    sha256 = models.CharField(
+        max_length=64,
+        null=True, blank=True,
+        help_text="Hash SHA256 (hex) del archivo para deduplicación"
+    )
+    # Si el fichero se reescribió (faststart), el hash del que se subió: es el que
+    # calculan los clientes antes de volver a subirlo
+    original_sha256 = models.CharField(
+        max_length=64,
+        null=True, blank=True,
+        help_text="SHA256 del archivo tal como se subió, si después se reescribió (faststart)"
+    )
+
+    # Casi duplicados (ver similarity.py): la misma foto recomprimida o redimensionada
+    phash = models.BigIntegerField(
+        null=True, blank=True,
+        help_text="Hash perceptual (dHash de 64 bits) para detectar fotos casi iguales"
+    )
+    similar_to = models.ForeignKey(
+        'self',
         null=True, blank=True,
-        help_text="Hash SHA256 del archivo para deduplicación"
+        on_delete=models.SET_NULL,
+        related_name='similar_media',
+        help_text="Foto original del grupo de casi duplicados (vacío si es la original o no tiene parecidas)"
     )
 
+    objects = MediaQuerySet.as_manager()
+
     class Meta:
         db_table = 'media'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['created_at'], name='idx_created_at'),
             models.Index(fields=['media_type', 'created_at'], name='idx_type_created'),
+            models.Index(fields=['sha256'], name='idx_sha256'),
+            models.Index(fields=['original_sha256'], name='idx_original_sha256'),
+            models.Index(fields=['change_seq'], name='idx_change_seq'),
+            models.Index(fields=['taken_at'], name='idx_taken_at'),
         ]
         verbose_name = "Media"
         verbose_name_plural = "Media Files"
@@ -100,58 +440,312 @@ class Media(models.Model):
         ok = self.object_key or '(sin clave)'
         return f"{mt}: {ok}"
 
+    @classmethod
+    def with_hashes(cls, hashes):
+        """
+        Archivos visibles con alguno de esos hashes. Los ocultos y eliminados no
+        cuentan: quien sube no puede verlos, así que no se le devuelven, y volver
+        a subir uno crea una fila nueva en vez de perderse en silencio.
+        """
+        return cls.objects.filter(
+            Q(sha256__in=hashes) | Q(original_sha256__in=hashes), status=1, deleted_at__isnull=True
+        )
+
+    def content_hashes(self):
+        """Hashes con los que se reconoce este archivo: el actual y el de la subida."""
+        return [h for h in (self.sha256, self.original_sha256) if h]
+
+    @classmethod
+    def find_duplicate(cls, sha256):
+        """El Media visible más antiguo con el mismo contenido, o None."""
+        if not sha256:
+            return None
+        return cls.with_hashes([sha256]).order_by('id').first()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            if self.status == 1:
+                MediaCounter.apply(self.media_type, -1, -(self.bytes or 0))
+            GalleryState.bump()
+        return deleted
+
+    # ----------------- Contadores -----------------
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_counted()
+        return instance
+
+    def _counted_values(self):
+        return (self.media_type, self.status, self.bytes)
+
+    def _remember_counted(self):
+        """Apunta lo que cuenta para MediaCounter tal y como está en la BD."""
+        # Con .only()/.defer() puede faltar algún campo: entonces no lo sabemos
+        if all(f in self.__dict__ for f in COUNTED_FIELDS):
+            self._counted = self._counted_values()
+        else:
+            self._counted = None
+
     # ----------------- Helpers internos -----------------
+    # Se ejecutan desde la cola de trabajos (jobs.py), nunca dentro de la petición:
+    # leen el fichero ya guardado a través del storage (local o S3).
     def _calculate_hash(self):
-        self.file.seek(0)
         file_hash = hashlib.sha256()
-        for chunk in iter(lambda: self.file.read(4096), b""):
-            file_hash.update(chunk)
-        self.file.seek(0)
-        return file_hash.digest()
+        with self.file.storage.open(self.file.name, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
 
     def _calculate_image_metadata(self):
-        # TO DO: implementar si quieres extraer width/height aquí
-        pass
+        # Image.open solo lee la cabecera; no decodifica los píxeles
+        from .exif import read_exif
+
+        with self.file.storage.open(self.file.name, 'rb') as fh:
+            with Image.open(fh) as img:
+                exif = read_exif(img)
+                self.width, self.height = exif['size']
+        self.taken_at = exif['taken_at']
+        self.camera_model = exif['camera_model']
 
     def _calculate_video_metadata(self):
-        # TO DO: implementar si quieres extraer duración aquí
-        pass
+        # Solo se lee la caja moov del MP4/MOV (unos KB), no el vídeo entero
+        from . import mp4
+
+        try:
+            info = mp4.probe(self.file.name)
+        except mp4.NotIsoBmff:
+            # WebM, AVI...: sin metadatos, como antes
+            return
+        self.duration_ms = info['duration_ms']
+        self.width = info['width']
+        self.height = info['height']
+        self.video_codec = info['codec'] or ''
+        self.taken_at = info['created_at']
 
     # ----------------- Save override -----------------
+    def prepare_file(self):
+        """
+        Sube el fichero si aún no está en el storage y rellena los metadatos que ya
+        se conocen sin leerlo (tamaño, tipo y lo que calculó MediaUploadHandler).
+        No toca la base de datos, así que se puede llamar desde varios hilos
+        antes de un ``bulk_create`` (ver ``batch_upload.py``).
+        """
+        # Lo que calculó MediaUploadHandler mientras llegaban los bytes
+        upload = streamed_upload(self.file)
+
+        if not self.file._committed:
+            # 1) Metadatos básicos (sin volver a leer el fichero)
+            self.bytes = self.file.size
+            # 2) Sube el fichero ya con una clave única, para que object_key sea la
+            #    ruta definitiva ('images/IMG_0001_1a2b3c4d.jpg')
+            self.file.save(unique_filename(self.file.name), self.file.file, save=False)
+        if not self.object_key:
+            self.object_key = self.file.name or None
+
+        if upload is not None:
+            self.sha256 = upload.sha256
+            if upload.image_size:
+                self.width, self.height = upload.image_size
+            if upload.exif:
+                self.taken_at = upload.exif['taken_at']
+                self.camera_model = upload.exif['camera_model']
+            self.mime_type = guess_mime_type(upload)
+        elif not self.mime_type:
+            # Las subidas directas ya traen el tipo comprobado (ver direct_upload.py)
+            self.mime_type, _ = mimetypes.guess_type(self.file.name)
+        if self.mime_type:
+            if self.mime_type.startswith('image'):
+                self.media_type = 'image'
+            elif self.mime_type.startswith('video'):
+                self.media_type = 'video'
+
     def save(self, *args, **kwargs):
         """
-        Calcula metadatos y, sobre todo, fija object_key ANTES del primer insert.
+        Calcula metadatos baratos y, sobre todo, fija object_key ANTES del primer insert.
         Así evitamos insertar con '' y romper el índice único.
+        El trabajo pesado (hash, dimensiones, miniaturas...) se encola al crear la fila.
         """
-        if self.file:
-            # 1) Asegura object_key antes del INSERT
-            if not self.object_key:
-                # Normalmente ya viene como 'images/archivo.jpg' por upload_to
-                self.object_key = self.file.name or None
+        adding = self._state.adding
 
-            # 2) Metadatos básicos
-            self.sha256 = self._calculate_hash()
-            self.bytes = getattr(self.file, 'size', None)
+        if self.file and kwargs.get('update_fields') is None:
+            self.prepare_file()
+            if adding:
+                self.processing_state = 'pending'
+        if adding and not self.media_type:
+            # Ni imagen ni vídeo (HTML, SVG...): nunca se publica
+            raise ValueError(f"Tipo de archivo no soportado: {self.mime_type or 'desconocido'}")
 
-            self.mime_type, _ = mimetypes.guess_type(self.file.name)
-            if self.mime_type:
-                if self.mime_type.startswith('image'):
-                    self.media_type = 'image'
-                elif self.mime_type.startswith('video'):
-                    self.media_type = 'video'
-
-            # 3) Metadatos de imagen/vídeo si quieres
-            if self.media_type == 'image':
-                self._calculate_image_metadata()
-            elif self.media_type == 'video':
-                self._calculate_video_metadata()
-
-        # INSERT/UPDATE ya con object_key no vacío
-        super().save(*args, **kwargs)
-
-        # Log útil
-        try:
-            print(f"✅ Archivo guardado: {self.file.url}")
-        except Exception:
-            pass
-        print(f"📁 Object key: {self.object_key}")
+        # INSERT/UPDATE ya con object_key no vacío (contadores y versión de la galería
+        # en la misma transacción)
+        previous = None if adding else getattr(self, '_counted', None)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+        with transaction.atomic():
+            if not adding and previous is None:
+                # No sabemos cómo estaba antes (instancia no cargada de la BD)
+                previous = type(self).objects.filter(pk=self.pk).values_list('media_type', 'status', 'bytes').first()
+            self.change_seq = GalleryState.bump()
+            super().save(*args, **kwargs)
+            if previous != self._counted_values():
+                if previous and previous[1] == 1:
+                    MediaCounter.apply(previous[0], -1, -(previous[2] or 0))
+                if self.status == 1:
+                    MediaCounter.apply(self.media_type, 1, self.bytes or 0)
+        self._remember_counted()
+
+        if adding and self.file:
+            # 3) Metadatos de imagen/vídeo en segundo plano
+            from .jobs import enqueue_media_jobs
+            transaction.on_commit(lambda: enqueue_media_jobs(self))
+            logger.info("Archivo guardado: %s", self.object_key)
+
+
+class ProcessingJob(models.Model):
+    """Trabajo en segundo plano sobre un Media (ver jobs.py y process_media_jobs)."""
+
+    KIND_CHOICES = [
+        ('hash', 'Hash SHA256'),
+        ('dimensions', 'Dimensiones'),
+        ('derivatives', 'Miniaturas'),
+        ('video_metadata', 'Metadatos de vídeo'),
+        ('faststart', 'Faststart (moov al principio)'),
+    ]
+
+    STATE_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'En curso'),
+        ('done', 'Hecho'),
+        ('failed', 'Fallido'),
+    ]
+
+    media = models.ForeignKey(
+        Media,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        help_text="Archivo sobre el que se ejecuta el trabajo"
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        help_text="Tipo de trabajo"
+    )
+    state = models.CharField(
+        max_length=10,
+        choices=STATE_CHOICES,
+        default='pending',
+        help_text="Estado del trabajo"
+    )
+    payload = models.JSONField(
+        default=dict, blank=True,
+        help_text="Parámetros adicionales del trabajo"
+    )
+
+    # --- Reintentos ---
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Intentos realizados"
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=5,
+        help_text="Intentos máximos antes de marcarlo como fallido"
+    )
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        help_text="No se ejecuta antes de esta fecha (backoff entre reintentos)"
+    )
+    locked_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Momento en que un worker lo tomó"
+    )
+    last_error = models.TextField(
+        blank=True,
+        help_text="Último error registrado"
+    )
+
+    # --- Timestamps ---
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'processing_job'
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['state', 'run_after'], name='idx_job_state_run'),
+        ]
+        verbose_name = "Trabajo de procesado"
+        verbose_name_plural = "Trabajos de procesado"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.media_id} ({self.state})"
+
+
+class UploadSession(models.Model):
+    """
+    Subida directa al almacenamiento: el cliente sube las partes con URLs
+    prefirmadas y al final se crea el Media (ver direct_upload.py).
+    """
+
+    STATE_CHOICES = [
+        ('open', 'Abierta'),
+        ('complete', 'Completada'),
+        ('aborted', 'Cancelada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    object_key = models.CharField(
+        max_length=512,
+        unique=True,
+        help_text="Clave definitiva del archivo en el almacenamiento"
+    )
+    filename = models.CharField(
+        max_length=255,
+        help_text="Nombre original del archivo"
+    )
+    mime_type = models.CharField(
+        max_length=100,
+        help_text="Tipo MIME declarado por el cliente"
+    )
+    total_bytes = models.PositiveBigIntegerField(
+        help_text="Tamaño total declarado"
+    )
+    part_size = models.PositiveIntegerField(
+        help_text="Tamaño de cada parte (la última puede ser menor)"
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA256 (hex) declarado por el cliente; se verifica al procesar"
+    )
+    s3_upload_id = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="UploadId de la subida multipart de S3"
+    )
+    state = models.CharField(
+        max_length=10,
+        choices=STATE_CHOICES,
+        default='open'
+    )
+    media = models.OneToOneField(
+        Media,
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name='upload_session',
+        help_text="Media creado al finalizar"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'upload_session'
+        verbose_name = "Subida directa"
+        verbose_name_plural = "Subidas directas"
+
+    def __str__(self):
+        return f"{self.filename} ({self.state})"
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.total_bytes // self.part_size))
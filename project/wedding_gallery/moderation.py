@@ -0,0 +1,54 @@
+"""
+Moderación en bloque: ocultar, mostrar, eliminar (borrado lógico) y restaurar.
+
+Cada acción es un solo ``UPDATE ... WHERE id IN (...)`` a través de
+``MediaQuerySet.update``, que en la misma transacción sube la versión de la
+galería (cachés, ETags, feed de cambios y SSE) y ajusta los contadores.
+El filtro por estado hace que solo cuenten (y se notifiquen) las filas que
+cambian de verdad: ocultar algo ya oculto no hace nada.
+
+Eliminar no borra la fila ni el fichero: ``status=2`` lo saca del álbum igual
+que ocultarlo, pero queda claro que no debe volver a mostrarse y se puede
+restaurar.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Media
+
+# Orden en que se aplican si una petición trae varias acciones
+ACTIONS = ('hide', 'show', 'delete', 'restore')
+
+
+def _changes(action):
+    """``(filas a las que aplica, campos a cambiar)`` de cada acción."""
+    if action == 'hide':
+        return Q(status=1), {'status': 0}
+    if action == 'show':
+        return Q(status=0), {'status': 1}
+    if action == 'delete':
+        return ~Q(status=2), {'status': 2, 'deleted_at': timezone.now()}
+    if action == 'restore':
+        return Q(status=2), {'status': 1, 'deleted_at': None}
+    raise ValueError(f"Acción de moderación desconocida: {action}")
+
+
+def moderate(queryset, action):
+    """Aplica ``action`` a ``queryset`` en un solo UPDATE; devuelve las filas cambiadas."""
+    applies_to, fields = _changes(action)
+    return queryset.filter(applies_to).update(**fields)
+
+
+def apply_actions(actions):
+    """
+    ``{'hide': [ids], 'delete': [ids], ...}`` -> ``{'hide': n, 'delete': m, ...}``
+    todo en una transacción: o se aplican todas las acciones o ninguna.
+    """
+    affected = {}
+    with transaction.atomic():
+        for action in ACTIONS:
+            ids = actions.get(action)
+            if ids:
+                affected[action] = moderate(Media.objects.filter(pk__in=ids), action)
+    return affected
@@ -0,0 +1,324 @@
+"""
+Metadatos de vídeos MP4 / MOV (ISO-BMFF) leyendo solo las cabeceras.
+
+Un MP4 es una lista de "cajas" (``[tamaño][tipo][contenido]``). Todo lo que nos
+interesa (duración, dimensiones, códec) está en la caja ``moov``, que ocupa unos
+KB frente a los cientos de MB de ``mdat`` (los fotogramas). Se recorren las cajas
+de primer nivel leyendo solo sus cabeceras y se descarga únicamente ``moov``, esté
+al principio (faststart) o al final del fichero (lo normal en móviles).
+
+Las lecturas son por rango (``storage.RangedReader``): en S3 son ``GET`` con
+``Range``, así que un vídeo de 500 MB cuesta 2-3 peticiones y unos pocos KB.
+
+``faststart`` reescribe los vídeos con ``moov`` al final para que quede delante
+de ``mdat``: el navegador puede empezar a reproducir con los primeros KB en vez
+de descargar casi todo el fichero para encontrar el índice.
+"""
+import hashlib
+import struct
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from .storage import RangedReader, iter_file, put_file
+
+# Primera lectura: con faststart suele traer ftyp + moov completo de una vez
+HEAD_READ = 64 * 1024
+# Un moov de más de esto es un fichero corrupto (o algo que no es un vídeo)
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# Las fechas de mvhd son segundos desde 1904 (UTC); antes de esto es que no hay fecha
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+MIN_CREATION_YEAR = 2001
+
+# Cajas con las que puede empezar un fichero ISO-BMFF / QuickTime
+TOP_LEVEL_START = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid'}
+
+
+class Mp4Error(Exception):
+    """El fichero parece un MP4 pero está incompleto o corrupto."""
+
+
+class NotIsoBmff(Mp4Error):
+    """El fichero no es MP4/MOV (p.ej. WebM o AVI): no hay nada que leer."""
+
+
+def _box_header(data, pos):
+    """``(tamaño total, tipo, tamaño de la cabecera)`` de la caja en ``data[pos:]``."""
+    size, box_type = struct.unpack_from('>I4s', data, pos)
+    header = 8
+    if size == 1:
+        size, = struct.unpack_from('>Q', data, pos + 8)
+        header = 16
+    return size, box_type, header
+
+
+def _children(data, start, end):
+    """Cajas hijas entre ``start`` y ``end``: ``(tipo, inicio del contenido, fin)``."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type, header = _box_header(data, pos)
+        if size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise Mp4Error(f"Caja {box_type!r} con tamaño no válido")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _child(data, start, end, box_type):
+    for child_type, child_start, child_end in _children(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _top_level_boxes(reader, head):
+    """
+    Cajas de primer nivel ``(tipo, posición, tamaño, cabecera)`` leyendo solo sus
+    cabeceras: lo que cae dentro de ``head`` (el principio del fichero ya leído)
+    no se vuelve a pedir.
+    """
+    size = reader.size
+    pos = 0
+    first = True
+    while pos < size:
+        if pos + 16 <= len(head):
+            data, at = head, pos
+        else:
+            data, at = reader.read(pos, 16), 0
+        if len(data) - at < 8:
+            break
+        box_size, box_type, header = _box_header(data, at)
+        if first and box_type not in TOP_LEVEL_START:
+            raise NotIsoBmff(f"Tipo de fichero no soportado (empieza por {box_type!r})")
+        first = False
+        if box_size == 0:
+            box_size = size - pos
+        if box_size < header:
+            raise Mp4Error(f"Caja {box_type!r} con tamaño no válido")
+        yield box_type, pos, box_size, header
+        pos += box_size
+
+
+def _read_box(reader, head, pos, size):
+    """La caja completa (cabecera incluida)."""
+    if size > MAX_MOOV_BYTES:
+        raise Mp4Error(f"moov demasiado grande ({size} bytes)")
+    if pos + size <= len(head):
+        return head[pos:pos + size]
+    data = reader.read(pos, size)
+    if len(data) < size:
+        raise Mp4Error("moov incompleto (¿fichero cortado?)")
+    return data
+
+
+def read_moov(reader):
+    """Contenido de la caja ``moov`` leyendo lo mínimo posible."""
+    head = reader.read(0, HEAD_READ)
+    for box_type, pos, size, header in _top_level_boxes(reader, head):
+        if box_type == b'moov':
+            return _read_box(reader, head, pos, size)[header:]
+    raise Mp4Error("No hay caja moov (¿fichero cortado o subida a medias?)")
+
+
+def _full_box_times(data, start):
+    """``(timescale, duración)`` de ``mvhd`` / ``mdhd`` (versión 0 o 1)."""
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, start + 20)
+        unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack_from('>II', data, start + 12)
+        unknown = 0xFFFFFFFF
+    return timescale, (None if duration == unknown else duration)
+
+
+def _creation_time(data, start):
+    """``creation_time`` de ``mvhd`` como datetime UTC, o ``None`` si no está puesta."""
+    fmt = '>Q' if data[start] == 1 else '>I'
+    seconds, = struct.unpack_from(fmt, data, start + 4)
+    try:
+        created = MP4_EPOCH + timedelta(seconds=seconds)
+    except OverflowError:
+        return None
+    return created if created.year >= MIN_CREATION_YEAR else None
+
+
+def _to_ms(duration, timescale):
+    if not duration or not timescale:
+        return None
+    return round(duration * 1000 / timescale)
+
+
+def _track_info(data, start, end):
+    """Handler, dimensiones, duración y códec de una caja ``trak``."""
+    info = {'handler': None, 'width': None, 'height': None, 'duration_ms': None, 'codec': None}
+
+    tkhd = _child(data, start, end, b'tkhd')
+    if tkhd:
+        s = tkhd[0]
+        matrix = s + (52 if data[s] == 1 else 40)
+        a, b = struct.unpack_from('>ii', data, matrix)
+        c, d = struct.unpack_from('>ii', data, matrix + 12)
+        width, height = struct.unpack_from('>II', data, matrix + 36)
+        width, height = width >> 16, height >> 16
+        # Vídeos de móvil en vertical: se graban apaisados con una matriz de 90°
+        if a == 0 and d == 0 and b and c:
+            width, height = height, width
+        info['width'], info['height'] = width or None, height or None
+
+    mdia = _child(data, start, end, b'mdia')
+    if mdia:
+        hdlr = _child(data, *mdia, b'hdlr')
+        if hdlr:
+            info['handler'] = data[hdlr[0] + 8:hdlr[0] + 12]
+        mdhd = _child(data, *mdia, b'mdhd')
+        if mdhd:
+            timescale, duration = _full_box_times(data, mdhd[0])
+            info['duration_ms'] = _to_ms(duration, timescale)
+        minf = _child(data, *mdia, b'minf')
+        stbl = minf and _child(data, *minf, b'stbl')
+        stsd = stbl and _child(data, *stbl, b'stsd')
+        if stsd and stsd[0] + 16 <= stsd[1]:
+            # version/flags (4) + número de entradas (4) + primera entrada: tamaño (4) + tipo (4)
+            codec = data[stsd[0] + 12:stsd[0] + 16]
+            info['codec'] = codec.decode('latin-1').strip() or None
+    return info
+
+
+def parse_moov(moov):
+    """``{'duration_ms', 'width', 'height', 'codec', 'created_at'}`` a partir del contenido de ``moov``."""
+    try:
+        duration_ms = None
+        created_at = None
+        fragment_duration = None
+        timescale = None
+        video = None
+
+        for box_type, start, end in _children(moov, 0, len(moov)):
+            if box_type == b'mvhd':
+                timescale, duration = _full_box_times(moov, start)
+                duration_ms = _to_ms(duration, timescale)
+                created_at = _creation_time(moov, start)
+            elif box_type == b'mvex':
+                # MP4 fragmentado: la duración total va en mehd
+                mehd = _child(moov, start, end, b'mehd')
+                if mehd:
+                    fmt = '>Q' if moov[mehd[0]] == 1 else '>I'
+                    fragment_duration, = struct.unpack_from(fmt, moov, mehd[0] + 4)
+            elif box_type == b'trak' and video is None:
+                track = _track_info(moov, start, end)
+                if track['handler'] == b'vide':
+                    video = track
+    except (struct.error, IndexError) as e:
+        raise Mp4Error(f"moov truncado: {e}")
+
+    if video is None:
+        raise Mp4Error("El fichero no tiene pista de vídeo")
+    if not duration_ms and fragment_duration:
+        duration_ms = _to_ms(fragment_duration, timescale)
+    return {
+        'duration_ms': duration_ms or video['duration_ms'],
+        'width': video['width'],
+        'height': video['height'],
+        'codec': video['codec'],
+        'created_at': created_at,
+    }
+
+
+def probe(name):
+    """Metadatos del vídeo ``name`` del storage (lanza ``Mp4Error`` / ``NotIsoBmff``)."""
+    with RangedReader(name) as reader:
+        return parse_moov(read_moov(reader))
+
+
+# ----------------- Faststart -----------------
+
+# Cajas que contienen (directa o indirectamente) las tablas de offsets
+OFFSET_CONTAINERS = {b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _shift_chunk_offsets(moov, start, end, first, last, delta):
+    """
+    Suma ``delta`` a las entradas de ``stco`` / ``co64`` que apuntan a
+    ``[first, last)``: los datos que quedan detrás del ``moov`` al moverlo.
+    """
+    for box_type, box_start, box_end in _children(moov, start, end):
+        if box_type in OFFSET_CONTAINERS:
+            _shift_chunk_offsets(moov, box_start, box_end, first, last, delta)
+        elif box_type == b'cmov':
+            raise Mp4Error("moov comprimido: no se puede reescribir")
+        elif box_type in (b'stco', b'co64'):
+            fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            count, = struct.unpack_from('>I', moov, box_start + 4)
+            pos = box_start + 8
+            if pos + count * width > box_end:
+                raise Mp4Error(f"{box_type.decode()} truncado")
+            for _ in range(count):
+                offset, = struct.unpack_from(fmt, moov, pos)
+                if first <= offset < last:
+                    offset += delta
+                    if box_type == b'stco' and offset > 0xFFFFFFFF:
+                        raise Mp4Error("Los offsets ya no caben en stco (vídeo de más de 4 GB)")
+                    struct.pack_into(fmt, moov, pos, offset)
+                pos += width
+
+
+def plan_faststart(reader):
+    """
+    ``None`` si el ``moov`` ya va delante de los datos. Si no, ``(moov, tramos)``:
+    el ``moov`` con los offsets corregidos y el orden en que copiar el fichero,
+    donde cada tramo es ``(inicio, fin)`` del original o ``None`` para el ``moov``.
+    """
+    head = reader.read(0, HEAD_READ)
+    moov_box = first_mdat = None
+    for box_type, pos, size, header in _top_level_boxes(reader, head):
+        if box_type == b'mdat' and first_mdat is None:
+            first_mdat = pos
+        elif box_type == b'moov':
+            moov_box = (pos, size)
+            break
+    if moov_box is None:
+        raise Mp4Error("No hay caja moov (¿fichero cortado o subida a medias?)")
+    moov_pos, moov_size = moov_box
+    if first_mdat is None or moov_pos < first_mdat:
+        return None
+
+    moov = bytearray(_read_box(reader, head, moov_pos, moov_size))
+    _, _, header = _box_header(moov, 0)
+    try:
+        _shift_chunk_offsets(moov, header, len(moov), first_mdat, moov_pos, moov_size)
+    except (struct.error, IndexError) as e:
+        raise Mp4Error(f"moov truncado: {e}")
+    segments = [(0, first_mdat), None, (first_mdat, moov_pos), (moov_pos + moov_size, reader.size)]
+    return bytes(moov), segments
+
+
+def faststart(name, new_name, content_type=None):
+    """
+    Copia ``name`` a la clave ``new_name`` con el ``moov`` delante de ``mdat``,
+    sin cargar el vídeo en memoria: se copia por tramos a un temporal en disco
+    (calculando el SHA256 de paso) y se sube. ``name`` no se toca.
+    Devuelve ``(sha256, bytes)`` del fichero nuevo, o ``None`` si no hacía falta.
+    """
+    with RangedReader(name) as reader:
+        plan = plan_faststart(reader)
+    if plan is None:
+        return None
+    moov, segments = plan
+
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as tmp:
+        for segment in segments:
+            chunks = [moov] if segment is None else iter_file(
+                name, settings.MEDIA_DOWNLOAD_CHUNK_SIZE, start=segment[0], end=segment[1]
+            )
+            for chunk in chunks:
+                tmp.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        tmp.seek(0)
+        put_file(new_name, tmp, content_type=content_type)
+    return digest.hexdigest(), size
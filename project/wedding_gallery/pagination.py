@@ -0,0 +1,128 @@
+"""
+Paginación por cursor (keyset) sobre ``(created_at, id)`` descendente.
+
+En vez de ``OFFSET n`` + ``COUNT(*)`` en cada página, cada página continúa donde
+acabó la anterior::
+
+    WHERE created_at < :c OR (created_at = :c AND id < :id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT page_size + 1
+
+Eso recorre directamente ``idx_created_at`` / ``idx_type_created`` (en InnoDB los
+índices secundarios ya llevan el id al final), así que la página 200 cuesta lo
+mismo que la primera. El cursor es opaco para el cliente: basta con seguir ``next``.
+
+El campo y el sentido salen de ``ordering``: ``TimelinePagination`` recorre
+``(taken_at, id)`` ascendente sobre ``idx_taken_at``.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(fecha, id)`` del último elemento de la página anterior."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise NotFound('Cursor no válido')
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        field = self.ordering[0].lstrip('-')
+        op = 'lt' if self.ordering[0].startswith('-') else 'gt'
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk}))
+
+        # Un elemento de más nos dice si hay página siguiente sin hacer COUNT(*)
+        page = list(queryset[:size + 1])
+        self.next_cursor = None
+        if len(page) > size:
+            page = page[:size]
+            self.next_cursor = encode_cursor(getattr(page[-1], field), page[-1].pk)
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor de la página (el de "next" de la respuesta anterior)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Elementos por página (máx. {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class GalleryPagination(KeysetPagination):
+    """Páginas más grandes para el álbum (se piden mientras se hace scroll)."""
+    page_size = 60
+    max_page_size = 200
+
+
+class TimelinePagination(GalleryPagination):
+    """Fotos de un tramo de la línea de tiempo, en el orden en que se hicieron."""
+    ordering = ('taken_at', 'id')
@@ -0,0 +1,49 @@
+"""
+Marcadores de posición (LQIP) para la cuadrícula del álbum.
+
+Con ``width``/``height`` el álbum ya sabe el hueco de cada foto, pero hasta que
+llega la miniatura el hueco está en blanco. Por cada imagen se guardan:
+
+- ``placeholder``: la foto reducida a 16 px de ancho en WebP como ``data:`` URI
+  (unos 150-300 caracteres), que el navegador pinta borrosa al instante;
+- ``dominant_color``: el color más frecuente (``#rrggbb``) para el fondo.
+
+Ambos salen de la miniatura más pequeña, que ya está decodificada al generar
+los derivados; no se vuelve a leer el original.
+"""
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_MAX_HEIGHT = 64   # panorámicas verticales: el navegador lo estira igual
+PLACEHOLDER_QUALITY = 40
+# Tamaño al que se reduce la imagen para buscar el color dominante
+COLOR_SAMPLE_SIZE = 64
+
+
+def placeholder_data_uri(img):
+    """``data:image/webp;base64,...`` de ``img`` a ``PLACEHOLDER_WIDTH`` px de ancho."""
+    height = min(max(1, round(img.height * PLACEHOLDER_WIDTH / img.width)), PLACEHOLDER_MAX_HEIGHT)
+    small = img.resize((PLACEHOLDER_WIDTH, height), Image.BOX)
+    buf = BytesIO()
+    small.save(buf, 'WEBP', quality=PLACEHOLDER_QUALITY, method=6)
+    return 'data:image/webp;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+def dominant_color(img):
+    """
+    Color más frecuente como ``#rrggbb``: los píxeles se cuantizan a 4 bits por
+    canal (4096 cajas), se cuentan de una vez con ``bincount`` y se devuelve la
+    media de los píxeles de la caja más poblada.
+    """
+    sample = img.convert('RGB')
+    sample.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE), Image.BOX)
+    pixels = np.asarray(sample, dtype=np.uint8).reshape(-1, 3)
+    quantized = (pixels >> 4).astype(np.uint16)
+    bins = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+    top = np.bincount(bins, minlength=4096).argmax()
+    red, green, blue = pixels[bins == top].mean(axis=0).round().astype(int)
+    return f'#{red:02x}{green:02x}{blue:02x}'
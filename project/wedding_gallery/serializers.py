@@ -1,81 +1,164 @@
 import mimetypes
+
+from django.conf import settings
 from rest_framework import serializers
-from PIL import Image
-from io import BytesIO
 
 from .models import Media
+from .uploadhandlers import guess_mime_type
+
+
+ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+ALLOWED_VIDEO_TYPES = ['video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm']
+
+
+def validate_mime_type(mime_type):
+    if not mime_type:
+        raise serializers.ValidationError("Tipo de archivo no reconocido")
+    if mime_type not in ALLOWED_IMAGE_TYPES + ALLOWED_VIDEO_TYPES:
+        raise serializers.ValidationError(
+            "Tipo de archivo no permitido. Solo imágenes (JPEG, PNG, GIF, WebP) y vídeos (MP4, MOV, AVI, WebM)"
+        )
+    return mime_type
+
+
+def validate_upload(upload):
+    """
+    Tipo de un fichero subido: tiene que ser de un tipo permitido y la extensión de
+    la misma familia (la clave se guarda con ella; ver ``direct_upload.content_matches``).
+    """
+    mime_type = validate_mime_type(guess_mime_type(upload))
+    guessed = mimetypes.guess_type(upload.name)[0]
+    if not guessed or guessed.split('/')[0] != mime_type.split('/')[0]:
+        raise serializers.ValidationError("La extensión del archivo no corresponde a su contenido")
+    return mime_type
 
 
-class MediaSerializer(serializers.ModelSerializer):
+def _absolute_url(request, url):
+    return request.build_absolute_uri(url) if request else url
+
+
+class SrcsetMixin:
+    """Expone los derivados como ``{formato: {anchura: url}}`` para montar ``srcset``."""
+
+    def get_srcset(self, obj):
+        if not obj.derivatives:
+            return None
+        request = self.context.get('request')
+        storage = obj.file.storage
+        return {
+            fmt: {width: _absolute_url(request, storage.url(key)) for width, key in by_width.items()}
+            for fmt, by_width in obj.derivatives.items()
+        }
+
+
+class MediaSerializer(SrcsetMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Media
         fields = [
-            'id', 'object_key', 'file', 'file_url', 'mime_type', 'media_type',
-            'bytes', 'width', 'height', 'duration_ms', 'status', 'created_at'
+            'id', 'object_key', 'file', 'file_url', 'srcset', 'mime_type', 'media_type',
+            'bytes', 'width', 'height', 'duration_ms', 'video_codec', 'status', 'processing_state',
+            'placeholder', 'dominant_color', 'similar_to', 'taken_at', 'camera_model', 'created_at'
         ]
+        # status solo lo cambia la moderación (POST /api/media/moderate/, solo administradores)
         read_only_fields = [
-            'id', 'object_key', 'file_url', 'bytes', 'width',
-            'height', 'duration_ms', 'created_at', 'sha256'
+            'id', 'object_key', 'file_url', 'srcset', 'bytes', 'width', 'height', 'duration_ms', 'video_codec',
+            'status', 'processing_state', 'placeholder', 'dominant_color', 'similar_to', 'taken_at', 'camera_model',
+            'created_at', 'sha256'
         ]
 
     def get_file_url(self, obj):
         if obj.file:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.file.url) if request else obj.file.url
+            return _absolute_url(self.context.get('request'), obj.file.url)
         return None
 
     def validate_file(self, value):
-        mime_type, _ = mimetypes.guess_type(value.name)
-        if not mime_type:
-            raise serializers.ValidationError("Tipo de archivo no reconocido")
-
-        allowed_image = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-        allowed_video = ['video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm']
-
-        if mime_type not in allowed_image + allowed_video:
-            raise serializers.ValidationError(
-                "Tipo de archivo no permitido. Solo imágenes (JPEG, PNG, GIF, WebP) y vídeos (MP4, MOV, AVI, WebM)"
-            )
+        validate_upload(value)
         return value
 
     def create(self, validated_data):
         file = validated_data['file']
 
-        mime_type, _ = mimetypes.guess_type(file.name)
+        mime_type = guess_mime_type(file)
         validated_data['mime_type'] = mime_type or 'application/octet-stream'
         if mime_type and mime_type.startswith('image/'):
             validated_data['media_type'] = 'image'
         elif mime_type and mime_type.startswith('video/'):
             validated_data['media_type'] = 'video'
 
-        instance = super().create(validated_data)
-
-        # Extraer metadatos sin usar .path (compatible con S3)
-        if instance.media_type == 'image':
-            try:
-                # Asegura que leemos desde el principio del stream
-                instance.file.seek(0)
-                with Image.open(BytesIO(instance.file.read())) as img:
-                    instance.width, instance.height = img.width, img.height
-                # Guarda solo los campos cambiados
-                instance.save(update_fields=['width', 'height'])
-            except Exception:
-                pass
-
-        return instance
+        # Solo guardamos la fila; hash, dimensiones y miniaturas van a la cola (jobs.py)
+        return super().create(validated_data)
 
 
-class MediaListSerializer(serializers.ModelSerializer):
+class MediaListSerializer(SrcsetMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Media
-        fields = ['id', 'file_url', 'media_type', 'width', 'height', 'created_at']
+        fields = [
+            'id', 'file_url', 'srcset', 'media_type', 'width', 'height', 'placeholder', 'dominant_color',
+            'duration_ms', 'taken_at', 'created_at'
+        ]
 
     def get_file_url(self, obj):
         if obj.file:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.file.url) if request else obj.file.url
+            return _absolute_url(self.context.get('request'), obj.file.url)
         return None
+
+
+class MediaChangeSerializer(MediaListSerializer):
+    """Fila del feed de cambios: incluye ``status`` para saber si quitarla del álbum."""
+
+    class Meta(MediaListSerializer.Meta):
+        fields = MediaListSerializer.Meta.fields + ['status']
+
+
+class ModerationSerializer(serializers.Serializer):
+    """Listas de ids por acción: ``{"hide": [1, 2], "delete": [3]}``."""
+    hide = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    show = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    delete = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    restore = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    def validate(self, attrs):
+        ids = [pk for action_ids in attrs.values() for pk in action_ids]
+        if not ids:
+            raise serializers.ValidationError("Indica al menos una acción con ids: hide, show, delete o restore")
+        if len(ids) > settings.MEDIA_MODERATE_MAX_IDS:
+            raise serializers.ValidationError(f"Máximo {settings.MEDIA_MODERATE_MAX_IDS} ids por petición")
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("Un mismo id no puede ir en dos acciones")
+        return attrs
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    """Petición de subida directa: qué se va a subir."""
+    filename = serializers.CharField(max_length=255)
+    bytes = serializers.IntegerField(min_value=1, max_value=settings.DIRECT_UPLOAD_MAX_BYTES)
+    content_type = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        guessed = mimetypes.guess_type(attrs['filename'])[0]
+        mime_type = validate_mime_type(attrs.get('content_type') or guessed)
+        # La clave se guarda con la extensión del nombre: un 'foto.html' declarado
+        # como image/jpeg acabaría servido como HTML
+        if guessed != mime_type:
+            raise serializers.ValidationError(
+                {'filename': "La extensión del archivo no corresponde al tipo declarado"}
+            )
+        attrs['content_type'] = mime_type
+        attrs['sha256'] = (attrs.get('sha256') or '').lower()
+        return attrs
+
+
+class UploadPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField(max_length=255)
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    parts = UploadPartSerializer(many=True, required=False)
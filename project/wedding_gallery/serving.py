@@ -0,0 +1,79 @@
+"""
+Ficheros de ``/media/`` sin S3 (instalaciones locales / sin conexión).
+
+Antes solo se servían con ``static()`` y ``DEBUG=True``. Ahora ``serve_media``
+comprueba que el fichero pertenece a un ``Media`` visible (los ocultos dan 404
+salvo al staff) y luego:
+
+- con ``MEDIA_ACCEL_REDIRECT`` responde solo con la cabecera ``X-Accel-Redirect``
+  y el proxy (Caddy con ``handle_response``, o nginx con ``internal``) manda el
+  fichero: Range, ETag y sendfile los pone el proxy y el worker de Django queda
+  libre al instante;
+- si no, ``FileResponse`` o un 206 si se pide un rango. Con gunicorn y workers
+  WSGI el fichero sale con sendfile; bajo ASGI se envía por trozos desde un hilo
+  (ver ``downloads.streaming_body``).
+
+Solo las imágenes y vídeos de los tipos permitidos se sirven ``inline``; lo demás
+va como adjunto y siempre con ``X-Content-Type-Options: nosniff``, para que un
+fichero con otro contenido nunca se interprete como HTML en el dominio.
+
+Ningún fichero publicado cambia de contenido: las claves son únicas por subida y
+lo que se reescribe (faststart) va a una clave nueva. Por eso se pueden cachear
+mucho tiempo (``MEDIA_CACHE_SECONDS``).
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.utils._os import safe_join
+
+from .models import Media
+
+# images/foto_640w.webp o images/foto_640w_AbC1234.webp (si el nombre ya existía)
+DERIVATIVE_RE = re.compile(r'^images/(?P<stem>.+)_\d+w(?:_[A-Za-z0-9]{7})?\.(?:webp|avif)$')
+
+# Carpetas donde get_upload_path deja los originales de los que salen derivados
+ORIGINAL_FOLDERS = ('images/', 'other/')
+
+
+def find_media(key):
+    """El ``Media`` al que pertenece ``key`` (original o miniatura), o ``None``."""
+    media = Media.objects.filter(object_key=key).first()
+    if media is not None:
+        return media
+
+    match = DERIVATIVE_RE.match(key)
+    if not match:
+        return None
+    # Candidatos por prefijo (usa el índice único de object_key) y se confirma
+    # que la miniatura está realmente en sus derivados
+    prefixes = Q()
+    for folder in ORIGINAL_FOLDERS:
+        prefixes |= Q(object_key__startswith=f"{folder}{match['stem']}.")
+    for media in Media.objects.filter(prefixes, media_type='image'):
+        if any(key in by_width.values() for by_width in (media.derivatives or {}).values()):
+            return media
+    return None
+
+
+def media_path(key):
+    """Ruta en disco de ``key`` (``None`` si intenta salir de ``MEDIA_ROOT``)."""
+    try:
+        return safe_join(settings.MEDIA_ROOT, key)
+    except SuspiciousFileOperation:
+        return None
+
+
+def guess_content_type(key, media=None):
+    if media is not None and media.object_key == key and media.mime_type:
+        return media.mime_type
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def file_etag(path):
+    """Como nginx: fecha de modificación + tamaño (no hace falta leer el fichero)."""
+    stat = os.stat(path)
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
@@ -0,0 +1,169 @@
+"""
+Casi duplicados: la misma foto reenviada por WhatsApp, recortada, con otro
+tamaño o recomprimida. El SHA256 no los detecta porque los bytes cambian.
+
+Cada imagen lleva un hash perceptual de 64 bits (dHash: se reduce a 9x8 en gris
+y cada bit dice si un píxel es más claro que su vecino de la derecha). Dos fotos
+casi iguales tienen hashes a poca distancia de Hamming (bits distintos), así que
+buscar parecidas es contar bits de ``XOR`` contra todos los hashes del álbum.
+
+``SimilarityIndex`` guarda los hashes en un array de NumPy (8 bytes por foto) y
+hace esa cuenta de golpe para todo el array: con decenas de miles de fotos una
+búsqueda tarda del orden de decenas de microsegundos. El índice vive en memoria
+del proceso (worker de trabajos o web en modo eager) y se pone al día leyendo
+solo las filas con ``change_seq`` posterior a la última lectura.
+
+Los grupos se guardan en ``Media.similar_to``: todas las fotos de un grupo
+apuntan a la más antigua (la "original"), que tiene ``similar_to`` a ``None``.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image
+
+from .models import Media
+
+HASH_SIZE = 8
+_SIGN = 1 << 63
+
+
+def to_signed(value):
+    """El hash sin signo (0..2⁶⁴-1) tal como cabe en un ``BIGINT`` con signo."""
+    return value - (1 << 64) if value >= _SIGN else value
+
+
+def dhash(img):
+    """dHash de 64 bits de una imagen de Pillow (con signo, listo para guardar)."""
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return to_signed(int.from_bytes(np.packbits(bits).tobytes(), 'big'))
+
+
+def find_clusters(ids, hashes, max_distance):
+    """
+    Agrupa a la vez todas las fotos (``ids`` en orden creciente). Cada pareja a
+    ``max_distance`` o menos une sus grupos (union-find): si A se parece a B y
+    B a C, las tres acaban juntas aunque A y C no se parezcan. La original de
+    cada grupo es la más antigua. Devuelve ``{id: id de la original o None}``.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+    parent = list(range(len(ids)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(1, len(ids)):
+        for j in np.flatnonzero(np.bitwise_count(hashes[:i] ^ hashes[i]) <= max_distance).tolist():
+            a, b = find(i), find(j)
+            if a != b:
+                # La raíz es siempre la posición más baja: la foto más antigua
+                parent[max(a, b)] = min(a, b)
+    roots = [int(ids[find(i)]) for i in range(len(ids))]
+    return {int(pk): (None if root == pk else root) for pk, root in zip(ids, roots)}
+
+
+class SimilarityIndex:
+    """Hashes de todas las imágenes del álbum en memoria, para búsquedas incrementales."""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.positions = {}
+        self.seq = -1
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self):
+        """Añade (o corrige) las imágenes que han cambiado desde la última vez."""
+        rows = list(
+            Media.objects.filter(change_seq__gt=self.seq, media_type='image', phash__isnull=False)
+            .values_list('id', 'phash', 'change_seq')
+        )
+        if not rows:
+            return
+        with self.lock:
+            new_ids, new_hashes = [], []
+            for pk, phash, seq in rows:
+                self.seq = max(self.seq, seq)
+                value = np.int64(phash).view(np.uint64)
+                if pk in self.positions:
+                    self.hashes[self.positions[pk]] = value
+                    continue
+                self.positions[pk] = len(self.ids) + len(new_ids)
+                new_ids.append(pk)
+                new_hashes.append(value)
+            if new_ids:
+                self.ids = np.concatenate([self.ids, np.array(new_ids, dtype=np.int64)])
+                self.hashes = np.concatenate([self.hashes, np.array(new_hashes, dtype=np.uint64)])
+
+    def search(self, phash, max_distance=None, exclude=None):
+        """``[(id, distancia), ...]`` de los hashes a ``max_distance`` o menos, de más a menos parecido."""
+        if max_distance is None:
+            max_distance = settings.MEDIA_SIMILAR_MAX_DISTANCE
+        with self.lock:
+            ids, hashes = self.ids, self.hashes
+        distances = np.bitwise_count(hashes ^ np.int64(phash).view(np.uint64))
+        near = np.flatnonzero(distances <= max_distance)
+        found = sorted(zip(distances[near].tolist(), ids[near].tolist()))
+        return [(pk, distance) for distance, pk in found if pk != exclude]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Índice del proceso, al día con la base de datos."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+    _index.refresh()
+    return _index
+
+
+def link_similar(media):
+    """
+    Mete ``media`` (con ``phash`` ya guardado) en el grupo de sus parecidas
+    visibles. Si es más antigua que la original del grupo (p.ej. al reprocesar),
+    pasa a ser ella la original.
+    """
+    if media.phash is None:
+        return None
+    matches = [pk for pk, _ in get_index().search(media.phash, exclude=media.pk)]
+    if not matches:
+        return None
+
+    roots = {
+        similar_to or pk
+        for pk, similar_to in Media.objects.filter(pk__in=matches, status=1).values_list('id', 'similar_to_id')
+    }
+    if not roots:
+        return None
+    root = min(roots)
+    with transaction.atomic():
+        if root < media.pk:
+            # Otros grupos que esta foto une con el más antiguo
+            Media.objects.filter(Q(pk__in=roots - {root}) | Q(similar_to__in=roots - {root})).update(similar_to=root)
+            if media.similar_to_id != root:
+                media.similar_to_id = root
+                media.save(update_fields=['similar_to'])
+        else:
+            Media.objects.filter(Q(pk__in=roots) | Q(similar_to__in=roots)).exclude(pk=media.pk).update(
+                similar_to=media.pk
+            )
+            if media.similar_to_id is not None:
+                media.similar_to_id = None
+                media.save(update_fields=['similar_to'])
+            root = media.pk
+    return root
@@ -0,0 +1,235 @@
+"""
+Acceso directo al almacenamiento cuando el API de Django Storage se queda corto
+(URLs prefirmadas, multipart, lecturas por rangos...).
+
+Con ``USE_S3=True`` se usa un cliente boto3 construido con los mismos ``AWS_*``
+de settings (incluido ``AWS_S3_ENDPOINT_URL`` para MinIO u otro S3 local);
+en modo local se trabaja directamente sobre ``default_storage``.
+"""
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+# Máximo de claves por llamada de list_objects_v2 / delete_objects
+S3_PAGE_SIZE = 1000
+
+
+def is_s3():
+    return getattr(settings, 'USE_S3', False)
+
+
+def bucket_name():
+    return settings.AWS_STORAGE_BUCKET_NAME
+
+
+@lru_cache(maxsize=1)
+def s3_client():
+    """Cliente boto3 compartido por el proceso (reutiliza su pool de conexiones)."""
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+        ),
+    )
+
+
+def iter_file(name, chunk_size=1024 * 1024, start=0, end=None):
+    """
+    Lee un fichero del storage por trozos sin cargarlo entero: con S3 se lee el
+    cuerpo de ``get_object`` según llega (``default_storage.open`` lo descargaría
+    completo a un fichero temporal antes de devolver el primer byte).
+    Con ``start`` / ``end`` (exclusivo) solo se lee ese tramo.
+    """
+    if end is not None and end <= start:
+        return
+
+    if is_s3():
+        params = {'Bucket': bucket_name(), 'Key': name}
+        if start or end is not None:
+            params['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        body = s3_client().get_object(**params)['Body']
+        try:
+            yield from body.iter_chunks(chunk_size=chunk_size)
+        finally:
+            body.close()
+        return
+
+    from django.core.files.storage import default_storage
+
+    with default_storage.open(name, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def put_file(name, fileobj, content_type=None):
+    """
+    Escribe ``fileobj`` exactamente en la clave ``name`` (``save`` de Django
+    Storage buscaría otro nombre si ya existe). Es para claves nuevas: lo
+    publicado no se reescribe, porque sus URLs se cachean como inmutables. En S3
+    la subida es multipart desde el fichero; en local se escribe al lado y se
+    renombra (nunca queda un fichero a medias).
+    """
+    if is_s3():
+        extra = dict(getattr(settings, 'AWS_S3_OBJECT_PARAMETERS', None) or {})
+        if content_type:
+            extra['ContentType'] = content_type
+        s3_client().upload_fileobj(fileobj, bucket_name(), name, ExtraArgs=extra)
+        return
+
+    from django.core.files.storage import default_storage
+
+    path = default_storage.path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(fileobj, out, 1024 * 1024)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def iter_object_pages(prefix=''):
+    """
+    Todos los ficheros del storage bajo ``prefix`` por páginas de hasta 1000
+    ``(clave, bytes, última modificación)``, sin cargar el listado entero.
+    """
+    if is_s3():
+        paginator = s3_client().get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=bucket_name(), Prefix=prefix, PaginationConfig={'PageSize': S3_PAGE_SIZE}
+        )
+        for page in pages:
+            contents = page.get('Contents') or []
+            if contents:
+                yield [(obj['Key'], obj['Size'], obj['LastModified']) for obj in contents]
+        return
+
+    root = settings.MEDIA_ROOT
+    page = []
+    # Solo se recorre la carpeta del prefijo ('images/' -> MEDIA_ROOT/images)
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root, os.path.dirname(prefix))):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            key = os.path.relpath(path, root).replace(os.sep, '/')
+            if not key.startswith(prefix):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # borrado mientras se recorría
+            modified = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+            page.append((key, stat.st_size, modified))
+            if len(page) >= S3_PAGE_SIZE:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def delete_many(keys):
+    """
+    Borra ``keys`` del storage: en S3 con ``delete_objects`` de 1000 en 1000.
+    Devuelve ``[(clave, error), ...]`` de las que no se pudieron borrar.
+    """
+    errors = []
+    if is_s3():
+        for start in range(0, len(keys), S3_PAGE_SIZE):
+            batch = keys[start:start + S3_PAGE_SIZE]
+            response = s3_client().delete_objects(
+                Bucket=bucket_name(),
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+            errors.extend((e['Key'], e.get('Message') or e.get('Code')) for e in response.get('Errors', []))
+        return errors
+
+    from django.core.files.storage import default_storage
+
+    for key in keys:
+        try:
+            default_storage.delete(key)
+        except OSError as e:
+            errors.append((key, str(e)))
+    return errors
+
+
+class RangedReader:
+    """
+    Lecturas por rango de un fichero del storage (``read(offset, length)``) sin
+    descargarlo entero. Lleva la cuenta de bytes y peticiones, para saber cuánto
+    cuesta leer solo las cabeceras (ver ``benchmark_video_metadata``).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes_read = 0
+        self.requests = 0
+        self._size = None
+        self._fh = None
+
+    @property
+    def size(self):
+        if self._size is None:
+            if is_s3():
+                self.requests += 1
+                self._size = s3_client().head_object(Bucket=bucket_name(), Key=self.name)['ContentLength']
+            else:
+                from django.core.files.storage import default_storage
+                self._size = default_storage.size(self.name)
+        return self._size
+
+    def read(self, offset, length):
+        """Hasta ``length`` bytes desde ``offset`` (menos si se llega al final)."""
+        if length <= 0 or (self._size is not None and offset >= self._size):
+            return b''
+        self.requests += 1
+        if is_s3():
+            response = s3_client().get_object(
+                Bucket=bucket_name(), Key=self.name, Range=f'bytes={offset}-{offset + length - 1}'
+            )
+            # "bytes 0-65535/1234567": de paso sabemos el tamaño sin un HEAD aparte
+            total = response.get('ContentRange', '').rpartition('/')[2]
+            if total.isdigit():
+                self._size = int(total)
+            data = response['Body'].read()
+        else:
+            if self._fh is None:
+                from django.core.files.storage import default_storage
+                self._fh = default_storage.open(self.name, 'rb')
+            self._fh.seek(offset)
+            data = self._fh.read(length)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import ExifTags, Image
+from rest_framework.test import APIClient
+
+from . import changes, events, jobs, moderation, mp4, placeholders, similarity, storage, zip_export
+from .jobs import run_job
+from .management.commands import export_album
+from .models import GalleryState, Media, MediaCounter, ProcessingJob, UploadSession
+from .uploadhandlers import MediaUploadHandler
+
+LOCAL_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def jpeg_bytes(size=(40, 30), color='red', **exif_tags):
+    """JPEG de prueba; ``exif_tags`` (``Model``, ``Orientation``, ``DateTimeOriginal``...) van al EXIF."""
+    exif = Image.Exif()
+    details = {}
+    for name, value in exif_tags.items():
+        # La fecha de captura va en el sub-IFD Exif; el resto en el principal
+        (details if name.endswith('Original') else exif)[ExifTags.Base[name]] = value
+    if details:
+        exif[ExifTags.IFD.Exif] = details
+    buf = BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG', exif=exif)
+    return buf.getvalue()
+
+
+class LocalStorageTestCase(TestCase):
+    """Storage local en un directorio temporal y trabajos sin ejecutar (la cola se prueba aparte)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls._local_storage = override_settings(
+            USE_S3=False, STORAGES=LOCAL_STORAGES, MEDIA_ROOT=cls.media_root, MEDIA_JOBS_EAGER=False,
+        )
+        cls._local_storage.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._local_storage.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+def box(box_type, body):
+    return struct.pack('>I4s', 8 + len(body), box_type) + body
+
+
+def full_box(box_type, body, version=0):
+    return box(box_type, bytes([version, 0, 0, 0]) + body)
+
+
+def mp4_moov_last(chunk_count=20, chunk_size=4096, co64=False, rotated=False, created_at=None):
+    """
+    MP4 de móvil (``ftyp``, ``mdat``, ``moov``) con una pista de vídeo de
+    1280x720 y 10 s cuyo ``stco`` / ``co64`` apunta a trozos reconocibles de
+    ``mdat``. Devuelve ``(bytes, trozos)``.
+    """
+    ftyp = box(b'ftyp', b'isom\0\0\0\0isomiso2mp41')
+    chunks = [bytes([n]) * 8 + os.urandom(chunk_size - 8) for n in range(chunk_count)]
+    offsets = [len(ftyp) + 8 + n * chunk_size for n in range(chunk_count)]
+    if co64:
+        table = full_box(b'co64', struct.pack('>I', chunk_count) + b''.join(struct.pack('>Q', o) for o in offsets))
+    else:
+        table = full_box(b'stco', struct.pack('>I', chunk_count) + b''.join(struct.pack('>I', o) for o in offsets))
+
+    if rotated:
+        # Grabado en vertical: matriz de 90°
+        matrix = struct.pack('>9i', 0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+    else:
+        matrix = struct.pack('>9i', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    tkhd = full_box(b'tkhd', struct.pack('>5I', 0, 0, 1, 0, 6000) + bytes(16) + matrix
+                    + struct.pack('>II', 1280 << 16, 720 << 16))
+    mdhd = full_box(b'mdhd', struct.pack('>4I', 0, 0, 600, 6000) + bytes(4))
+    hdlr = full_box(b'hdlr', bytes(4) + b'vide' + bytes(12) + b'x\0')
+    stsd = full_box(b'stsd', struct.pack('>I', 1) + box(b'avc1', bytes(70)))
+    stbl = box(b'stbl', stsd + table)
+    trak = box(b'trak', tkhd + box(b'mdia', mdhd + hdlr + box(b'minf', stbl)))
+    created = int((created_at - mp4.MP4_EPOCH).total_seconds()) if created_at else 0
+    mvhd = full_box(b'mvhd', struct.pack('>4I', created, created, 600, 6000) + bytes(80))
+    return ftyp + box(b'mdat', b''.join(chunks)) + box(b'moov', mvhd + trak), chunks
+
+
+def top_level_boxes(data):
+    pos, boxes = 0, []
+    while pos < len(data):
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        boxes.append(box_type)
+        pos += size
+    return boxes
+
+
+def chunk_offsets(data):
+    """Offsets de la tabla ``stco`` / ``co64`` (la primera que aparece: la del ``moov``)."""
+    pos = min(p for p in (data.find(b'stco'), data.find(b'co64')) if p >= 0)
+    fmt = '>I' if data[pos:pos + 4] == b'stco' else '>Q'
+    count, = struct.unpack_from('>I', data, pos + 8)
+    return [struct.unpack_from(fmt, data, pos + 12 + n * struct.calcsize(fmt))[0] for n in range(count)]
+
+
+def stored_media(name, body, mime_type='image/jpeg'):
+    """Media publicado con ``body`` ya en el storage."""
+    key = default_storage.save(name, ContentFile(body))
+    return Media.objects.create(file=key, object_key=key, mime_type=mime_type, bytes=len(body))
+
+
+class DirectUploadTypeTests(LocalStorageTestCase):
+    """Subida directa: la extensión y los magic bytes tienen que ser del tipo declarado."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _upload(self, filename, content_type, body):
+        response = self.client.post('/api/uploads/', {
+            'filename': filename, 'bytes': len(body), 'content_type': content_type,
+        }, format='json')
+        if response.status_code != 201:
+            return response, None
+        session = response.json()
+        url = urlsplit(session['parts'][0]['url'])
+        put = self.client.put(f'{url.path}?{url.query}', body, content_type='application/octet-stream')
+        self.assertEqual(put.status_code, 200)
+        return self.client.post(f"/api/uploads/{session['id']}/finalize/", {}, format='json'), session
+
+    def test_extension_must_match_declared_type(self):
+        for filename in ('evil.html', 'evil', 'video.mp4'):
+            response, _ = self._upload(filename, 'image/jpeg', jpeg_bytes())
+            self.assertEqual(response.status_code, 400, filename)
+            self.assertIn('filename', response.json())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_content_must_match_declared_type(self):
+        html = b'<html><script>alert(1)</script></html>'.ljust(200)
+        response, session = self._upload('evil.jpg', 'image/jpeg', html)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Media.objects.exists())
+        self.assertFalse(default_storage.exists(session['object_key']))
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).state, 'aborted')
+
+    def test_valid_image_is_published_with_declared_type(self):
+        response, session = self._upload('IMG_0001.jpg', 'image/jpeg', jpeg_bytes())
+
+        self.assertEqual(response.status_code, 201)
+        media = Media.objects.get(object_key=session['object_key'])
+        self.assertEqual((media.mime_type, media.media_type), ('image/jpeg', 'image'))
+
+    def test_media_without_type_is_never_created(self):
+        with self.assertRaises(ValueError):
+            Media(file='other/x.html', object_key='other/x.html').save()
+        self.assertFalse(Media.objects.exists())
+
+
+class BatchUploadTests(LocalStorageTestCase):
+
+    def test_same_filename_gets_distinct_keys(self):
+        files = [
+            SimpleUploadedFile('image.jpg', jpeg_bytes(color=color), 'image/jpeg')
+            for color in ('red', 'green', 'blue')
+        ]
+        response = APIClient().post('/api/media/batch/', {'files': files}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        keys = [result['media']['object_key'] for result in response.json()['results']]
+        self.assertEqual(len(set(keys)), 3)
+        for key in keys:
+            self.assertTrue(default_storage.exists(key))
+
+
+class GalleryVersionTests(LocalStorageTestCase):
+    """La versión de la galería (cachés, ETags, feed) solo sube si cambia algo visible."""
+
+    def setUp(self):
+        self.media = Media.objects.create(file='images/a.jpg', mime_type='image/jpeg')
+
+    def _version(self):
+        return GalleryState.current().version
+
+    def test_update_without_rows_keeps_version(self):
+        before = self._version()
+        self.assertEqual(Media.objects.filter(pk=self.media.pk, status=0).update(status=1), 0)
+        self.assertEqual(self._version(), before)
+
+    def test_update_bumps_version_and_change_seq(self):
+        before = self._version()
+        Media.objects.filter(pk=self.media.pk).update(status=0)
+        self.media.refresh_from_db()
+        self.assertEqual(self._version(), before + 1)
+        self.assertEqual(self.media.change_seq, before + 1)
+
+    def test_internal_update_keeps_version(self):
+        before = self._version()
+        change_seq = self.media.change_seq
+        Media.objects.filter(pk=self.media.pk).update_internal(processing_state='processing')
+        self.media.refresh_from_db()
+        self.assertEqual(self._version(), before)
+        self.assertEqual((self.media.processing_state, self.media.change_seq), ('processing', change_seq))
+
+
+@override_settings(MEDIA_DOWNLOAD_CHUNK_SIZE=1024)
+class ZipExportTests(LocalStorageTestCase):
+    """El ZIP se genera por trozos: cada trozo sale antes de leer el siguiente."""
+
+    def setUp(self):
+        self.media = [stored_media(f'images/photo{n}.jpg', jpeg_bytes(size=(200 + n, 150))) for n in range(3)]
+        self.bodies = {media.object_key.split('/')[-1]: default_storage.open(media.object_key).read()
+                       for media in self.media}
+
+    def _url(self):
+        return '/api/media/zip/?ids=' + ','.join(str(media.pk) for media in self.media)
+
+    def _assert_zip(self, content):
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                {name: archive.read(name) for name in archive.namelist()},
+                self.bodies,
+            )
+
+    def test_zip_opens_with_zipfile(self):
+        response = APIClient().get(self._url())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self._assert_zip(b''.join(response.streaming_content))
+
+    def test_zip_is_generated_incrementally(self):
+        opened = []
+        iter_file = storage.iter_file
+
+        def recording_iter_file(key, *args, **kwargs):
+            opened.append(key)
+            return iter_file(key, *args, **kwargs)
+
+        with mock.patch.object(zip_export, 'iter_file', recording_iter_file):
+            chunks = zip_export.stream_zip(self.media)
+            first = next(chunks)
+            # Primer trozo fuera con solo el primer fichero abierto
+            self.assertTrue(first.startswith(b'PK'))
+            self.assertEqual(opened, [self.media[0].object_key])
+            rest = [*chunks]
+
+        self.assertEqual(len(opened), 3)
+        self.assertLessEqual(max(map(len, rest)), 2 * 1024)
+        self._assert_zip(first + b''.join(rest))
+
+    async def test_zip_streams_asynchronously_under_asgi(self):
+        response = await AsyncClient().get(self._url())
+
+        self.assertEqual(response.status_code, 200)
+        # Un iterador síncrono se acumularía entero en memoria antes de enviarse
+        self.assertTrue(response.is_async)
+        self._assert_zip(b''.join([chunk async for chunk in response.streaming_content]))
+
+
+@override_settings(MEDIA_DOWNLOAD_CHUNK_SIZE=4096)
+class FaststartTests(LocalStorageTestCase):
+    """faststart mueve el moov delante, corrige los offsets y publica en una clave nueva."""
+
+    def _roundtrip(self, co64):
+        data, chunks = mp4_moov_last(co64=co64)
+        key = default_storage.save('videos/clip.mp4', ContentFile(data))
+
+        new_key = key.replace('.mp4', '_fast.mp4')
+        sha256, size = mp4.faststart(key, new_key)
+        with default_storage.open(new_key) as fh:
+            rewritten = fh.read()
+
+        self.assertEqual(default_storage.open(key).read(), data)  # el original no se toca
+        self.assertEqual((sha256, size), (hashlib.sha256(rewritten).hexdigest(), len(data)))
+        self.assertEqual(top_level_boxes(rewritten), [b'ftyp', b'moov', b'mdat'])
+        offsets = chunk_offsets(rewritten)
+        self.assertEqual([rewritten[o:o + len(c)] for o, c in zip(offsets, chunks)], chunks)
+        # Se vuelve a leer igual y ya no hace falta moverlo
+        self.assertEqual(mp4.probe(new_key)['duration_ms'], mp4.probe(key)['duration_ms'])
+        self.assertIsNone(mp4.faststart(new_key, new_key + '.2'))
+
+    def test_stco_offsets_are_shifted(self):
+        self._roundtrip(co64=False)
+
+    def test_co64_offsets_are_shifted(self):
+        self._roundtrip(co64=True)
+
+    def test_job_switches_to_new_key(self):
+        data, _ = mp4_moov_last()
+        media = stored_media('videos/clip.mp4', data, mime_type='video/mp4')
+        uploaded_sha256 = hashlib.sha256(data).hexdigest()
+        Media.objects.filter(pk=media.pk).update_internal(sha256=uploaded_sha256)
+        old_key = media.object_key
+        job = ProcessingJob.objects.create(media=media, kind='faststart', state='running')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_job(job.pk), 'done')
+
+        media.refresh_from_db()
+        self.assertNotEqual(media.object_key, old_key)
+        self.assertEqual(media.file.name, media.object_key)
+        self.assertTrue(default_storage.exists(media.object_key))
+        self.assertFalse(default_storage.exists(old_key))
+        self.assertEqual(media.original_sha256, uploaded_sha256)
+        self.assertEqual(media.sha256, hashlib.sha256(default_storage.open(media.object_key).read()).hexdigest())
+        # Quien vuelve a subir el vídeo original lo sigue encontrando
+        self.assertEqual(Media.find_duplicate(uploaded_sha256), media)
+        response = APIClient().post('/api/media/check_hashes/', {'sha256': [uploaded_sha256]}, format='json')
+        self.assertEqual(response.json()['existing'], {uploaded_sha256: media.pk})
+
+
+class ServeMediaTests(LocalStorageTestCase):
+    """/media/ sin S3: inline solo imágenes y vídeos permitidos, y nunca con sniffing."""
+
+    def setUp(self):
+        self.media = stored_media('images/photo.jpg', jpeg_bytes())
+
+    def test_allowed_image_is_inline(self):
+        response = self.client.get(f'/media/{self.media.object_key}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_other_types_are_attachments(self):
+        # Filas antiguas, de antes de comprobar el contenido de las subidas
+        Media.objects.filter(pk=self.media.pk).update_internal(mime_type='text/html')
+        for url in (f'/media/{self.media.object_key}', f'/api/media/{self.media.pk}/download/'):
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(response['Content-Disposition'].startswith('attachment'), url)
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_accel_redirect_keeps_headers(self):
+        Media.objects.filter(pk=self.media.pk).update_internal(mime_type='text/html')
+        response = self.client.get(f'/media/{self.media.object_key}')
+
+        self.assertIn('X-Accel-Redirect', response)
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+
+class MediaUpdateTests(LocalStorageTestCase):
+    """Lo que se ha ocultado solo se vuelve a mostrar desde la moderación."""
+
+    def setUp(self):
+        self.media = stored_media('images/photo.jpg', jpeg_bytes())
+        Media.objects.filter(pk=self.media.pk).update(status=0)
+        self.client = APIClient()
+
+    def test_anonymous_cannot_update(self):
+        for method in (self.client.patch, self.client.put):
+            response = method(f'/api/media/{self.media.pk}/', {'status': 1}, format='multipart')
+            self.assertIn(response.status_code, (401, 403))
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.status, 0)
+
+    def test_status_is_read_only(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_authenticate(admin)
+        Media.objects.filter(pk=self.media.pk).update(status=1)
+
+        response = self.client.patch(f'/api/media/{self.media.pk}/', {'status': 0}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.status, 1)
+
+    def test_admin_changes_status_only_through_actions(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        changelist = '/admin/wedding_gallery/media/'
+
+        # Sin list_editable: un POST del formulario de la lista no toca nada
+        self.client.post(changelist, {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': self.media.pk, 'form-0-status': 1,
+            '_save': 'Guardar',
+        })
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.status, 0)
+
+        response = self.client.post(changelist, {'action': 'soft_delete', '_selected_action': [self.media.pk]})
+
+        self.assertEqual(response.status_code, 302)
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.status, 2)
+        self.assertIsNotNone(self.media.deleted_at)
+
+
+class JobQueueTests(LocalStorageTestCase):
+    """Cola de trabajos: reintentos con backoff, fallos, aplazamientos y locks caducados."""
+
+    def setUp(self):
+        self.media = Media.objects.create(file='images/job.jpg', mime_type='image/jpeg')
+        self.calls = []
+        # Los reintentos y fallos se registran con logger.warning / logger.error
+        self.enterContext(mock.patch.object(jobs, 'logger'))
+
+    def _handler(self, *errors):
+        """Handler de 'hash' que lanza ``errors`` en orden y luego termina bien."""
+        errors = list(errors)
+
+        def handler(media, job):
+            media.refresh_from_db()
+            self.calls.append(media.processing_state)
+            if errors:
+                raise errors.pop(0)
+        return mock.patch.dict(jobs.JOB_HANDLERS, {'hash': handler})
+
+    def _state(self, job):
+        job.refresh_from_db()
+        self.media.refresh_from_db()
+        return job.state, job.attempts, self.media.processing_state
+
+    def _claim_and_run(self):
+        return [run_job(job_id) for job_id in jobs.claim_jobs(10)]
+
+    def test_processing_state_goes_from_pending_to_ready(self):
+        with self._handler():
+            [job] = jobs.enqueue(self.media, ['hash'])
+            self.assertEqual(self._state(job), ('pending', 0, 'pending'))
+            self.assertEqual(self._claim_and_run(), ['done'])
+
+        self.assertEqual(self.calls, ['processing'])
+        self.assertEqual(self._state(job), ('done', 1, 'ready'))
+
+    def test_failed_job_backs_off_and_is_retried(self):
+        with self._handler(RuntimeError('S3 caído')):
+            [job] = jobs.enqueue(self.media, ['hash'])
+            self.assertEqual(self._claim_and_run(), ['pending'])
+            self.assertEqual(self._state(job), ('pending', 1, 'processing'))
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIn('S3 caído', job.last_error)
+            # Durante el backoff no se vuelve a tomar
+            self.assertEqual(jobs.claim_jobs(10), [])
+
+            ProcessingJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(self._claim_and_run(), ['done'])
+
+        self.assertEqual(self._state(job), ('done', 2, 'ready'))
+
+    def test_exhausted_attempts_fail_the_media(self):
+        with self._handler(RuntimeError('roto')):
+            [job] = jobs.enqueue(self.media, ['hash'])
+            ProcessingJob.objects.filter(pk=job.pk).update(max_attempts=1)
+            self.assertEqual(self._claim_and_run(), ['failed'])
+
+        self.assertEqual(self._state(job), ('failed', 1, 'failed'))
+
+    def test_permanent_error_fails_at_once(self):
+        with self._handler(jobs.PermanentJobError('hash declarado distinto')):
+            [job] = jobs.enqueue(self.media, ['hash'])
+            self.assertEqual(self._claim_and_run(), ['failed'])
+
+        self.assertEqual(self._state(job), ('failed', 1, 'failed'))
+
+    def test_deferred_job_keeps_its_attempts(self):
+        with self._handler(jobs.DeferJob('esperando'), jobs.DeferJob('esperando')):
+            [job] = jobs.enqueue(self.media, ['hash'])
+            for _ in range(2):
+                self.assertEqual(self._claim_and_run(), ['pending'])
+                self.assertEqual(self._state(job)[:2], ('pending', 0))
+                ProcessingJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(self._claim_and_run(), ['done'])
+
+        self.assertEqual(self._state(job), ('done', 1, 'ready'))
+
+    def test_stale_lock_is_reclaimed(self):
+        [job] = jobs.enqueue(self.media, ['hash'])
+        self.assertEqual(jobs.claim_jobs(10), [job.pk])
+        # Lock reciente: otro worker lo está ejecutando
+        self.assertEqual(jobs.claim_jobs(10), [])
+
+        stale = timezone.now() - timedelta(seconds=settings.MEDIA_JOBS_LOCK_TIMEOUT + 1)
+        ProcessingJob.objects.filter(pk=job.pk).update(locked_at=stale)
+        self.assertEqual(jobs.claim_jobs(10), [job.pk])
+        self.assertEqual(self._state(job)[:2], ('running', 2))
+
+    def test_release_lost_jobs(self):
+        retry, last, done = jobs.enqueue(self.media, ['hash', 'dimensions', 'derivatives'])
+        ProcessingJob.objects.filter(pk=last.pk).update(max_attempts=1)
+        jobs.claim_jobs(10)
+        ProcessingJob.objects.filter(pk=done.pk).update(state='done')
+
+        released = jobs.release_lost_jobs([retry.pk, last.pk, done.pk], 'El proceso del worker murió')
+
+        self.assertEqual(released, 2)
+        self.assertEqual(self._state(retry)[:2], ('pending', 1))
+        self.assertGreater(retry.run_after, timezone.now())
+        self.assertEqual(retry.last_error, 'El proceso del worker murió')
+        self.assertEqual(self._state(last), ('failed', 1, 'failed'))
+        self.assertEqual(self._state(done)[0], 'done')
+
+    def test_admin_retry_requeues_failed_jobs(self):
+        with self._handler(jobs.PermanentJobError('roto')):
+            [job] = jobs.enqueue(self.media, ['hash'])
+            self._claim_and_run()
+        self.assertEqual(self._state(job), ('failed', 1, 'failed'))
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        with self._handler(), override_settings(MEDIA_JOBS_EAGER=True), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/wedding_gallery/processingjob/', {
+                'action': 'retry_now', '_selected_action': [job.pk],
+            })
+
+        self.assertEqual(self._state(job), ('done', 1, 'ready'))
+
+
+class MediaUploadHandlerTests(LocalStorageTestCase):
+    """Hash, tipo, dimensiones y EXIF se sacan mientras llegan los bytes, sin releer el fichero."""
+
+    def setUp(self):
+        self.body = jpeg_bytes(size=(64, 48), Model='Pixel 8', Orientation=6,
+                               DateTimeOriginal='2024:06:15 18:30:00', OffsetTimeOriginal='+02:00')
+
+    def _stream(self, name, body, chunk_size=100):
+        handler = MediaUploadHandler()
+        handler.new_file('file', name, 'image/jpeg', len(body))
+        for start in range(0, len(body), chunk_size):
+            handler.receive_data_chunk(body[start:start + chunk_size], start)
+        return handler.file_complete(len(body))
+
+    def test_streamed_metadata(self):
+        upload = self._stream('IMG_0001.jpg', self.body)
+
+        self.assertEqual(upload.sha256, hashlib.sha256(self.body).hexdigest())
+        self.assertEqual((upload.size, upload.read()), (len(self.body), self.body))
+        self.assertEqual(upload.sniffed_type, 'image/jpeg')
+        # Orientation=6: guardada apaisada, se muestra en vertical
+        self.assertEqual(upload.image_size, (48, 64))
+        self.assertEqual(upload.exif['camera_model'], 'Pixel 8')
+        self.assertEqual(upload.exif['taken_at'], datetime(2024, 6, 15, 16, 30, tzinfo=dt_timezone.utc))
+
+    def test_upload_uses_streamed_metadata(self):
+        upload = SimpleUploadedFile('IMG_0001.jpg', self.body, 'image/jpeg')
+        response = APIClient().post('/api/media/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        media = Media.objects.get(pk=response.json()['id'])
+        self.assertEqual(media.sha256, hashlib.sha256(self.body).hexdigest())
+        self.assertEqual((media.width, media.height, media.camera_model), (48, 64, 'Pixel 8'))
+        self.assertEqual((media.mime_type, media.media_type), ('image/jpeg', 'image'))
+
+    def test_spoofed_extension_is_rejected(self):
+        html = b'<html><script>alert(1)</script></html>'.ljust(200)
+        cases = [
+            ('evil.jpg', html, 'image/jpeg'),      # el contenido no es una imagen
+            ('evil.html', self.body, 'image/jpeg'),  # imagen, pero se guardaría como .html
+            ('evil.mp4', self.body, 'video/mp4'),
+        ]
+        for name, body, content_type in cases:
+            upload = SimpleUploadedFile(name, body, content_type)
+            response = APIClient().post('/api/media/', {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn('file', response.json())
+        self.assertFalse(Media.objects.exists())
+
+
+class DeduplicationTests(LocalStorageTestCase):
+    """Mismo contenido: se devuelve lo que ya hay, pero solo si quien sube lo puede ver."""
+
+    def setUp(self):
+        self.body = jpeg_bytes(color='green')
+        self.sha256 = hashlib.sha256(self.body).hexdigest()
+        self.client = APIClient()
+
+    def _upload(self, name='IMG_0001.jpg', body=None):
+        upload = SimpleUploadedFile(name, body or self.body, 'image/jpeg')
+        return self.client.post('/api/media/', {'file': upload}, format='multipart')
+
+    def _check(self, *hashes):
+        return self.client.post('/api/media/check_hashes/', {'sha256': list(hashes)}, format='json').json()
+
+    def test_same_content_returns_existing(self):
+        first = self._upload()
+        again = self._upload('otro_nombre.jpg')
+
+        self.assertEqual((first.status_code, again.status_code), (201, 200))
+        self.assertTrue(again.json()['duplicate'])
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(Media.objects.count(), 1)
+        self.assertEqual(self._check(self.sha256), {'existing': {self.sha256: first.json()['id']}})
+
+    def test_hidden_and_deleted_do_not_count(self):
+        first = self._upload().json()
+        for status_value in (0, 2):
+            Media.objects.filter(pk=first['id']).update(status=status_value)
+            self.assertEqual(self._check(self.sha256), {'existing': {}})
+            self.assertIsNone(Media.find_duplicate(self.sha256))
+
+        response = self._upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.json()['id'], first['id'])
+
+    def test_original_hash_after_faststart(self):
+        media = stored_media('videos/clip.mp4', b'\0' * 64, mime_type='video/mp4')
+        Media.objects.filter(pk=media.pk).update_internal(sha256='b' * 64, original_sha256='a' * 64)
+
+        self.assertEqual(self._check('a' * 64, 'b' * 64, 'c' * 64),
+                         {'existing': {'a' * 64: media.pk, 'b' * 64: media.pk}})
+        self.assertEqual(Media.find_duplicate('a' * 64), media)
+
+    def test_same_name_gets_distinct_keys(self):
+        keys = [self._upload(body=jpeg_bytes(color=color)).json()['object_key'] for color in ('red', 'blue')]
+
+        self.assertNotEqual(*keys)
+        for key in keys:
+            self.assertRegex(key, r'^images/IMG_0001_[0-9a-f]{8}\.jpg$')
+            self.assertTrue(default_storage.exists(key))
+
+
+@override_settings(DIRECT_UPLOAD_PART_SIZE=1024)
+class DirectUploadResumeTests(LocalStorageTestCase):
+    """Subida directa por partes: se reanuda con lo que falta y el hash declarado se comprueba."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.body = jpeg_bytes() + os.urandom(3000)  # 4 partes de 1 KB
+        self.enterContext(mock.patch.object(jobs, 'logger'))
+
+    def _start(self, sha256=''):
+        return self.client.post('/api/uploads/', {
+            'filename': 'VID_0001.jpg', 'bytes': len(self.body), 'content_type': 'image/jpeg', 'sha256': sha256,
+        }, format='json')
+
+    def _put(self, part):
+        url = urlsplit(part['url'])
+        body = self.body[part['start']:part['end']]
+        response = self.client.put(f'{url.path}?{url.query}', body, content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 200)
+
+    def _finalize(self, session):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/uploads/{session['id']}/finalize/", {}, format='json')
+        jobs.run_pending()
+        return response
+
+    def test_status_lists_missing_parts(self):
+        session = self._start().json()
+        parts = {part['part_number']: part for part in session['parts']}
+        self.assertEqual(sorted(parts), [1, 2, 3, 4])
+        self._put(parts[1])
+        self._put(parts[3])
+
+        status = self.client.get(f"/api/uploads/{session['id']}/").json()
+
+        self.assertEqual([p['part_number'] for p in status['uploaded_parts']], [1, 3])
+        self.assertEqual([p['part_number'] for p in status['parts']], [2, 4])
+        # Solo cuenta lo contiguo desde el principio
+        self.assertEqual(status['offset'], 1024)
+
+        for part in status['parts']:
+            self._put(part)
+        response = self._finalize(session)
+        self.assertEqual(response.status_code, 201)
+        media = Media.objects.get(object_key=session['object_key'])
+        self.assertEqual(default_storage.open(media.object_key).read(), self.body)
+        self.assertEqual(media.status, 1)
+
+    def test_declared_hash_mismatch_is_rejected_on_finalize(self):
+        # En local el hash se calcula al juntar las partes
+        session = self._start(sha256='0' * 64).json()
+        for part in session['parts']:
+            self._put(part)
+
+        self.assertEqual(self._finalize(session).status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).state, 'aborted')
+        self.assertFalse(Media.objects.exists())
+        self.assertFalse(default_storage.exists(session['object_key']))
+
+    def test_declared_hash_mismatch_hides_media(self):
+        # Con S3 el Media se crea sin hash y lo comprueba el job 'hash'
+        media = stored_media('images/VID_0001.jpg', self.body)
+        UploadSession.objects.create(
+            object_key=media.object_key, filename='VID_0001.jpg', mime_type='image/jpeg',
+            total_bytes=len(self.body), part_size=1024, sha256='0' * 64, state='complete', media=media,
+        )
+        job = ProcessingJob.objects.create(media=media, kind='hash', state='running')
+
+        self.assertEqual(run_job(job.pk), 'failed')
+
+        media.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(media.status, 0)
+        self.assertEqual(media.sha256, hashlib.sha256(self.body).hexdigest())
+        self.assertIn('SHA256 declarado', job.last_error)
+
+    def test_declared_hash_of_existing_media_is_a_duplicate(self):
+        existing = stored_media('images/existing.jpg', self.body)
+        Media.objects.filter(pk=existing.pk).update_internal(sha256=hashlib.sha256(self.body).hexdigest())
+
+        response = self._start(sha256=hashlib.sha256(self.body).hexdigest())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['duplicate'], response.json()['media']['id']), (True, existing.pk))
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class KeysetPaginationTests(LocalStorageTestCase):
+    """Con created_at repetido el id desempata: ni se repite ni se salta nada."""
+
+    def test_ties_on_created_at(self):
+        ids = [Media.objects.create(file=f'images/tie{n}.jpg', mime_type='image/jpeg').pk for n in range(7)]
+        Media.objects.update_internal(created_at=timezone.now().replace(microsecond=0))
+
+        seen = []
+        url = '/api/media/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen += [item['id'] for item in data['results']]
+            url = data['next']
+
+        self.assertEqual(seen, sorted(ids, reverse=True))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/media/?cursor=no-es-un-cursor').status_code, 404)
+
+
+class ConditionalRequestTests(LocalStorageTestCase):
+    """ETag / Last-Modified salen de la versión de la galería: 304 sin ejecutar la vista."""
+
+    def setUp(self):
+        self.media = Media.objects.create(file='images/a.jpg', mime_type='image/jpeg')
+        self.urls = ['/api/media/', '/api/media/gallery/', '/api/media/stats/', f'/api/media/{self.media.pk}/']
+
+    def test_if_none_match_returns_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # Solo se lee GalleryState
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_returns_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                last_modified = self.client.get(url)['Last-Modified']
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 304)
+
+    def test_new_version_invalidates_etag(self):
+        etag = self.client.get('/api/media/')['ETag']
+        Media.objects.create(file='images/b.jpg', mime_type='image/jpeg')
+
+        response = self.client.get('/api/media/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class MediaCounterTests(LocalStorageTestCase):
+    """Los contadores coinciden siempre con un recuento desde cero, se escriba como se escriba."""
+
+    def assertCountersMatch(self):
+        expected = {
+            row['media_type']: (row['total'], row['size'] or 0)
+            for row in Media.objects.filter(status=1).values('media_type')
+            .annotate(total=Count('id'), size=Sum('bytes'))
+        }
+        for counter in MediaCounter.objects.all():
+            self.assertEqual((counter.count, counter.bytes), expected.get(counter.media_type, (0, 0)),
+                             counter.media_type)
+
+    def test_counters_follow_every_write_path(self):
+        # Solo diferencias: nunca un recuento de toda la tabla
+        self.enterContext(mock.patch.object(MediaCounter, 'rebuild', side_effect=AssertionError('rebuild')))
+        photo = Media.objects.create(file='images/c1.jpg', mime_type='image/jpeg', bytes=100)
+        video = Media.objects.create(file='videos/c1.mp4', mime_type='video/mp4', bytes=1000)
+        self.assertCountersMatch()
+
+        # save() con cambio de tamaño y de estado
+        photo.bytes = 150
+        photo.save()
+        video.status = 0
+        video.save()
+        self.assertCountersMatch()
+
+        # save() sin saber cómo estaba (status diferido)
+        partial = Media.objects.defer('status').get(pk=photo.pk)
+        partial.bytes = 120
+        partial.save()
+        self.assertCountersMatch()
+        photo.refresh_from_db()
+
+        # update() masivo y acciones de moderación
+        Media.objects.filter(pk=video.pk).update(status=1)
+        moderation.moderate(Media.objects.filter(pk=photo.pk), 'delete')
+        self.assertCountersMatch()
+        moderation.moderate(Media.objects.filter(pk=photo.pk), 'restore')
+        self.assertCountersMatch()
+
+        # bulk_create (subida por lotes) y bulk_update
+        created = Media.objects.bulk_create([
+            Media(file=f'images/bulk{n}.jpg', object_key=f'images/bulk{n}.jpg', mime_type='image/jpeg',
+                  media_type='image', bytes=10 * n, status=n % 2)
+            for n in range(1, 5)
+        ])
+        self.assertCountersMatch()
+        for media in created:
+            media.bytes += 1
+            media.status = 1
+        Media.objects.bulk_update(created, ['bytes', 'status'])
+        self.assertCountersMatch()
+
+        # Borrado de una fila y borrado masivo
+        photo.delete()
+        self.assertCountersMatch()
+        Media.objects.filter(media_type='image').delete()
+        self.assertCountersMatch()
+        self.assertEqual(MediaCounter.objects.get(media_type='image').count, 0)
+
+    def test_moderation_counts_only_affected_rows(self):
+        photo = Media.objects.create(file='images/c1.jpg', mime_type='image/jpeg', bytes=100)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(moderation.moderate(Media.objects.filter(pk=photo.pk), 'delete'), 1)
+        self.assertCountersMatch()
+        # Los GROUP BY son solo sobre las filas afectadas (antes y después); sin exists() aparte
+        grouped = [q['sql'] for q in queries if 'GROUP BY' in q['sql']]
+        self.assertEqual(len(grouped), 2)
+        self.assertTrue(all('WHERE' in sql for sql in grouped))
+        self.assertFalse([q for q in queries if 'LIMIT 1' in q['sql']])
+
+        # Ya eliminado: ni versión nueva ni contadores
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(moderation.moderate(Media.objects.filter(pk=photo.pk), 'delete'), 0)
+        self.assertEqual([q['sql'] for q in queries if q['sql'].startswith('UPDATE')], [])
+
+
+class ChangeTokenTests(LocalStorageTestCase):
+    """El token del feed va firmado: uno manipulado se rechaza en vez de reenviarlo todo."""
+
+    def setUp(self):
+        self.media = Media.objects.create(file='images/changes.jpg', mime_type='image/jpeg')
+
+    def _changes(self, token):
+        return self.client.get('/api/media/changes/', {'since': token})
+
+    def test_valid_token(self):
+        token = self.client.get('/api/media/changes/').json()['token']
+        Media.objects.filter(pk=self.media.pk).update(status=0)
+
+        data = self._changes(token).json()
+
+        self.assertEqual([row['id'] for row in data['changes']], [self.media.pk])
+        self.assertEqual(self._changes(data['token']).json()['changes'], [])
+
+    def test_tampered_tokens_are_rejected(self):
+        token = changes.make_token(0)
+        value, signature = token.rsplit(':', 1)
+        forged = [
+            f'{value}:{signature[:-1]}{"A" if signature[-1] != "A" else "B"}',
+            signing.dumps([0, 0], salt='otra-cosa', compress=True),
+            changes.make_token(-1),
+            signing.dumps(['0', 0], salt=changes.TOKEN_SALT),
+            'basura',
+        ]
+        for token in forged:
+            response = self._changes(token)
+            self.assertEqual(response.status_code, 400, token)
+            self.assertEqual(response.json(), {'error': 'Token no válido'})
+
+
+class MediaEventsTests(LocalStorageTestCase):
+    """SSE: solo bajo ASGI, y al reconectar con ``Last-Event-ID`` se manda lo que faltaba."""
+
+    def setUp(self):
+        self.media = Media.objects.create(file='images/events.jpg', mime_type='image/jpeg')
+        self.token = changes.make_token(GalleryState.current().version)
+        Media.objects.filter(pk=self.media.pk).update(status=0)
+        # Hub propio: el del proceso no debe quedar enganchado al bucle de este test
+        self.hub = events.EventHub(events.LocalBackend())
+        self.enterContext(mock.patch.object(events, '_hub', self.hub))
+
+    def test_wsgi_is_not_supported(self):
+        response = self.client.get('/api/media/events/')
+        self.assertEqual(response.status_code, 501)
+
+    async def test_invalid_token(self):
+        response = await AsyncClient().get('/api/media/events/', headers={'Last-Event-ID': 'basura'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_reconnect_sends_missed_changes(self):
+        response = await AsyncClient().get('/api/media/events/', headers={'Last-Event-ID': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(stream), f'retry: {settings.MEDIA_EVENTS_RETRY_MS}\n\n'.encode())
+            event = (await anext(stream)).decode()
+        finally:
+            await stream.aclose()
+            if self.hub.task:
+                self.hub.task.cancel()
+
+        header, data = event.rstrip('\n').rsplit('\n', 1)
+        payload = json.loads(data.removeprefix('data: '))
+        self.assertEqual(header, f"event: changes\nid: {payload['token']}")
+        self.assertEqual([(row['id'], row['status']) for row in payload['changes']], [(self.media.pk, 0)])
+
+
+@override_settings(MEDIA_DOWNLOAD_CHUNK_SIZE=1024)
+class DownloadTests(LocalStorageTestCase):
+    """Descargas locales con Range (206/416) y el antiguo download_proxy como redirección."""
+
+    def setUp(self):
+        self.body = jpeg_bytes() + os.urandom(4000)
+        self.media = stored_media('images/download.jpg', self.body)
+        Media.objects.filter(pk=self.media.pk).update_internal(sha256=hashlib.sha256(self.body).hexdigest())
+        self.url = f'/api/media/{self.media.pk}/download/'
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+    def test_ranges(self):
+        size = len(self.body)
+        for header, start, end in [
+            ('bytes=0-99', 0, 99),
+            ('bytes=1000-', 1000, size - 1),
+            ('bytes=-500', size - 500, size - 1),
+            (f'bytes=100-{size + 50}', 100, size - 1),
+        ]:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(int(response['Content-Length']), end - start + 1)
+                self.assertEqual(b''.join(response.streaming_content), self.body[start:end + 1])
+
+    def test_range_not_satisfiable(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.body)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_if_range_with_old_etag_sends_everything(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"otro"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_download_proxy_redirects(self):
+        for params in ({'id': self.media.pk}, {'url': f'http://testserver/media/{self.media.object_key}'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/media/download_proxy/', params)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(response['Location'], self.url)
+
+    def test_download_proxy_rejects_foreign_urls(self):
+        response = self.client.get('/api/media/download_proxy/', {'url': 'http://example.com/otra/cosa.jpg'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/media/download_proxy/').status_code, 400)
+
+
+class ExportAlbumTests(LocalStorageTestCase):
+    """export_album apunta cada archivo terminado: al relanzarlo solo baja lo que falló."""
+
+    def setUp(self):
+        self.media = [stored_media(f'images/export{n}.jpg', jpeg_bytes(color=color))
+                      for n, color in enumerate(['red', 'green', 'blue'])]
+        self.dest = self.enterContext(tempfile.TemporaryDirectory())
+
+    def _export(self, fail_key=None):
+        downloaded = []
+
+        def recording_iter_file(key, chunk_size):
+            downloaded.append(key)
+            if key == fail_key:
+                raise OSError("conexión cortada")
+            yield from storage.iter_file(key, chunk_size)
+
+        with mock.patch.object(export_album, 'iter_file', recording_iter_file):
+            call_command('export_album', self.dest, '--workers', '1', '--retries', '1',
+                         stdout=StringIO(), stderr=StringIO())
+        return downloaded
+
+    def test_resume_downloads_only_what_is_missing(self):
+        failed = self.media[1].object_key
+        with self.assertRaises(CommandError):
+            self._export(fail_key=failed)
+        self.assertFalse(os.path.exists(os.path.join(self.dest, failed)))
+        self.assertFalse(os.path.exists(os.path.join(self.dest, failed + '.part')))
+        # Una interrupción a mitad de línea no estropea el checkpoint
+        with open(os.path.join(self.dest, '.export-progress.jsonl'), 'a') as fh:
+            fh.write('{"id": 99, "ke')
+
+        self.assertEqual(self._export(), [failed])
+
+        with open(os.path.join(self.dest, 'manifest.json')) as fh:
+            manifest = json.load(fh)
+        self.assertEqual([row['id'] for row in manifest], [media.pk for media in self.media])
+        for media, row in zip(self.media, manifest):
+            with open(os.path.join(self.dest, row['path']), 'rb') as fh:
+                self.assertEqual(hashlib.sha256(fh.read()).hexdigest(), row['sha256'])
+            self.assertEqual(row['key'], media.object_key)
+
+
+class Mp4ProbeTests(LocalStorageTestCase):
+    """probe lee solo las cabeceras y el moov, esté al final o al principio."""
+
+    def setUp(self):
+        self.readers = readers = []
+
+        class RecordingReader(storage.RangedReader):
+            def __init__(self, name):
+                super().__init__(name)
+                readers.append(self)
+
+        self.enterContext(mock.patch.object(mp4, 'RangedReader', RecordingReader))
+
+    def _store(self, data, name='videos/probe.mp4'):
+        return default_storage.save(name, ContentFile(data))
+
+    def test_moov_at_end(self):
+        data, _ = mp4_moov_last(chunk_count=100)
+        info = mp4.probe(self._store(data))
+
+        self.assertEqual(info, {
+            'duration_ms': 10000, 'width': 1280, 'height': 720, 'codec': 'avc1', 'created_at': None,
+        })
+        # Unos KB de un fichero de 400 KB
+        self.assertLess(self.readers[0].bytes_read, mp4.HEAD_READ + 2048)
+
+    def test_faststart_file_is_read_at_once(self):
+        data, _ = mp4_moov_last(chunk_count=100)
+        key = self._store(data)
+        mp4.faststart(key, 'videos/probe_fast.mp4')
+        self.readers.clear()
+
+        self.assertEqual(mp4.probe('videos/probe_fast.mp4')['duration_ms'], 10000)
+        self.assertEqual(self.readers[0].requests, 1)
+
+    def test_rotation_and_creation_time(self):
+        created_at = datetime(2024, 6, 15, 16, 30, tzinfo=dt_timezone.utc)
+        data, _ = mp4_moov_last(rotated=True, created_at=created_at)
+        info = mp4.probe(self._store(data))
+
+        self.assertEqual((info['width'], info['height']), (720, 1280))
+        self.assertEqual(info['created_at'], created_at)
+
+    def test_invalid_files(self):
+        with self.assertRaises(mp4.NotIsoBmff):
+            mp4.probe(self._store(jpeg_bytes(), 'videos/photo.mp4'))
+        data, _ = mp4_moov_last()
+        with self.assertRaises(mp4.Mp4Error):
+            mp4.probe(self._store(data[:-200], 'videos/cut.mp4'))
+
+
+class SimilarityClusterTests(LocalStorageTestCase):
+    """Grupos de casi duplicados: se unen por cualquier pareja parecida."""
+
+    def test_chain_joins_groups(self):
+        # A~B y B~C (4 bits), A≁C (8 bits)
+        self.assertEqual(similarity.find_clusters([1, 2, 3], [0x00, 0x0F, 0xFF], 4), {1: None, 2: 1, 3: 1})
+
+    def test_later_photo_merges_two_groups(self):
+        # A y B no se parecen; C se parece a las dos y las junta en el grupo de A
+        self.assertEqual(similarity.find_clusters([1, 2, 3], [0x00, 0xFF, 0x0F], 4), {1: None, 2: 1, 3: 1})
+        self.assertEqual(similarity.find_clusters([1, 2, 3], [0x00, 0xFF, 0x03], 4), {1: None, 2: None, 3: 1})
+
+    def test_command_publishes_once(self):
+        media = [stored_media(f'images/similar{n}.jpg', jpeg_bytes(color='white')) for n in range(3)]
+        before = GalleryState.current().version
+
+        call_command('cluster_similar_media', '--compute-missing', '--max-distance', '4', stdout=StringIO())
+
+        self.assertEqual(GalleryState.current().version, before + 1)
+        rows = Media.objects.filter(pk__in=[m.pk for m in media]).order_by('id')
+        self.assertEqual([m.similar_to_id for m in rows], [None, media[0].pk, media[0].pk])
+        self.assertEqual({m.change_seq for m in rows}, {before + 1})
+        self.assertTrue(all(m.phash is not None for m in rows))
+
+
+@override_settings(WEDDING_TIME_ZONE='Europe/Madrid')
+class TakenAtTests(LocalStorageTestCase):
+    """Fecha de captura desde el EXIF y línea de tiempo agrupada en la zona de la boda."""
+
+    def _photo(self, name, when=None, offset='+02:00'):
+        tags = {'DateTimeOriginal': when} if when else {}
+        if when and offset:
+            tags['OffsetTimeOriginal'] = offset
+        return stored_media(f'images/{name}.jpg', jpeg_bytes(Model='Pixel 8', **tags))
+
+    def test_dimensions_job_reads_exif(self):
+        media = self._photo('exif', '2024:06:15 18:30:00')
+        job = ProcessingJob.objects.create(media=media, kind='dimensions', state='running')
+
+        self.assertEqual(run_job(job.pk), 'done')
+
+        media.refresh_from_db()
+        self.assertEqual(media.taken_at, datetime(2024, 6, 15, 16, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(media.camera_model, 'Pixel 8')
+
+    def test_exif_without_offset_uses_wedding_time_zone(self):
+        media = self._photo('local', '2024:06:15 18:30:00', offset=None)
+        run_job(ProcessingJob.objects.create(media=media, kind='dimensions', state='running').pk)
+
+        media.refresh_from_db()
+        self.assertEqual(media.taken_at, datetime(2024, 6, 15, 16, 30, tzinfo=dt_timezone.utc))
+
+    def test_timeline_buckets(self):
+        for name, minute in [('a', 5), ('b', 50)]:
+            media = self._photo(name)
+            Media.objects.filter(pk=media.pk).update(taken_at=datetime(2024, 6, 15, 16, minute, tzinfo=dt_timezone.utc))
+        late = self._photo('c')
+        Media.objects.filter(pk=late.pk).update(taken_at=datetime(2024, 6, 15, 22, 15, tzinfo=dt_timezone.utc))
+        self._photo('undated')
+
+        data = self.client.get('/api/media/timeline/', {'bucket': 'hour'}).json()
+
+        self.assertEqual(data['time_zone'], 'Europe/Madrid')
+        self.assertEqual(
+            [(row['start'], row['count'], row['images']) for row in data['buckets']],
+            [('2024-06-15T18:00:00+02:00', 2, 2), ('2024-06-16T00:00:00+02:00', 1, 1)],
+        )
+        self.assertEqual(data['undated'], 1)
+
+        page = self.client.get('/api/media/timeline/', {'start': '2024-06-15T18:00:00+02:00'}).json()
+        self.assertEqual(len(page['results']), 2)
+
+    def test_backfill_publishes_once(self):
+        media = [self._photo(f'old{n}', f'2024:06:15 1{n}:00:00') for n in range(3)]
+        before = GalleryState.current().version
+
+        call_command('backfill_taken_at', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(GalleryState.current().version, before + 1)
+        rows = Media.objects.filter(pk__in=[m.pk for m in media]).order_by('id')
+        self.assertEqual([m.taken_at.hour for m in rows], [8, 9, 10])
+        self.assertEqual({m.change_seq for m in rows}, {before + 1})
+
+
+class PlaceholderTests(LocalStorageTestCase):
+    """Placeholder y color dominante: salen de la miniatura y viajan en el listado."""
+
+    def test_dominant_color_is_most_frequent(self):
+        img = Image.new('RGB', (100, 100), (20, 40, 200))
+        img.paste((250, 0, 0), (0, 0, 30, 100))
+        self.assertEqual(placeholders.dominant_color(img), '#1428c8')
+
+    def test_list_payload(self):
+        media = stored_media('images/placeholder.jpg', jpeg_bytes(size=(400, 300), color='blue'))
+        job = ProcessingJob.objects.create(media=media, kind='derivatives', state='running')
+        self.assertEqual(run_job(job.pk), 'done')
+
+        [item] = self.client.get('/api/media/').json()['results']
+
+        self.assertTrue(item['placeholder'].startswith('data:image/webp;base64,'))
+        with Image.open(BytesIO(base64.b64decode(item['placeholder'].partition(',')[2]))) as img:
+            self.assertEqual(img.size, (16, 12))
+        # Azul, salvo lo que mueva la compresión JPEG
+        rgb = bytes.fromhex(item['dominant_color'].removeprefix('#'))
+        self.assertLess(max(abs(a - b) for a, b in zip(rgb, (0, 0, 255))), 8)
+
+    def test_backfill_publishes_once(self):
+        media = [stored_media(f'images/old{n}.jpg', jpeg_bytes(color='green')) for n in range(3)]
+        before = GalleryState.current().version
+
+        call_command('backfill_placeholders', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(GalleryState.current().version, before + 1)
+        rows = Media.objects.filter(pk__in=[m.pk for m in media])
+        self.assertTrue(all(m.placeholder and m.dominant_color for m in rows))
+        self.assertEqual({m.change_seq for m in rows}, {before + 1})
+
+
+class ReconcileStorageTests(LocalStorageTestCase):
+    """reconcile_storage --delete: solo huérfanos fuera del periodo de gracia."""
+
+    def _store(self, key, age_hours=48):
+        key = default_storage.save(key, ContentFile(b'x' * 10))
+        stamp = time.time() - age_hours * 3600
+        os.utime(default_storage.path(key), (stamp, stamp))
+        return key
+
+    def _reconcile(self, prefix):
+        out = StringIO()
+        call_command('reconcile_storage', '--delete', '--prefix', prefix, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_deletes_only_old_orphans(self):
+        orphan = self._store('images/reconcile/orphan.jpg')
+        recent = self._store('images/reconcile/recent.jpg', age_hours=1)
+
+        output = self._reconcile('images/reconcile/')
+
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recent))
+        self.assertIn('1 huérfanos borrados', output)
+
+    def test_never_deletes_referenced_keys(self):
+        original = self._store('images/referenced/photo.jpg')
+        thumb = self._store('images/referenced/photo_320w.webp')
+        Media.objects.create(file=original, object_key=original, mime_type='image/jpeg',
+                             derivatives={'webp': {'320': thumb}})
+        # Eliminado (borrado lógico): se puede restaurar, así que su fichero sigue referenciado
+        deleted = self._store('images/referenced/deleted.jpg')
+        media = Media.objects.create(file=deleted, object_key=deleted, mime_type='image/jpeg')
+        moderation.moderate(Media.objects.filter(pk=media.pk), 'delete')
+        # Subida directa en curso: el fichero existe antes que su fila
+        session_key = self._store('images/referenced/upload.jpg')
+        UploadSession.objects.create(object_key=session_key, filename='upload.jpg', mime_type='image/jpeg',
+                                     total_bytes=10, part_size=10)
+
+        output = self._reconcile('images/referenced/')
+
+        for key in (original, thumb, deleted, session_key):
+            self.assertTrue(default_storage.exists(key), key)
+        self.assertIn('No hay ficheros huérfanos', output)
+
+
+class BackfillMediaTests(LocalStorageTestCase):
+    """backfill_media guarda por dónde va: si se corta, sigue y publica una sola vez al final."""
+
+    def setUp(self):
+        self.bodies = [jpeg_bytes(color=color) for color in ('red', 'green', 'blue')]
+        self.media = [stored_media(f'images/backfill{n}.jpg', body) for n, body in enumerate(self.bodies)]
+        # Filas antiguas, de antes de calcular estos campos al subir
+        Media.objects.filter(pk__in=[m.pk for m in self.media]).update_internal(sha256=None, bytes=None, width=None)
+        MediaCounter.rebuild()
+        self.checkpoint = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'backfill.json')
+
+    def _backfill(self):
+        out = StringIO()
+        call_command('backfill_media', '--workers', '1', '--batch-size', '1', '--checkpoint', self.checkpoint,
+                     stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_resume_after_interruption(self):
+        before = GalleryState.current().version
+        real_update = Media.objects.bulk_update_internal
+        calls = []
+
+        def failing_update(objs, fields, *args, **kwargs):
+            calls.append([m.pk for m in objs])
+            if len(calls) == 2:
+                raise RuntimeError("corte")
+            return real_update(objs, fields, *args, **kwargs)
+
+        with mock.patch.object(Media.objects, 'bulk_update_internal', failing_update):
+            with self.assertRaises(RuntimeError):
+                self._backfill()
+        # Nada publicado todavía; el primer lote sí está guardado y apuntado
+        self.assertEqual(GalleryState.current().version, before)
+        with open(self.checkpoint) as fh:
+            self.assertEqual(json.load(fh)['changed_ids'], [self.media[0].pk])
+
+        output = self._backfill()
+
+        self.assertIn(f'Continuando desde el id {self.media[0].pk}', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(GalleryState.current().version, before + 1)
+        rows = Media.objects.filter(pk__in=[m.pk for m in self.media]).order_by('id')
+        self.assertEqual([m.sha256 for m in rows], [hashlib.sha256(body).hexdigest() for body in self.bodies])
+        self.assertEqual([(m.width, m.height) for m in rows], [(40, 30)] * 3)
+        self.assertEqual({m.change_seq for m in rows}, {before + 1})
+        # Los bytes entran en los contadores aunque no se publique hasta el final
+        self.assertEqual(MediaCounter.objects.get(media_type='image').bytes, sum(map(len, self.bodies)))
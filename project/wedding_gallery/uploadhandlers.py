@@ -0,0 +1,159 @@
+"""
+Upload handler de un solo paso para ``wedding_gallery``.
+
+Mientras llegan los bytes de la petición:
+
+- los vuelca a un ``SpooledTemporaryFile`` (en memoria hasta
+  ``FILE_UPLOAD_MAX_MEMORY_SIZE``, a disco a partir de ahí),
+- calcula el SHA256 y el tamaño,
+- detecta el tipo MIME real por los *magic bytes*,
+- y, para imágenes, lee las dimensiones y el EXIF (fecha de captura, cámara)
+  de la cabecera.
+
+``Media.save`` recoge esos resultados del fichero subido, así que el fichero no
+se vuelve a leer nunca y la memoria por subida queda acotada sea cual sea su tamaño.
+"""
+import hashlib
+import mimetypes
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+
+from .exif import read_exif
+
+# Bytes de cabecera que guardamos para detectar tipo y dimensiones
+SNIFF_BYTES = 64
+HEADER_MAX_BYTES = 1024 * 1024
+
+FTYP_BRANDS = {
+    b'avif': 'image/avif',
+    b'avis': 'image/avif',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'mif1': 'image/heif',
+    b'qt  ': 'video/quicktime',
+}
+
+
+def sniff_mime_type(head):
+    """Tipo MIME a partir de los primeros bytes del fichero (``None`` si no se reconoce)."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'video/webm'
+    if head[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(head[8:12], 'video/mp4')
+    return None
+
+
+def guess_mime_type(upload):
+    """
+    Tipo detectado por contenido. Si pasó por ``MediaUploadHandler`` y los magic
+    bytes no se reconocen es ``None``: la extensión no se cree (un HTML llamado
+    ``foto.jpg`` no es una imagen). Por la extensión solo sin ese handler.
+    """
+    if isinstance(upload, StreamedUploadedFile):
+        return upload.sniffed_type
+    mime_type, _ = mimetypes.guess_type(upload.name)
+    return mime_type
+
+
+class StreamedUploadedFile(UploadedFile):
+    """Fichero subido por ``MediaUploadHandler`` con los metadatos ya calculados."""
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            suffix='.upload',
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+        )
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.sha256 = None
+        self.sniffed_type = None
+        self.image_size = None
+        self.exif = None
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            pass
+
+
+def streamed_upload(field_file):
+    """El ``StreamedUploadedFile`` detrás de un FieldFile aún no guardado, o ``None``."""
+    if field_file and not field_file._committed:
+        upload = field_file.file
+        if isinstance(upload, StreamedUploadedFile):
+            return upload
+    return None
+
+
+class MediaUploadHandler(FileUploadHandler):
+    chunk_size = 256 * 1024
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StreamedUploadedFile(
+            self.file_name, self.content_type, self.charset, self.content_type_extra
+        )
+        self.hasher = hashlib.sha256()
+        self.header = bytearray()
+        self.header_done = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+        if not self.header_done:
+            self.header.extend(raw_data[:HEADER_MAX_BYTES - len(self.header)])
+            self._inspect_header()
+        # Somos el último handler: nadie más necesita el chunk
+        return None
+
+    def _read_image_size(self):
+        # Image.open es perezoso: solo parsea cabecera, no reserva los píxeles
+        try:
+            with Image.open(BytesIO(self.header)) as img:
+                self.file.exif = read_exif(img)
+                self.file.image_size = self.file.exif['size']
+        except Exception:
+            # Cabecera aún incompleta (p.ej. EXIF grande antes del SOF en JPEG)
+            return False
+        return True
+
+    def _inspect_header(self):
+        if self.file.sniffed_type is None:
+            if len(self.header) < SNIFF_BYTES:
+                return
+            self.file.sniffed_type = sniff_mime_type(bytes(self.header[:SNIFF_BYTES]))
+
+        if not (self.file.sniffed_type or '').startswith('image/'):
+            self.header_done = True
+        elif self._read_image_size() or len(self.header) >= HEADER_MAX_BYTES:
+            self.header_done = True
+
+    def file_complete(self, file_size):
+        if not self.header_done:
+            # Fichero más corto que la cabecera que esperábamos: último intento
+            if self.file.sniffed_type is None:
+                self.file.sniffed_type = sniff_mime_type(bytes(self.header[:SNIFF_BYTES]))
+            if (self.file.sniffed_type or '').startswith('image/'):
+                self._read_image_size()
+        self.header = None
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
@@ -1,14 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MediaViewSet, health_check
+from .views import MediaViewSet, UploadSessionViewSet, health_check, media_events
 
 # Create router and register viewsets
 router = DefaultRouter()
 router.register(r'media', MediaViewSet, basename='media')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 app_name = 'wedding_gallery'
 
 urlpatterns = [
     path('health/', health_check, name='health'),
+    # Antes del router: si no, 'events' se tomaría como id de un Media
+    path('media/events/', media_events, name='media-events'),
     path('', include(router.urls)),
 ]
@@ -1,15 +1,95 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.permissions import IsAdminUser
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncHour
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiTypes
 from drf_spectacular.openapi import AutoSchema
-from .models import Media
-from .serializers import MediaSerializer, MediaListSerializer
-import requests
-from urllib.parse import unquote
+from . import batch_upload, direct_upload, downloads, moderation, serving, zip_export
+from . import changes as change_feed
+from .cache import cached_by_version, conditional_by_version
+from .events import event_stream
+from .exif import wedding_time_zone
+from .models import Media, MediaCounter, UploadSession
+from .pagination import GalleryPagination, KeysetPagination, TimelinePagination
+from .serializers import (
+    MediaSerializer, MediaListSerializer, MediaChangeSerializer, ModerationSerializer,
+    UploadSessionCreateSerializer, UploadFinalizeSerializer,
+)
+from .storage import is_s3
+import os
+import re
+from datetime import timedelta
+from urllib.parse import unquote, urlparse
+
+SHA256_RE = re.compile(r'^[0-9a-fA-F]{64}$')
+MAX_HASHES_PER_CHECK = 200
+TIMELINE_BUCKETS = {
+    'hour': (TruncHour, timedelta(hours=1)),
+    'day': (TruncDay, timedelta(days=1)),
+}
+
+
+@extend_schema(exclude=True)
+async def media_events(request):
+    """
+    Server-Sent Events con los cambios de la galería (ver events.py).
+    Cada evento ``changes`` trae las filas cambiadas y su token como ``id``, así
+    que al reconectar el navegador manda ``Last-Event-ID`` y se pone al día.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Las notificaciones en tiempo real requieren un servidor ASGI (uvicorn)'},
+            status=501
+        )
+
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    if since:
+        try:
+            change_feed.read_token(since)
+        except change_feed.InvalidToken:
+            return JsonResponse({'error': 'Token no válido'}, status=400)
+
+    response = StreamingHttpResponse(event_stream(since), content_type='text/event-stream')
+    # no-transform: que el proxy (Caddy) no comprima ni acumule el stream
+    response['Cache-Control'] = 'no-cache, no-transform'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def serve_media(request, path):
+    """
+    ``/media/<clave>`` sin S3: solo ficheros de archivos visibles (el staff ve
+    también los ocultos). Ver serving.py.
+    """
+    media = serving.find_media(path)
+    staff = request.user.is_authenticated and request.user.is_staff
+    if media is None or (media.status != 1 and not staff):
+        raise Http404('Archivo no encontrado')
+    full_path = serving.media_path(path)
+    if full_path is None or not os.path.isfile(full_path):
+        raise Http404('Archivo no encontrado')
+
+    response = downloads.serve_file(
+        full_path, request,
+        content_type=serving.guess_content_type(path, media),
+        etag=serving.file_etag(full_path),
+        as_attachment=False, accel_key=path,
+    )
+    if media.status == 1:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_SECONDS)
+    else:
+        patch_cache_control(response, private=True, no_store=True)
+    return response
 
 
 # Health check endpoint para monitoreo
@@ -23,7 +103,8 @@ def health_check(request):
     list=extend_schema(
         tags=['media'],
         summary='Listar archivos multimedia',
-        description='Obtiene una lista paginada de archivos multimedia (imágenes y videos) visibles',
+        description='Obtiene una lista paginada por cursor (más recientes primero) de archivos multimedia visibles. '
+                    'Para la página siguiente basta con pedir la URL de "next"',
         parameters=[
             OpenApiParameter(
                 name='type',
@@ -47,17 +128,20 @@ def health_check(request):
     update=extend_schema(
         tags=['media'],
         summary='Actualizar archivo',
-        description='Actualiza los metadatos de un archivo multimedia'
+        description='Actualiza los metadatos de un archivo multimedia. El estado (status) no se cambia aquí '
+                    'sino con /api/media/moderate/. Solo para administradores'
     ),
     partial_update=extend_schema(
         tags=['media'],
         summary='Actualización parcial',
-        description='Actualiza parcialmente los metadatos de un archivo multimedia'
+        description='Actualiza parcialmente los metadatos de un archivo multimedia. El estado (status) no se '
+                    'cambia aquí sino con /api/media/moderate/. Solo para administradores'
     ),
     destroy=extend_schema(
         tags=['media'],
         summary='Eliminar archivo',
-        description='Marca un archivo multimedia como eliminado (soft delete)'
+        description='Marca un archivo multimedia como eliminado (borrado lógico, status=2): desaparece de la '
+                    'galería pero se puede restaurar con /api/media/moderate/. Solo para administradores'
     )
 )
 class MediaViewSet(viewsets.ModelViewSet):
@@ -65,16 +149,24 @@ class MediaViewSet(viewsets.ModelViewSet):
     ViewSet para manejar la subida y visualización de archivos multimedia.
     No requiere autenticación - cualquiera puede subir y ver archivos.
     """
-    queryset = Media.objects.filter(status=1).order_by('-created_at')
+    queryset = Media.objects.filter(status=1).order_by('-created_at', '-id')
     serializer_class = MediaSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         """Use different serializers for list vs detail views"""
         if self.action == 'list':
             return MediaListSerializer
         return MediaSerializer
+
+    def get_permissions(self):
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return [IsAdminUser()]
+        return super().get_permissions()
     
+    @conditional_by_version('list')
+    @cached_by_version('list')
     def list(self, request, *args, **kwargs):
         """List all visible media files"""
         queryset = self.filter_queryset(self.get_queryset())
@@ -92,10 +184,22 @@ class MediaViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    @conditional_by_version('retrieve')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """Upload a new media file"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+
+        # Mismo contenido ya subido (hash calculado por MediaUploadHandler):
+        # devolvemos la fila existente en vez de guardar una segunda copia
+        upload = serializer.validated_data['file']
+        duplicate = Media.find_duplicate(getattr(upload, 'sha256', None))
+        if duplicate is not None:
+            data = MediaSerializer(duplicate, context={'request': request}).data
+            return Response({**data, 'duplicate': True}, status=status.HTTP_200_OK)
         
         try:
             media = serializer.save()
@@ -109,35 +213,406 @@ class MediaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    def destroy(self, request, *args, **kwargs):
+        """Borrado lógico: la fila y el fichero se quedan (ver moderation.py)"""
+        media = self.get_object()
+        moderation.moderate(Media.objects.filter(pk=media.pk), 'delete')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(
+        tags=['media'],
+        summary='Moderar varios archivos',
+        description='Oculta, muestra, elimina (borrado lógico) o restaura archivos en bloque. Cada acción es '
+                    'una sola actualización en la base de datos y todo va en una transacción. Devuelve cuántos '
+                    f'archivos cambiaron con cada acción. Máximo {settings.MEDIA_MODERATE_MAX_IDS} ids por petición. '
+                    'Solo para administradores',
+        request=ModerationSerializer,
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'affected': {'type': 'object', 'description': 'Acción -> archivos que cambiaron de estado'}
+                }
+            }
+        }
+    )
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser], permission_classes=[IsAdminUser])
+    def moderate(self, request):
+        serializer = ModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        affected = moderation.apply_actions(serializer.validated_data)
+        return Response({'affected': affected})
+
+    @extend_schema(
+        tags=['media'],
+        summary='Subir varios archivos',
+        description='Sube hasta MEDIA_BATCH_MAX_FILES archivos en una sola petición (campo "files" repetido). '
+                    'Se guardan en paralelo y se devuelve un resultado por archivo: created, duplicate o error',
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'files': {'type': 'array', 'items': {'type': 'string', 'format': 'binary'}}
+                }
+            }
+        },
+        responses={
+            201: {'type': 'object', 'description': 'Todos los archivos guardados (o ya existentes)'},
+            207: {'type': 'object', 'description': 'Algunos archivos fallaron; ver "results"'},
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Subida por lotes: una petición para muchas fotos (ver batch_upload.py)
+        """
+        uploads = request.FILES.getlist('files')
+        if not uploads or len(uploads) > settings.MEDIA_BATCH_MAX_FILES:
+            return Response(
+                {'error': f'Se requiere "files": entre 1 y {settings.MEDIA_BATCH_MAX_FILES} archivos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = batch_upload.save_batch(uploads)
+        context = {'request': request}
+        for result in results:
+            if result['media'] is not None:
+                result['media'] = MediaSerializer(result['media'], context=context).data
+
+        counts = {key: sum(r['status'] == key for r in results) for key in ('created', 'duplicate', 'error')}
+        return Response(
+            {**counts, 'results': results},
+            status=status.HTTP_207_MULTI_STATUS if counts['error'] else status.HTTP_201_CREATED
+        )
+
+    @extend_schema(
+        tags=['media'],
+        summary='Comprobar hashes antes de subir',
+        description='Recibe hashes SHA256 (hex) calculados en el cliente y devuelve los que ya existen '
+                    'entre los archivos visibles, para no volver a subir esos archivos',
+        request={
+            'application/json': {
+                'type': 'object',
+                'properties': {
+                    'sha256': {'type': 'array', 'items': {'type': 'string'}, 'description': 'Hashes SHA256 en hex'}
+                }
+            }
+        },
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'existing': {'type': 'object', 'description': 'Hash -> id del archivo visible ya subido'}
+                }
+            }
+        }
+    )
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def check_hashes(self, request):
+        """
+        Pre-subida: ¿el servidor ya tiene estos archivos?
+        """
+        hashes = request.data.get('sha256')
+        if isinstance(hashes, str):
+            hashes = [hashes]
+        if not isinstance(hashes, list) or len(hashes) > MAX_HASHES_PER_CHECK:
+            return Response(
+                {'error': f'Se requiere "sha256": lista de hasta {MAX_HASHES_PER_CHECK} hashes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        hashes = {h.lower() for h in hashes if isinstance(h, str) and SHA256_RE.match(h)}
+
+        existing = {}
+        for media in Media.with_hashes(hashes).order_by('-id').only('id', 'sha256', 'original_sha256'):
+            for sha256 in set(media.content_hashes()) & hashes:
+                existing[sha256] = media.pk  # nos quedamos con el más antiguo
+        return Response({'existing': existing})
+
     @extend_schema(
         tags=['gallery'],
-        summary='Galería completa',
-        description='Obtiene la galería completa separada por tipos (imágenes y videos) con contador total',
+        summary='Galería por páginas',
+        description='Galería separada por tipos (imágenes y videos), paginada por cursor del más reciente '
+                    'al más antiguo. Para la página siguiente basta con pedir la URL de "next". '
+                    'total_count solo se incluye en la primera página',
+        parameters=[
+            OpenApiParameter(
+                name='type',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Solo un tipo de media: "image" o "video"',
+                enum=['image', 'video']
+            ),
+            OpenApiParameter(
+                name='cursor',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Cursor de la página (el de "next" de la respuesta anterior)'
+            ),
+            OpenApiParameter(
+                name='page_size',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Elementos por página (máx. {GalleryPagination.max_page_size})'
+            ),
+            OpenApiParameter(
+                name='collapse_similar',
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description='Con "1", de cada grupo de fotos casi iguales solo se muestra la original'
+            ),
+        ],
         responses={
             200: {
                 'type': 'object',
                 'properties': {
-                    'images': {'type': 'array', 'description': 'Lista de imágenes'},
-                    'videos': {'type': 'array', 'description': 'Lista de videos'},
-                    'total_count': {'type': 'integer', 'description': 'Número total de archivos'}
+                    'images': {'type': 'array', 'description': 'Imágenes de esta página'},
+                    'videos': {'type': 'array', 'description': 'Videos de esta página'},
+                    'next': {'type': 'string', 'nullable': True, 'description': 'URL de la página siguiente'},
+                    'total_count': {'type': 'integer', 'description': 'Número total de archivos (primera página)'},
+                    'sync_token': {'type': 'string', 'description': 'Token para pedir los cambios posteriores (primera página)'}
                 }
             }
         }
     )
     @action(detail=False, methods=['get'])
+    @conditional_by_version('gallery')
+    @cached_by_version('gallery')
     def gallery(self, request):
         """
-        Endpoint especial para obtener la galería completa optimizada
+        Galería paginada por cursor: sin OFFSET ni COUNT(*) por página
         """
-        images = Media.objects.filter(status=1, media_type='image').order_by('-created_at')
-        videos = Media.objects.filter(status=1, media_type='video').order_by('-created_at')
-        
+        queryset = Media.objects.filter(status=1)
+        media_type = request.query_params.get('type')
+        if media_type in ['image', 'video']:
+            queryset = queryset.filter(media_type=media_type)
+        if request.query_params.get('collapse_similar') in ('1', 'true'):
+            # Las copias se ocultan mientras su original siga visible
+            queryset = queryset.exclude(similar_to__status=1)
+
+        paginator = GalleryPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        items = MediaListSerializer(page, many=True, context={'request': request}).data
+
+        data = {
+            'images': [item for item in items if item['media_type'] == 'image'],
+            'videos': [item for item in items if item['media_type'] == 'video'],
+            'next': paginator.get_next_link(),
+        }
+        if not request.query_params.get(paginator.cursor_query_param):
+            # Punto de partida para /api/media/changes/
+            data['sync_token'] = change_feed.current_token(request)
+            totals = MediaCounter.totals()
+            types = [media_type] if media_type in ['image', 'video'] else totals.keys()
+            data['total_count'] = sum(totals.get(t, (0, 0))[0] for t in types)
+        return Response(data)
+
+    @extend_schema(
+        tags=['gallery'],
+        summary='Cambios desde un token',
+        description='Archivos subidos, ocultados o vueltos a mostrar desde el token indicado (el "sync_token" '
+                    'de la galería o el "token" de la respuesta anterior). Los ocultos llegan con status=0 y los '
+                    'eliminados con status=2. '
+                    'Sin token devuelve solo el token actual',
+        parameters=[
+            OpenApiParameter(
+                name='since',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Token de sincronización'
+            ),
+        ],
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'changes': {'type': 'array', 'description': 'Archivos cambiados, del más antiguo al más reciente'},
+                    'token': {'type': 'string', 'description': 'Token para la siguiente consulta'},
+                    'has_more': {'type': 'boolean', 'description': 'Quedan cambios: pedir de nuevo con el token'}
+                }
+            }
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditional_by_version('changes')
+    def changes(self, request):
+        """
+        Feed incremental para pestañas abiertas y el proyector (ver changes.py)
+        """
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'changes': [], 'token': change_feed.current_token(request), 'has_more': False})
+
+        try:
+            rows, token, has_more = change_feed.changes_since(since, request)
+        except change_feed.InvalidToken:
+            return Response({'error': 'Token no válido'}, status=status.HTTP_400_BAD_REQUEST)
+
         return Response({
-            'images': MediaListSerializer(images, many=True, context={'request': request}).data,
-            'videos': MediaListSerializer(videos, many=True, context={'request': request}).data,
-            'total_count': images.count() + videos.count()
+            'changes': MediaChangeSerializer(rows, many=True, context={'request': request}).data,
+            'token': token,
+            'has_more': has_more,
         })
-    
+
+    @extend_schema(
+        tags=['gallery'],
+        summary='Línea de tiempo',
+        description='Sin "start": número de archivos por hora o por día según la fecha de captura (EXIF o '
+                    'fecha del vídeo), en la zona horaria de la boda, para saltar a un momento del álbum. '
+                    'Con "start" (el de uno de los tramos): los archivos de ese tramo en orden de captura, '
+                    'paginados por cursor. Los archivos sin fecha de captura solo se cuentan en "undated"',
+        parameters=[
+            OpenApiParameter(
+                name='bucket',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Tamaño de los tramos (por defecto "hour")',
+                enum=[*TIMELINE_BUCKETS]
+            ),
+            OpenApiParameter(
+                name='start',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Inicio de un tramo: devuelve sus archivos en vez de los totales'
+            ),
+            OpenApiParameter(
+                name='type',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Solo un tipo de media: "image" o "video"',
+                enum=['image', 'video']
+            ),
+            OpenApiParameter(
+                name='cursor',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Cursor de la página (el de "next" de la respuesta anterior, solo con "start")'
+            ),
+        ],
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'buckets': {'type': 'array', 'description': 'Tramos con archivos: {"start", "count", "images", "videos"}'},
+                    'undated': {'type': 'integer', 'description': 'Archivos sin fecha de captura'},
+                    'time_zone': {'type': 'string', 'description': 'Zona horaria de los tramos'},
+                    'results': {'type': 'array', 'description': 'Archivos del tramo (con "start")'},
+                    'next': {'type': 'string', 'nullable': True, 'description': 'URL de la página siguiente (con "start")'}
+                }
+            }
+        }
+    )
+    @action(detail=False, methods=['get'])
+    @conditional_by_version('timeline')
+    @cached_by_version('timeline')
+    def timeline(self, request):
+        """
+        Totales por tramo agrupados en SQL (una sola consulta) y, dentro de un
+        tramo, páginas por cursor sobre idx_taken_at
+        """
+        bucket = request.query_params.get('bucket', 'hour')
+        if bucket not in TIMELINE_BUCKETS:
+            return Response(
+                {'error': f'"bucket" debe ser uno de: {", ".join(TIMELINE_BUCKETS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        trunc, step = TIMELINE_BUCKETS[bucket]
+        tz = wedding_time_zone()
+
+        queryset = Media.objects.filter(status=1, taken_at__isnull=False)
+        media_type = request.query_params.get('type')
+        if media_type in ['image', 'video']:
+            queryset = queryset.filter(media_type=media_type)
+
+        start = request.query_params.get('start')
+        if start:
+            try:
+                start = parse_datetime(start.replace(' ', '+'))
+            except ValueError:
+                start = None
+            if start is None:
+                return Response({'error': '"start" no es una fecha válida'}, status=status.HTTP_400_BAD_REQUEST)
+            # En la zona de la boda, para que "+1 día" respete los cambios de hora
+            start = start.astimezone(tz) if timezone.is_aware(start) else timezone.make_aware(start, tz)
+            paginator = TimelinePagination()
+            page = paginator.paginate_queryset(
+                queryset.filter(taken_at__gte=start, taken_at__lt=start + step), request, view=self
+            )
+            return Response({
+                'results': MediaListSerializer(page, many=True, context={'request': request}).data,
+                'next': paginator.get_next_link(),
+            })
+
+        buckets = list(
+            queryset.annotate(start=trunc('taken_at', tzinfo=tz))
+            .values('start')
+            .annotate(
+                count=Count('id'),
+                images=Count('id', filter=Q(media_type='image')),
+                videos=Count('id', filter=Q(media_type='video')),
+            )
+            .order_by('start')
+        )
+        # Sin COUNT(*) extra: lo que no está en ningún tramo no tiene fecha
+        totals = MediaCounter.totals()
+        types = [media_type] if media_type in ['image', 'video'] else totals.keys()
+        visible = sum(totals.get(t, (0, 0))[0] for t in types)
+        return Response({
+            'buckets': buckets,
+            'undated': max(visible - sum(row['count'] for row in buckets), 0),
+            'time_zone': str(tz),
+        })
+
+    @extend_schema(
+        tags=['gallery'],
+        summary='Grupos de fotos casi iguales',
+        description='Fotos visibles agrupadas por hash perceptual (la misma foto recomprimida, redimensionada '
+                    'o reenviada), de los grupos más grandes a los más pequeños. La primera de cada grupo es '
+                    'la original. Solo para administradores',
+        parameters=[
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Número de grupos (máx. {settings.MEDIA_SIMILAR_MAX_CLUSTERS})'
+            ),
+        ],
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'clusters': {'type': 'array', 'description': 'Grupos: {"id" de la original, "count", "items"}'},
+                    'total_clusters': {'type': 'integer', 'description': 'Número total de grupos'}
+                }
+            }
+        }
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def similar(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            limit = 50
+        limit = max(1, min(limit, settings.MEDIA_SIMILAR_MAX_CLUSTERS))
+
+        members = {}
+        for root_id, media_id in (
+            Media.objects.filter(status=1, similar_to__status=1)
+            .values_list('similar_to_id', 'id').order_by('similar_to_id', 'id')
+        ):
+            members.setdefault(root_id, []).append(media_id)
+        roots = sorted(members, key=lambda root_id: (-len(members[root_id]), root_id))[:limit]
+
+        found = Media.objects.in_bulk([pk for root_id in roots for pk in [root_id, *members[root_id]]])
+        clusters = []
+        for root_id in roots:
+            items = [found[pk] for pk in [root_id, *members[root_id]] if pk in found]
+            clusters.append({
+                'id': root_id,
+                'count': len(items),
+                'items': MediaListSerializer(items, many=True, context={'request': request}).data,
+            })
+        return Response({'clusters': clusters, 'total_clusters': len(members)})
+
     @extend_schema(
         tags=['stats'],
         summary='Estadísticas de la galería',
@@ -148,86 +623,240 @@ class MediaViewSet(viewsets.ModelViewSet):
                 'properties': {
                     'total_files': {'type': 'integer', 'description': 'Número total de archivos'},
                     'total_images': {'type': 'integer', 'description': 'Número total de imágenes'},
-                    'total_videos': {'type': 'integer', 'description': 'Número total de videos'}
+                    'total_videos': {'type': 'integer', 'description': 'Número total de videos'},
+                    'total_bytes': {'type': 'integer', 'description': 'Tamaño total en bytes'}
                 }
             }
         }
     )
     @action(detail=False, methods=['get'])
+    @conditional_by_version('stats')
+    @cached_by_version('stats')
     def stats(self, request):
         """
         Obtener estadísticas básicas de la galería
         """
-        total_media = Media.objects.filter(status=1).count()
-        total_images = Media.objects.filter(status=1, media_type='image').count()
-        total_videos = Media.objects.filter(status=1, media_type='video').count()
-        
+        totals = MediaCounter.totals()
+        total_images, images_bytes = totals.get('image', (0, 0))
+        total_videos, videos_bytes = totals.get('video', (0, 0))
+
         return Response({
-            'total_files': total_media,
+            'total_files': total_images + total_videos,
             'total_images': total_images,
-            'total_videos': total_videos
+            'total_videos': total_videos,
+            'total_bytes': images_bytes + videos_bytes,
         })
     
     @extend_schema(
         tags=['media'],
-        summary='Descargar archivo (proxy)',
-        description='Descarga un archivo desde S3 a través del servidor, evitando problemas de CORS en móviles',
+        summary='Descargar archivo',
+        description='Descarga el archivo como adjunto. Con S3 redirige a una URL prefirmada de corta '
+                    'duración (o hace de proxy si MEDIA_DOWNLOAD_REDIRECT=False); admite Range (206) '
+                    'para reanudar descargas y hacer seek en vídeos',
+        responses={
+            (200, 'application/octet-stream'): OpenApiTypes.BINARY,
+            (206, 'application/octet-stream'): OpenApiTypes.BINARY,
+            302: None,
+        },
+    )
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        return downloads.serve_download(self.get_object(), request)
+
+    @extend_schema(
+        tags=['media'],
+        summary='Descargar varios archivos en un ZIP',
+        description='Genera un ZIP (sin compresión) con los archivos indicados mientras se descarga, '
+                    f'sin guardarlo en el servidor. Máximo {settings.MEDIA_ZIP_MAX_FILES} archivos',
         parameters=[
             OpenApiParameter(
-                name='url',
+                name='ids',
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
-                description='URL completa del archivo a descargar',
+                description='IDs separados por comas (p.ej. 12,15,20)',
                 required=True
             ),
-        ]
+        ],
+        responses={(200, 'application/zip'): OpenApiTypes.BINARY},
     )
     @action(detail=False, methods=['get'])
-    def download_proxy(self, request):
-        """
-        Endpoint proxy para descargar archivos desde S3.
-        Soluciona problemas de CORS en navegadores móviles.
-        """
-        file_url = request.query_params.get('url', None)
-        
-        if not file_url:
+    def zip(self, request):
+        raw = [part.strip() for part in request.query_params.get('ids', '').split(',') if part.strip()]
+        if not raw or not all(part.isdigit() for part in raw):
             return Response(
-                {'error': 'Se requiere el parámetro "url"'},
+                {'error': 'Se requiere "ids": una lista de IDs separados por comas'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        try:
-            # Fetch el archivo desde S3
-            response = requests.get(file_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Obtener el tipo de contenido
-            content_type = response.headers.get('Content-Type', 'application/octet-stream')
-            
-            # Extraer nombre de archivo de la URL
-            filename = file_url.split('/')[-1]
-            filename = unquote(filename)  # Decodificar URL encoding
-            
-            # Crear respuesta streaming
-            django_response = StreamingHttpResponse(
-                response.iter_content(chunk_size=8192),
-                content_type=content_type
-            )
-            django_response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            
-            # Copiar headers útiles
-            if 'Content-Length' in response.headers:
-                django_response['Content-Length'] = response.headers['Content-Length']
-            
-            return django_response
-            
-        except requests.RequestException as e:
+        ids = list(dict.fromkeys(int(part) for part in raw))
+        if len(ids) > settings.MEDIA_ZIP_MAX_FILES:
             return Response(
-                {'error': f'Error al descargar el archivo: {str(e)}'},
-                status=status.HTTP_502_BAD_GATEWAY
+                {'error': f'Máximo {settings.MEDIA_ZIP_MAX_FILES} archivos por ZIP'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        except Exception as e:
+
+        # En el orden en que se seleccionaron
+        found = self.get_queryset().in_bulk(ids)
+        media_list = [found[pk] for pk in ids if pk in found]
+        if not media_list:
+            return Response({'error': 'Archivos no encontrados'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(
+            downloads.streaming_body(request, zip_export.stream_zip(media_list)), content_type='application/zip'
+        )
+        response['Content-Disposition'] = f'attachment; filename="boda_{len(media_list)}_archivos.zip"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    @extend_schema(
+        tags=['media'],
+        summary='Descargar archivo (proxy, obsoleto)',
+        description='Compatibilidad con clientes antiguos: redirige a /api/media/{id}/download/. '
+                    'Solo acepta archivos de la galería, no cualquier URL',
+        parameters=[
+            OpenApiParameter(
+                name='id',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='ID del archivo',
+                required=False
+            ),
+            OpenApiParameter(
+                name='url',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='URL del archivo (tal como la devuelve file_url)',
+                required=False
+            ),
+        ],
+        deprecated=True,
+    )
+    @action(detail=False, methods=['get'])
+    def download_proxy(self, request):
+        media_id = request.query_params.get('id')
+        file_url = request.query_params.get('url')
+        queryset = self.get_queryset()
+
+        if media_id and media_id.isdigit():
+            media = queryset.filter(pk=media_id).first()
+        elif file_url:
+            # Solo se resuelven claves de la galería: el servidor no descarga URLs arbitrarias
+            key = unquote(urlparse(file_url).path).lstrip('/')
+            media = queryset.filter(object_key__in=[key, key.partition('/')[2]]).first()
+        else:
             return Response(
-                {'error': f'Error interno: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Se requiere el parámetro "id"'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+
+        if media is None:
+            return Response({'error': 'Archivo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponseRedirect(reverse('wedding_gallery:media-download', args=[media.pk]))
+
+
+@extend_schema_view(
+    create=extend_schema(
+        tags=['uploads'],
+        summary='Iniciar subida directa',
+        description='Crea una sesión de subida y devuelve las URLs prefirmadas (S3) o firmadas (local) '
+                    'para subir el archivo por partes sin pasar por Django',
+        request=UploadSessionCreateSerializer,
+    ),
+    destroy=extend_schema(
+        tags=['uploads'],
+        summary='Cancelar subida directa',
+        description='Aborta la subida multipart y descarta las partes recibidas'
+    ),
+)
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Subidas directas al almacenamiento (ver direct_upload.py).
+    """
+    queryset = UploadSession.objects.filter(state='open')
+    parser_classes = (JSONParser,)
+
+    def create(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # Si ya tenemos ese contenido no hace falta subir nada
+        duplicate = Media.find_duplicate(data['sha256'])
+        if duplicate is not None:
+            media_data = MediaSerializer(duplicate, context={'request': request}).data
+            return Response({'duplicate': True, 'media': media_data}, status=status.HTTP_200_OK)
+
+        session = direct_upload.create_session(
+            data['filename'], data['bytes'], data['content_type'], data['sha256']
+        )
+        return Response({
+            'id': session.pk,
+            'object_key': session.object_key,
+            'part_size': session.part_size,
+            'headers': {'Content-Type': session.mime_type},
+            'parts': direct_upload.describe_parts(session, request),
+        }, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        tags=['uploads'],
+        summary='Estado de una subida directa',
+        description='Partes que ya están en el almacenamiento, bytes confirmados (offset) y URLs '
+                    'nuevas para las partes que faltan. Sirve para reanudar una subida cortada',
+    )
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        try:
+            data = direct_upload.describe_status(session, request)
+        except direct_upload.DirectUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    @extend_schema(
+        tags=['uploads'],
+        summary='Subir una parte (modo local)',
+        description='Recibe el cuerpo de la petición como la parte indicada. Solo en modo sin S3; '
+                    'la URL la genera el servidor al iniciar la subida',
+        request={'application/octet-stream': {'type': 'string', 'format': 'binary'}},
+    )
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<part_number>\d+)', url_name='part')
+    def part(self, request, pk=None, part_number=None):
+        session = self.get_object()
+        part_number = int(part_number)
+        if is_s3() or not direct_upload.verify_part_token(session, part_number, request.query_params.get('token')):
+            return Response({'error': 'URL de subida no válida o caducada'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            etag = direct_upload.write_local_part(session, part_number, request.stream)
+        except direct_upload.DirectUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response({'part_number': part_number, 'etag': etag})
+        response['ETag'] = etag
+        return response
+
+    @extend_schema(
+        tags=['uploads'],
+        summary='Finalizar subida directa',
+        description='Completa la subida (multipart en S3), comprueba tamaño, hash y tipo real (magic bytes) y crea el archivo multimedia. '
+                    'El procesado (miniaturas, metadatos) queda encolado',
+        request=UploadFinalizeSerializer,
+        responses={201: MediaSerializer},
+    )
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        serializer = UploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            media = direct_upload.finalize_session(session, serializer.validated_data.get('parts'))
+        except direct_upload.DirectUploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            MediaSerializer(media, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        direct_upload.abort_session(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)